@@ -9,19 +9,28 @@
 """
 This is the base of the autograder.
 """
+import asyncio
 import datetime
 import importlib
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Callable, List, Union
 
 from .AutograderErrors import AutograderSafeEnvError
+from .AutograderIncremental import IncrementalRegrade
 from .AutograderLeaderboard import Leaderboard
+from .AutograderMetadata import SubmissionMetadata
+from .AutograderOutput import OutputBuffer, OutputBudget
+from .AutograderProfile import Profiler
 from .AutograderRateLimit import RateLimit
+from .AutograderResultCache import ResultCache
+from .AutograderResultsWriter import ResultsWriter
+from .AutograderScheduler import Scheduler, order_by_history
+from .AutograderSubmission import SubmissionManifest
 from .AutograderSetup import global_setups
 from .AutograderTeardown import global_teardowns
 from .AutograderTest import AutograderTest, global_tests, Max
-from .Utils import root_dir, submission_dir, results_path, get_welcome_message, is_local, submission_metadata_dir, module_from_file
+from .Utils import root_dir, submission_dir, results_path, get_welcome_message, is_local, submission_metadata_dir, module_from_file, run_coroutine
 
 printed_welcome_message = False
 
@@ -32,8 +41,23 @@ class Autograder:
         rate_limit: RateLimit=None, 
         reverse_tests: bool=False, 
         export_tests_after_test: bool=True, 
-        modify_results=lambda results: results,
+        export_min_interval: float=0,
+        export_every_n_tests: int=1,
+        modify_results=None,
         print_welcome_message: bool=True,
+        parallel: int=None,
+        async_concurrency: int=None,
+        fork_tests: bool=False,
+        max_output_bytes: int=None,
+        max_test_output_bytes: int=None,
+        result_cache: ResultCache=None,
+        profile: bool=False,
+        profile_file: str=None,
+        time_budget: float=None,
+        time_reserve: float=10,
+        test_order: Union[str, Callable[["Autograder", List[AutograderTest]], List[AutograderTest]]]=None,
+        reuse_unchanged_tests: bool=True,
+        isolation_workers: int=None,
     ):
         if print_welcome_message:
             global printed_welcome_message
@@ -52,6 +76,30 @@ class Autograder:
         self.leaderboard = Leaderboard()
         self.reverse_tests = reverse_tests
         self.export_tests_after_test = export_tests_after_test
+        # When exporting after tests, the results are written at most once every
+        # export_min_interval seconds and once every export_every_n_tests tests.
+        self.results_writer = ResultsWriter(min_interval=export_min_interval, every_n_tests=export_every_n_tests)
+        # parallel is the number of worker threads used to run tests which are
+        # not marked as serial. None (or anything below 2) runs every test in order.
+        # Sync tests with a timeout still run on the main thread (see can_run_in_parallel). With a
+        # time_budget every test gets a timeout, so only isolated (or forked) tests use the threads then.
+        self.parallel = parallel
+        # Consecutive tests with async test functions run together on an event loop.
+        # async_concurrency caps how many of them run at once (None means no cap).
+        self.async_concurrency = async_concurrency
+        # If fork_tests is True, every test runs in a forked copy of the autograder so a crash in
+        # one test cannot affect the others. Up to parallel tests run at the same time.
+        self.fork_tests = fork_tests
+        # Tests and subtests with isolate=True run in isolation_workers worker processes (by
+        # default one, or parallel if it is set) which are forked once the setups ran.
+        self.isolation_workers = isolation_workers
+        self.isolation = None
+        # This is set once the warm setups ran in a fork server so they are not run again.
+        self.warmed = False
+        # max_test_output_bytes caps the output kept for each test (unless the test sets its
+        # own cap) and max_output_bytes caps the output kept for all tests combined.
+        self.max_test_output_bytes = max_test_output_bytes
+        self.output_budget = OutputBudget(max_output_bytes) if max_output_bytes is not None else None
         # rate_limit takes in a RateLimit class.
         # reset_time is when you want to reset the submission time. You
         # can leave it out to ignore. Put the time stirng in this format:
@@ -60,20 +108,57 @@ class Autograder:
             rate_limit = RateLimit()
         self.rate_limit: RateLimit = rate_limit
         self.start_time = datetime.datetime.now()
+        # If profile is True (or a profile_file is given), the resources used by every setup, test,
+        # subtest and teardown are saved in their extra_data and written to the profile_file.
+        self.profiler = Profiler(profile_file) if profile or profile_file is not None else None
+        # If time_budget is set, the setups, tests and teardowns are fit into that many seconds
+        # (since the autograder started) while keeping time_reserve seconds for the teardowns
+        # and results. Tests get shorter timeouts as time runs out and are skipped once they do not fit.
+        self.scheduler = Scheduler(time_budget, reserve=time_reserve) if time_budget is not None else None
+        # test_order changes the order the tests run in (but not the order of the results). It is
+        # either "history" (see order_by_history) or a function which takes in the autograder and
+        # the tests and returns them in the order to run them.
+        self.test_order = test_order
+        # Tests with depends_on reuse their previous result if their files did not change. Setting
+        # reuse_unchanged_tests to False turns this off for every test.
+        self.incremental = IncrementalRegrade(enabled=reuse_unchanged_tests)
+        # The manifest of the submission files is built the first time it is used (see submission).
+        self._submission = None
+        # result_cache takes in a ResultCache which reuses the results of identical submissions.
+        self.result_cache = result_cache
+        if modify_results is None:
+            modify_results = self.default_modify_results
         self.modify_results = modify_results
 
+        self.load_metadata()
+
+    def load_metadata(self):
+        # The metadata is loaded lazily since the results of previous submissions can be large.
         if not is_local():
-            with open(submission_metadata_dir(), "r") as jsonMetadata:
-                self.metadata = json.load(jsonMetadata)
+            self.metadata = SubmissionMetadata.load(submission_metadata_dir())
             self.extra_data["id"] = self.metadata["id"]
         else:
             if os.path.isfile(submission_metadata_dir()):
-                with open(submission_metadata_dir(), "r") as jsonMetadata:
-                    self.metadata = json.load(jsonMetadata)
+                self.metadata = SubmissionMetadata.load(submission_metadata_dir())
                 self.extra_data["id"] = self.metadata["id"]
             else:
                 self.extra_data["id"] = "LOCAL"
                 self.metadata = None
+        return self
+
+    @property
+    def submission(self) -> SubmissionManifest:
+        """
+        The files of the submission, indexed once per run. Set it to a SubmissionManifest with
+        limits (or to None to index the submission again).
+        """
+        if self._submission is None:
+            self._submission = SubmissionManifest()
+        return self._submission
+
+    @submission.setter
+    def submission(self, manifest: SubmissionManifest):
+        self._submission = manifest
 
     def run(self, import_globals: bool=True):
         def load_and_execute_autograder(ag: "Autograder"):
@@ -96,11 +181,13 @@ class Autograder:
         return self.safe_env(wrapper, handler)
 
     def dump_results(self, data: dict) -> None:
-        jsondata = json.dumps(data, ensure_ascii=False)
-        with open(self.results_file, "wb") as f:
-            f.write(jsondata.encode("ascii", errors="backslashreplace"))
+        self.results_writer.dump(self.results_file, data)
         return self
 
+    @staticmethod
+    def default_modify_results(results: dict) -> dict:
+        return results
+
     def import_tests(self, *, 
         tests_dir: Union[str, List[str]]=None, 
         test_files: Union[str, List[str]]=None, 
@@ -142,6 +229,9 @@ class Autograder:
 
     def add_test(self, test, index=None):
         if isinstance(test, AutograderTest):
+            max_bytes = test.max_output_bytes if test.max_output_bytes is not None else self.max_test_output_bytes
+            if max_bytes is not None or self.output_budget is not None:
+                test.output = OutputBuffer.wrap(test.output).set_limits(max_bytes=max_bytes, budget=self.output_budget)
             if index is None:
                 self.tests.append(test)
             else:
@@ -182,12 +272,11 @@ class Autograder:
         return score
 
     def print(self, *args, sep=' ', end='\n', file=None, flush=True, also_stdout=False):
-        if self.output is None:
-            self.output = ""
+        self.output = OutputBuffer.wrap(self.output)
         msg = sep.join(map(str, args)) + end
         if also_stdout:
             print(msg)
-        self.output += msg
+        self.output.write(msg)
         return self
 
     def create_test(self, *args, **kwargs):
@@ -211,20 +300,32 @@ class Autograder:
         try:
             return f()
         except Exception as exc:
-            print("An exception occured in the safe environment!")
-            import traceback
-            traceback.print_exc()
-            print(exc)
-            if handler is not None:
-                try:
-                    h = handler(exc)
-                    if h is not None:
-                        return AutograderSafeEnvError(h)
-                except Exception as exc:
-                    print("An exception occurred while executing the exception handler!")
-                    traceback.print_exc()
-            self.ag_fail("An unexpected exception ocurred while trying to execute the autograder. Please try again or contact a TA if this persists.")
-            return AutograderSafeEnvError(exc)
+            return self.safe_env_error(exc, handler)
+
+    async def safe_env_async(self, f, handler=None):
+        """
+        The same as safe_env but f is an async function.
+        """
+        try:
+            return await f()
+        except Exception as exc:
+            return self.safe_env_error(exc, handler)
+
+    def safe_env_error(self, exc: Exception, handler=None):
+        print("An exception occured in the safe environment!")
+        import traceback
+        traceback.print_exc()
+        print(exc)
+        if handler is not None:
+            try:
+                h = handler(exc)
+                if h is not None:
+                    return AutograderSafeEnvError(h)
+            except Exception as exc:
+                print("An exception occurred while executing the exception handler!")
+                traceback.print_exc()
+        self.ag_fail("An unexpected exception ocurred while trying to execute the autograder. Please try again or contact a TA if this persists.")
+        return AutograderSafeEnvError(exc)
 
     def run_tests(self):
         global printed_welcome_message
@@ -237,23 +338,35 @@ class Autograder:
                 if "sub_counts" in self.extra_data:
                     self.print("[Rate Limit]: Since the autograder failed to run, you will not use up a token!")
                     self.rate_limit.rate_limit_unset_submission(self)
+        for test in self.incremental.apply(self):
+            self.test_finished(test)
+        if self.scheduler is not None:
+            self.scheduler.start(self)
         for setup in self.setups:
             if not setup.when_to_run.okay_to_run(local):
                 continue
-            res = setup.run(self)
+            if setup.warm and self.warmed:
+                continue
+            res = setup.run(self) if self.scheduler is None else self.scheduler.run_setup(setup)
             if not res:
                 print(f"[Error]: ({setup.name}) Returned non-true value `{res}` so assuming it failed!")
                 self.print("[Error]: An error occurred in the setup of the Autograder!")
                 handle_failed()
                 return False
-        for test in self.tests:
-            test.run(self)
-            if self.export_tests_after_test:
-                self.generate_results(print_main_score_warning_error=False)
+        if not self.fork_tests:
+            from .AutograderIsolation import IsolationPool
+            # The workers are forked before the tests so it does not slow them down.
+            if IsolationPool.uses_isolation(self.tests):
+                self.get_isolation_pool()
+        try:
+            for batch in self.get_test_batches():
+                self.run_test_batch(batch)
+        finally:
+            self.stop_isolation_pool()
         for teardown in self.teardowns:
             if not teardown.when_to_run.okay_to_run(local):
                 continue
-            res = teardown.run(self)
+            res = teardown.run(self) if self.scheduler is None else self.scheduler.run_teardown(teardown)
             if not res:
                 print(f"[Error]: ({teardown.name}) Returned non-true value `{res}` so assuming it failed!")
                 self.print("[Error]: An error occurred in the teardown of the Autograder!")
@@ -261,49 +374,216 @@ class Autograder:
                 return False
         return True
 
+    def run_warm_setups(self, import_globals: bool=True) -> bool:
+        """
+        Runs the warm setups (including the global ones if import_globals is True) once so they
+        are skipped when the autograder runs. This is used by the fork server.
+        """
+        local = is_local()
+        setups = list(self.setups)
+        if import_globals:
+            setups += [s for s in global_setups if s not in setups]
+        for setup in setups:
+            if not setup.warm or not setup.when_to_run.okay_to_run(local):
+                continue
+            res = setup.run(self)
+            if not res:
+                print(f"[Error]: ({setup.name}) Returned non-true value `{res}` so assuming the warm setup failed!")
+                return False
+        self.warmed = True
+        return True
+
+    def get_isolation_pool(self) -> "IsolationPool":
+        """
+        Returns the pool of workers of the isolated tests, starting it if needed.
+        """
+        from .AutograderIsolation import IsolationPool
+        # A fork of the autograder (eg. a forked test) cannot use the workers of its parent.
+        if self.isolation is None or self.isolation.owner != os.getpid():
+            workers = self.isolation_workers if self.isolation_workers is not None else self.parallel
+            self.isolation = IsolationPool(self, workers=workers if workers is not None else 1).start()
+        return self.isolation
+
+    def stop_isolation_pool(self):
+        if self.isolation is not None and self.isolation.owner == os.getpid():
+            self.isolation.stop()
+        self.isolation = None
+        return self
+
+    def get_test_batches(self) -> List[List[AutograderTest]]:
+        """
+        Splits the tests into batches which are run one after another. Consecutive async tests
+        are grouped together to run on an event loop and, if parallel is set, consecutive sync
+        tests which can run in parallel are grouped together to run on threads. Every serial test
+        gets a batch of its own, so serial tests still see every test declared before them as finished.
+
+        With a time_budget, the scheduler gives every test a timeout once it starts, so sync tests
+        only run on threads if that timeout can still stop them (in isolation or a fork).
+        """
+        def get_kind(test: AutograderTest):
+            if not test.can_run_in_parallel():
+                return None
+            if test.is_async():
+                return "async"
+            if self.scheduler is not None and not (test.isolate or self.fork_tests):
+                return None
+            if self.parallel is not None and self.parallel > 1:
+                return "thread"
+            return None
+        batches = []
+        batch = []
+        batch_kind = None
+        for test in self.get_run_order():
+            if test.reused:
+                continue
+            kind = get_kind(test)
+            if batch and (kind is None or kind != batch_kind):
+                batches.append(batch)
+                batch = []
+            if kind is None:
+                batches.append([test])
+                continue
+            batch.append(test)
+            batch_kind = kind
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def run_test_batch(self, batch: List[AutograderTest]):
+        if self.fork_tests:
+            from .AutograderForkServer import ForkServer
+            ForkServer(self).run_tests(batch, workers=self.parallel if self.parallel is not None else 1)
+            return self
+        if len(batch) == 1:
+            self.run_test(batch[0])
+            self.test_finished(batch[0])
+            return self
+        if batch[0].is_async():
+            run_coroutine(self.run_async_test_batch(batch))
+            return self
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            futures = {pool.submit(self.run_test, test): test for test in batch}
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    self.test_finished(futures[future])
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return self
+
+    async def run_async_test_batch(self, batch: List[AutograderTest]):
+        semaphore = asyncio.Semaphore(self.async_concurrency) if self.async_concurrency is not None else None
+        async def run_test(test: AutograderTest):
+            if semaphore is None:
+                await self.run_test_async(test)
+            else:
+                async with semaphore:
+                    await self.run_test_async(test)
+            self.test_finished(test)
+        await asyncio.gather(*[run_test(test) for test in batch])
+        return self
+
+    def run_test(self, test: AutograderTest):
+        if self.scheduler is None:
+            return test.run(self)
+        if not self.scheduler.begin(test):
+            return None
+        try:
+            return test.run(self)
+        finally:
+            self.scheduler.end(test)
+
+    async def run_test_async(self, test: AutograderTest):
+        if self.scheduler is None:
+            return await test.run_async(self)
+        if not self.scheduler.begin(test):
+            return None
+        try:
+            return await test.run_async(self)
+        finally:
+            self.scheduler.end(test)
+
+    def test_finished(self, test: AutograderTest):
+        self.incremental.finished(self, test)
+        if self.export_tests_after_test:
+            self.results_writer.test_finished(test)
+            if self.results_writer.should_checkpoint():
+                self.results_writer.checkpoint(self)
+        return self
+
+    def get_run_order(self) -> List[AutograderTest]:
+        if self.test_order is None:
+            return self.tests
+        if self.test_order == "history":
+            return order_by_history(self, self.tests)
+        if callable(self.test_order):
+            return self.test_order(self, self.tests)
+        raise ValueError(f"Unknown test_order {self.test_order}!")
+
+    def get_ordered_tests(self) -> List[AutograderTest]:
+        if self.reverse_tests:
+            return list(reversed(self.tests))
+        return self.tests
+
     def generate_results(self, test_results=None, leaderboard: Leaderboard=None, dump=True, print_main_score_warning_error=True):
-        results = {
-            "execution_time": (datetime.datetime.now() - self.start_time).total_seconds(),
-        }
         if test_results is None:
             tests = []
-            if self.reverse_tests:
-                tsts = reversed(self.tests)
-            else:
-                tsts = self.tests
-            for test in tsts:
+            for test in self.get_ordered_tests():
                 res = test.get_results()
                 if res:
                     tests.append(res)
-            if tests:
-                results["tests"] = tests
+            if not tests:
+                tests = None
+        elif isinstance(test_results, list):
+            tests = test_results
         else:
-            if isinstance(test_results, list):
-                results["tests"] = test_results
+            tests = None
+        results = self.get_results_summary(
+            has_tests=bool(tests),
+            has_score=tests is not None and any(["score" in t for t in tests]),
+            leaderboard=leaderboard,
+            print_main_score_warning_error=print_main_score_warning_error,
+        )
+        if tests is not None:
+            results["tests"] = tests
+        results = self.modify_results(results)
+        if dump:
+            self.dump_results(results)
+        return results
+
+    def get_results_summary(self, has_tests: bool, has_score: bool, leaderboard: Leaderboard=None, print_main_score_warning_error=True) -> dict:
+        """
+        Generates everything in the results besides the tests.
+        """
+        results = {
+            "execution_time": (datetime.datetime.now() - self.start_time).total_seconds(),
+        }
         if self.score is not None:
             results["score"] = self.score
         else:
-            if "tests" not in results or len(results["tests"]) == 0 or not any(["score" in t for t in results["tests"]]):
+            if not has_tests or not has_score:
                 results["score"] = 0
                 if print_main_score_warning_error:
                     self.print("This autograder does not set the main score or have any tests which give points!")
         if self.output is not None:
-            results["output"] = self.output
+            results["output"] = str(self.output)
         if self.visibility is not None:
             results["visibility"] = self.visibility
         if self.stdout_visibility is not None:
             results["stdout_visibility"] = self.stdout_visibility
         if self.extra_data:
             results["extra_data"] = self.extra_data
-        if leaderboard is not None:
+        if isinstance(leaderboard, list):
+            # This is an already exported leaderboard (eg. from a previous submission).
+            leaderboard_export = leaderboard
+        elif leaderboard is not None:
             leaderboard_export = leaderboard.export()
         else:
             leaderboard_export = self.leaderboard.export()
         if leaderboard_export:
             results["leaderboard"] = leaderboard_export
-        results = self.modify_results(results)
-        if dump:
-            self.dump_results(results)
         return results
         
     def execute(self, generate_results: bool=True):
@@ -311,15 +591,36 @@ class Autograder:
         if not printed_welcome_message:
             printed_welcome_message = True
             print(get_welcome_message())
-        self.rate_limit.rate_limit_main(self)
-        if not self.run_tests():
-            print("An error has occurred when attempting to run all tests.")
-        if self.rate_limit.is_enabled():
-            if self.output is None:
-                self.output = ""
-            self.output = self.rate_limit.get_rate_limit_str(self) + self.output
+        cache = self.result_cache
+        reused = None
+        checked_rate_limit = False
+        if cache is not None and not cache.consume_token:
+            reused = cache.try_reuse(self)
+        if reused is None:
+            self.rate_limit.rate_limit_main(self)
+            checked_rate_limit = True
+            if cache is not None and cache.consume_token:
+                reused = cache.try_reuse(self)
+        if reused is not None:
+            tests, leaderboard, score = reused
+            self.set_score(score)
+            succeeded = False
+        else:
+            tests, leaderboard = None, None
+            succeeded = self.run_tests()
+            if not succeeded:
+                print("An error has occurred when attempting to run all tests.")
+        if checked_rate_limit and self.rate_limit.is_enabled() and "sub_counts" in self.extra_data:
+            self.output = OutputBuffer.wrap(self.output).prepend(self.rate_limit.get_rate_limit_str(self))
+        # Rate limited runs exit in rate_limit_main so they never get here.
+        if cache is not None and (reused is not None or succeeded):
+            cache.mark_graded(self)
         if generate_results:
-            self.generate_results()
+            results = self.generate_results(test_results=tests, leaderboard=leaderboard)
+            if cache is not None and succeeded:
+                cache.store(self, results)
+        if self.profiler is not None:
+            self.profiler.dump(self)
         return self
 
     @staticmethod
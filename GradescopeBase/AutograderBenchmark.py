@@ -0,0 +1,172 @@
+"""
+This times student code reliably enough to rank it.
+"""
+import gc
+import os
+import statistics
+import time
+from typing import Callable, Iterable, List, Union
+
+class BenchmarkStats:
+    """
+    The results of a benchmark. All times are in seconds. times holds the measurements which were
+    kept and rejected the ones which were thrown out as outliers.
+    """
+    STATISTICS = ["median", "mean", "min", "max", "stddev"]
+
+    def __init__(self, name: str, times: List[float], rejected: List[float], warmup: int, budget_exhausted: bool, cpus: list=None):
+        self.name = name
+        self.times = times
+        self.rejected = rejected
+        self.warmup = warmup
+        self.budget_exhausted = budget_exhausted
+        self.cpus = cpus
+        self.median = statistics.median(times)
+        self.mean = statistics.mean(times)
+        self.min = min(times)
+        self.max = max(times)
+        self.stddev = statistics.stdev(times) if len(times) > 1 else 0.0
+
+    @property
+    def repeats(self) -> int:
+        return len(self.times) + len(self.rejected)
+
+    def get(self, statistic: str) -> float:
+        if statistic not in self.STATISTICS:
+            raise ValueError(f"Unknown statistic {statistic}, it must be one of {self.STATISTICS}!")
+        return getattr(self, statistic)
+
+    def export(self) -> dict:
+        data = {s: round(self.get(s), 9) for s in self.STATISTICS}
+        data.update({
+            "repeats": self.repeats,
+            "warmup": self.warmup,
+            "times": [round(t, 9) for t in self.times],
+            "rejected": [round(t, 9) for t in self.rejected],
+        })
+        if self.budget_exhausted:
+            data["budget_exhausted"] = True
+        if self.cpus is not None:
+            data["cpus"] = self.cpus
+        return data
+
+    def __str__(self):
+        return f"{self.name}: median {self.median:.6f}s, min {self.min:.6f}s, stddev {self.stddev:.6f}s over {len(self.times)} runs ({len(self.rejected)} outliers rejected)"
+
+class Benchmark:
+    """
+    Times a function with warmup runs first and then up to repeats measured runs.
+
+    - time_budget caps the total time (in seconds, warmup included) spent on the benchmark. No
+      run is started if it would likely go past the budget, but there is always at least
+      min_repeats measured runs.
+    - cpu pins the calling thread to the given CPU(s) while measuring (True pins it to one of the
+      CPUs it may already use). Pinning is skipped where it is not supported.
+    - outlier_threshold rejects runs whose modified z-score (based on the median absolute
+      deviation) is above it. Set it to None to keep every run.
+    - The garbage collector is disabled during the measured runs unless disable_gc is False.
+    """
+    def __init__(
+        self,
+        fn: Callable,
+        name: str=None,
+        repeats: int=5,
+        warmup: int=1,
+        time_budget: float=None,
+        min_repeats: int=1,
+        cpu: Union[bool, int, Iterable[int]]=None,
+        outlier_threshold: float=3.5,
+        disable_gc: bool=True,
+        timer: Callable[[], float]=time.perf_counter,
+    ):
+        if repeats < 1:
+            raise ValueError("A benchmark needs at least one repeat!")
+        self.fn = fn
+        self.name = name if name is not None else getattr(fn, "__name__", "benchmark")
+        self.repeats = repeats
+        self.warmup = warmup
+        self.time_budget = time_budget
+        self.min_repeats = max(1, min(min_repeats, repeats))
+        self.cpu = cpu
+        self.outlier_threshold = outlier_threshold
+        self.disable_gc = disable_gc
+        self.timer = timer
+
+    def get_cpus(self):
+        if self.cpu is None or self.cpu is False:
+            return None
+        if self.cpu is True:
+            return {min(os.sched_getaffinity(0))}
+        if isinstance(self.cpu, int):
+            return {self.cpu}
+        return set(self.cpu)
+
+    def pin(self):
+        """
+        Pins the calling thread and returns the affinity to restore afterwards (or None) and the CPUs.
+        """
+        if not hasattr(os, "sched_setaffinity"):
+            if self.cpu:
+                print(f"[Warning]: CPU pinning is not supported here so {self.name} is not pinned.")
+            return None, None
+        cpus = self.get_cpus()
+        if cpus is None:
+            return None, None
+        previous = os.sched_getaffinity(0)
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            print(f"[Warning]: Could not pin {self.name} to CPU(s) {sorted(cpus)}: {e}")
+            return None, None
+        return previous, sorted(cpus)
+
+    def reject_outliers(self, times: List[float]) -> tuple:
+        if self.outlier_threshold is None or len(times) < 3:
+            return times, []
+        median = statistics.median(times)
+        mad = statistics.median([abs(t - median) for t in times])
+        if mad == 0:
+            return times, []
+        kept = []
+        rejected = []
+        for t in times:
+            (rejected if 0.6745 * abs(t - median) / mad > self.outlier_threshold else kept).append(t)
+        return kept, rejected
+
+    def over_budget(self, start: float, times: List[float]) -> bool:
+        if self.time_budget is None or len(times) < self.min_repeats:
+            return False
+        elapsed = self.timer() - start
+        return elapsed + statistics.mean(times) > self.time_budget
+
+    def run(self, *args, **kwargs) -> BenchmarkStats:
+        start = self.timer()
+        previous, cpus = self.pin()
+        gc_was_enabled = gc.isenabled()
+        try:
+            warmup = 0
+            for _ in range(self.warmup):
+                if self.time_budget is not None and self.timer() - start > self.time_budget / 2:
+                    # Leave most of the budget for the measured runs.
+                    break
+                self.fn(*args, **kwargs)
+                warmup += 1
+            times = []
+            budget_exhausted = False
+            if self.disable_gc:
+                gc.collect()
+                gc.disable()
+            for _ in range(self.repeats):
+                if self.over_budget(start, times):
+                    budget_exhausted = True
+                    break
+                t = self.timer()
+                self.fn(*args, **kwargs)
+                times.append(self.timer() - t)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+            if previous is not None:
+                os.sched_setaffinity(0, previous)
+        kept, rejected = self.reject_outliers(times)
+        return BenchmarkStats(self.name, kept, rejected, warmup, budget_exhausted, cpus=cpus)
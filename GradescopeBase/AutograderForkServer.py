@@ -0,0 +1,453 @@
+"""
+This runs tests and submissions in forked copies of a warmed up autograder.
+"""
+import datetime
+import importlib
+import json
+import os
+import pickle
+import select
+import selectors
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, List, Union
+
+from .Autograder import Autograder
+from .AutograderOutput import OutputBuffer
+from .AutograderTest import AutograderTest
+from .Timeout import Timeout
+from .Utils import results_path
+
+# How long past its timeout a forked test gets to report its own timeout before it is killed.
+FORK_TIMEOUT_GRACE = 1
+
+def describe_status(status: int) -> str:
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        try:
+            return f"killed by {signal.Signals(sig).name}"
+        except ValueError:
+            return f"killed by signal {sig}"
+    if os.WIFEXITED(status):
+        return f"exited with code {os.WEXITSTATUS(status)}"
+    return f"status {status}"
+
+def write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+def fork(child_fn: Callable[[int], None]) -> tuple:
+    """
+    Forks and runs child_fn(write_fd) in the child, which then exits. Returns the pid of the
+    child and the fd to read what it wrote from.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    r, w = os.pipe()
+    # The lock of the timeouts is held while forking so the child does not inherit it locked.
+    with Timeout._lock:
+        pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            os.close(r)
+            child_fn(w)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+    os.close(w)
+    return pid, r
+
+class ForkServer:
+    """
+    Runs tests of an autograder in forked children so every test starts from the state the
+    autograder was in after its setups (copy on write) and a crash in a test (eg. a segfault in
+    the student's code) only fails that test.
+
+    The child sends the score, output and extra_data of the test (and anything it added to the
+    leaderboard, extra_data or output of the autograder) back over a pipe. Anything else a test
+    changes in memory is lost when the child exits.
+    """
+    TEST_ATTRIBUTES = ["name", "number", "max_score", "score", "tags", "visibility", "extra_data", "execution_time", "ran", "completed"]
+
+    def __init__(self, ag: Autograder):
+        self.ag = ag
+
+    def capture(self, test: AutograderTest, output_start: int) -> dict:
+        ag_output = str(self.ag.output) if self.ag.output is not None else ""
+        test_state = {a: getattr(test, a, None) for a in self.TEST_ATTRIBUTES}
+        test_state["output"] = str(test.output)
+        return {
+            "test": test_state,
+            "leaderboard": self.ag.leaderboard.items,
+            "extra_data": self.ag.extra_data,
+            "output": ag_output[output_start:],
+            "score": self.ag.score,
+        }
+
+    def encode(self, state: dict) -> bytes:
+        try:
+            return pickle.dumps(state)
+        except Exception as e:
+            state["test"]["extra_data"] = None
+            state["extra_data"] = {}
+            state["leaderboard"] = {}
+            state["test"]["output"] += f"\n[Error]: The extra data of this test could not be sent back from its process! ({e})\n"
+            return pickle.dumps(state)
+
+    def apply(self, test: AutograderTest, state: dict, score_at_fork):
+        test_state = dict(state["test"])
+        output = test_state.pop("output")
+        for a, value in test_state.items():
+            setattr(test, a, value)
+        test.output = OutputBuffer.wrap(test.output).replace(output)
+        self.ag.leaderboard.items.update(state["leaderboard"])
+        self.ag.extra_data.update(state["extra_data"])
+        if state["output"]:
+            self.ag.print(state["output"], end="")
+        if state["score"] != score_at_fork:
+            self.ag.set_score(state["score"])
+
+    def crashed(self, test: AutograderTest, reason: str):
+        test.ran = True
+        test.completed = False
+        test.print(f"[Error]: This test crashed ({reason})! Please contact a TA if you believe this is an issue with the autograder.")
+        if not test.do_not_set_score:
+            test.set_score(0)
+
+    def timed_out(self, test: AutograderTest, elapsed: float):
+        test.ran = True
+        test.completed = False
+        test.execution_time = elapsed
+        test.print(f"[ERROR]: This test timed out after {elapsed:.2f} seconds!")
+        if not test.do_not_set_score:
+            test.set_score(0)
+
+    def start(self, test: AutograderTest) -> dict:
+        output_start = len(str(self.ag.output)) if self.ag.output is not None else 0
+
+        def child(w: int):
+            exit = False
+            try:
+                test.run(self.ag)
+            except SystemExit:
+                # The test killed the autograder (eg. with kill_autograder_on_error).
+                exit = True
+            state = self.capture(test, output_start)
+            state["exit"] = exit
+            write_all(w, self.encode(state))
+
+        pid, fd = fork(child)
+        start = time.monotonic()
+        return {
+            "test": test,
+            "pid": pid,
+            "fd": fd,
+            "chunks": [],
+            "start": start,
+            "deadline": start + test.timeout + FORK_TIMEOUT_GRACE if test.timeout is not None else None,
+            "killed": False,
+            "score_at_fork": self.ag.score,
+        }
+
+    def finish(self, job: dict) -> bool:
+        """
+        Applies the result of a finished child to its test. Returns True if the test killed the autograder.
+        """
+        os.close(job["fd"])
+        _, status = os.waitpid(job["pid"], 0)
+        test = job["test"]
+        state = None
+        if job["chunks"]:
+            try:
+                state = pickle.loads(b"".join(job["chunks"]))
+            except Exception:
+                state = None
+        if job["killed"]:
+            self.timed_out(test, time.monotonic() - job["start"])
+        elif state is None:
+            self.crashed(test, describe_status(status))
+        else:
+            self.apply(test, state, job["score_at_fork"])
+        if self.ag.scheduler is not None:
+            self.ag.scheduler.end(test)
+        self.ag.test_finished(test)
+        return state is not None and state.get("exit", False)
+
+    def run_tests(self, tests: List[AutograderTest], workers: int=1):
+        """
+        Runs every test in a child of its own with up to workers children at a time.
+        """
+        workers = max(1, workers)
+        pending = deque(tests)
+        running = {}
+        sel = selectors.DefaultSelector()
+        try:
+            while pending or running:
+                while pending and len(running) < workers:
+                    test = pending.popleft()
+                    if self.ag.scheduler is not None and not self.ag.scheduler.begin(test):
+                        self.ag.test_finished(test)
+                        continue
+                    job = self.start(test)
+                    running[job["fd"]] = job
+                    sel.register(job["fd"], selectors.EVENT_READ, job)
+                deadlines = [j["deadline"] for j in running.values() if j["deadline"] is not None and not j["killed"]]
+                wait = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+                for key, _ in sel.select(wait):
+                    job = key.data
+                    chunk = os.read(job["fd"], 1 << 16)
+                    if chunk:
+                        job["chunks"].append(chunk)
+                        continue
+                    sel.unregister(job["fd"])
+                    del running[job["fd"]]
+                    if self.finish(job):
+                        sys.exit()
+                now = time.monotonic()
+                for job in running.values():
+                    if job["deadline"] is not None and not job["killed"] and now >= job["deadline"]:
+                        job["killed"] = True
+                        try:
+                            os.kill(job["pid"], signal.SIGKILL)
+                        except OSError:
+                            pass
+        finally:
+            for job in running.values():
+                try:
+                    os.kill(job["pid"], signal.SIGKILL)
+                except OSError:
+                    pass
+                os.close(job["fd"])
+                os.waitpid(job["pid"], 0)
+            sel.close()
+        return self
+
+def load_factory(factory: Union[str, Callable[[], Autograder]]) -> Callable[[], Autograder]:
+    """
+    Returns the factory itself or, given "module:function", that function of the module.
+    """
+    if callable(factory):
+        return factory
+    module, _, name = factory.partition(":")
+    if not name:
+        raise ValueError("The factory must look like module:function!")
+    return getattr(importlib.import_module(module), name)
+
+class SubmissionForkServer:
+    """
+    Grades submissions in forked copies of one warmed up autograder.
+
+    The server is a process of its own which changes into source_dir, imports the autograder
+    by calling factory (a function which returns the Autograder without running it, or
+    "module:function" of a module in source_dir), and runs its warm setups once. Then, for every
+    submission, it forks a child which changes into the working directory of the submission
+    (laid out like for a normal local run), loads its metadata and runs the autograder. Since
+    the server is single threaded, it is safe to fork it no matter what else the caller does.
+    """
+    def __init__(self, source_dir: str, factory: Union[str, Callable[[], Autograder]]):
+        self.source_dir = os.path.abspath(source_dir)
+        self.factory = factory
+        self.pid = None
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.next_id = 0
+        self.dispatcher = None
+        self.server_fds = ()
+
+    def start(self) -> bool:
+        """
+        Starts the server and returns if the autograder and its warm setups loaded.
+        """
+        requests_r, requests_w = os.pipe()
+        responses_r, responses_w = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(requests_w)
+                os.close(responses_r)
+                self.serve(requests_r, responses_w)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(requests_r)
+        os.close(responses_w)
+        self.pid = pid
+        self.requests = os.fdopen(requests_w, "w", buffering=1)
+        self.responses = os.fdopen(responses_r, "r")
+        ready = self.responses.readline()
+        if not ready or not json.loads(ready).get("ready"):
+            self.stop()
+            return False
+        self.dispatcher = threading.Thread(target=self.dispatch, name="ForkServerDispatcher", daemon=True)
+        self.dispatcher.start()
+        return True
+
+    def send(self, fd: int, message: dict):
+        write_all(fd, (json.dumps(message) + "\n").encode("utf-8"))
+
+    def warm_up(self) -> Autograder:
+        os.environ["IS_LOCAL"] = "true"
+        os.chdir(self.source_dir)
+        if self.source_dir not in sys.path:
+            sys.path.insert(0, self.source_dir)
+        ag = load_factory(self.factory)()
+        if not ag.run_warm_setups():
+            return None
+        return ag
+
+    def serve(self, requests: int, responses: int):
+        self.server_fds = (requests, responses)
+        ag = self.warm_up()
+        self.send(responses, {"ready": ag is not None})
+        if ag is None:
+            return
+        children = {}
+        buf = b""
+        while True:
+            readable, _, _ = select.select([requests], [], [], 0.05 if children else None)
+            if readable:
+                data = os.read(requests, 1 << 16)
+                if not data:
+                    break
+                buf += data
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    request = json.loads(line)
+                    pid = self.fork_submission(ag, request)
+                    children[pid] = request["id"]
+                    self.send(responses, {"id": request["id"], "pid": pid})
+            while children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                job_id = children.pop(pid, None)
+                if job_id is not None:
+                    self.send(responses, {"id": job_id, "status": status})
+        for pid in children:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def fork_submission(self, ag: Autograder, request: dict) -> int:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid != 0:
+            return pid
+        code = 0
+        try:
+            for fd in self.server_fds:
+                os.close(fd)
+            os.setsid()
+            os.chdir(request["workdir"])
+            log = os.open(request["log"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(log, 1)
+            os.dup2(log, 2)
+            os.close(log)
+            ag.start_time = datetime.datetime.now()
+            ag.results_file = results_path()
+            ag.submission = None
+            ag.load_metadata()
+            ag.run()
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def dispatch(self):
+        for line in self.responses:
+            message = json.loads(line)
+            with self.lock:
+                job = self.jobs.get(message["id"])
+            if job is None:
+                continue
+            if "pid" in message:
+                job["pid"] = message["pid"]
+                job["started"].set()
+            if "status" in message:
+                job["status"] = message["status"]
+                job["done"].set()
+        # The server exited so nothing is running anymore.
+        with self.lock:
+            for job in self.jobs.values():
+                job["started"].set()
+                job["done"].set()
+
+    def grade(self, workdir: str, log_path: str, timeout: float=None) -> tuple:
+        """
+        Grades the submission in workdir and returns its return code and whether it timed out.
+        """
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+            job = {"pid": None, "status": None, "started": threading.Event(), "done": threading.Event()}
+            self.jobs[job_id] = job
+            self.requests.write(json.dumps({"id": job_id, "workdir": os.path.abspath(workdir), "log": os.path.abspath(log_path)}) + "\n")
+        try:
+            job["started"].wait()
+            timed_out = not job["done"].wait(timeout)
+            if timed_out and job["pid"] is not None:
+                try:
+                    os.killpg(job["pid"], signal.SIGKILL)
+                except OSError:
+                    pass
+                job["done"].wait()
+            status = job["status"]
+            if status is None:
+                return None, timed_out
+            if os.WIFSIGNALED(status):
+                return -os.WTERMSIG(status), timed_out
+            return os.WEXITSTATUS(status), timed_out
+        finally:
+            with self.lock:
+                self.jobs.pop(job_id, None)
+
+    def kill_all(self):
+        with self.lock:
+            pids = [job["pid"] for job in self.jobs.values() if job["pid"] is not None]
+        for pid in pids:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self.pid is None:
+            return
+        try:
+            self.requests.close()
+        except OSError:
+            pass
+        os.waitpid(self.pid, 0)
+        self.pid = None
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+        self.responses.close()
@@ -0,0 +1,115 @@
+"""
+This reuses the results of tests whose files did not change since the previous submission.
+"""
+import hashlib
+from typing import List
+
+from .AutograderResultCache import ResultCache
+from .AutograderScheduler import test_key
+
+REUSED_MESSAGE = "[Reused]: None of the files this test depends on changed since your previous submission so its result was reused.\n"
+
+class IncrementalRegrade:
+    """
+    Tests with depends_on (a list of globs relative to the submission) are only run if one of
+    the files they match changed since the previous submission.
+
+    The hashes of the files of every such test are saved (with the version of the autograder,
+    see ResultCache) in extra_data["dependency_hashes"], together with which of the tests
+    completed normally (see AutograderTest.completed). If the previous submission has the same
+    hash for a test, was graded by the same version and the test completed normally (so it was
+    not skipped, timed out or crashed), its result is reused and marked as reused in the output. Hashes are always saved, so turning reuse off (eg. with
+    Autograder(reuse_unchanged_tests=False)) only makes the autograder run everything.
+    """
+    def __init__(self, enabled: bool=True, version: str=None, key_name: str="dependency_hashes"):
+        self.enabled = enabled
+        self.version = version
+        self.key_name = key_name
+
+    def get_version(self, ag: "Autograder"=None) -> str:
+        if self.version is None:
+            # The version of the result cache is reused so the python files are only hashed once.
+            cache = ag.result_cache if ag is not None and ag.result_cache is not None else ResultCache()
+            self.version = cache.get_version()
+        return self.version
+
+    @staticmethod
+    def hash_dependencies(ag: "Autograder", test: "AutograderTest") -> str:
+        paths = {f.path for pattern in test.depends_on for f in ag.submission.glob(pattern)}
+        h = hashlib.sha256()
+        h.update("\0".join(test.depends_on).encode("utf-8") + b"\0\0")
+        h.update(ag.submission.hash(paths).encode("ascii"))
+        return h.hexdigest()
+
+    def get_previous(self, ag: "Autograder") -> tuple:
+        """
+        Returns the dependency hashes and the results (by test key) of the latest previous
+        submission which has them.
+        """
+        if ag.metadata is None:
+            return None, {}
+        prev_subs = ag.metadata.get("previous_submissions") or []
+        for i in range(len(prev_subs) - 1, -1, -1):
+            try:
+                results = prev_subs[i]["results"]
+                hashes = results["extra_data"][self.key_name]
+                tests = results["tests"]
+            except (KeyError, TypeError):
+                continue
+            if isinstance(hashes, dict) and isinstance(tests, list):
+                return hashes, {test_key(t): t for t in tests if isinstance(t, dict)}
+        return None, {}
+
+    @staticmethod
+    def reuse(test: "AutograderTest", previous: dict):
+        test.ran = True
+        test.reused = True
+        test.completed = True
+        output = previous.get("output") or ""
+        if output.startswith(REUSED_MESSAGE):
+            output = output[len(REUSED_MESSAGE):]
+        test.print(REUSED_MESSAGE + output, end="")
+        if previous.get("extra_data") is not None:
+            test.extra_data = previous["extra_data"]
+        test.score = previous.get("score")
+
+    def apply(self, ag: "Autograder") -> List["AutograderTest"]:
+        """
+        Saves the hashes of the tests with dependencies and reuses the results of the ones which
+        did not change. Returns the reused tests.
+        """
+        tests = [t for t in ag.tests if t.depends_on]
+        if not tests:
+            return []
+        hashes = {test_key(t): self.hash_dependencies(ag, t) for t in tests}
+        ag.extra_data[self.key_name] = {"version": self.get_version(ag), "tests": hashes, "completed": {}}
+        if not self.enabled:
+            return []
+        prev_hashes, prev_results = self.get_previous(ag)
+        if not prev_hashes or prev_hashes.get("version") != self.get_version(ag):
+            return []
+        reused = []
+        for test in tests:
+            key = test_key(test)
+            previous = prev_results.get(key)
+            if previous is None or previous.get("score") is None:
+                continue
+            if (prev_hashes.get("tests") or {}).get(key) != hashes[key]:
+                continue
+            if (prev_hashes.get("completed") or {}).get(key) is not True:
+                continue
+            self.reuse(test, previous)
+            reused.append(test)
+        return reused
+
+    def finished(self, ag: "Autograder", test: "AutograderTest"):
+        """
+        Saves if a test with dependencies completed normally, including every subtest which ran.
+        """
+        from .AutograderSubTest import SUB_TESTS_KEY
+        hashes = ag.extra_data.get(self.key_name)
+        if not test.depends_on or not isinstance(hashes, dict):
+            return self
+        completed = test.completed and all(t.completed for t in test.__dict__.get(SUB_TESTS_KEY, []) if getattr(t, "ran", False))
+        hashes.setdefault("completed", {})[test_key(test)] = completed
+        return self
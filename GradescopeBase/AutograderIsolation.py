@@ -0,0 +1,390 @@
+"""
+This runs tests which may crash the process (eg. student code loaded with ctypes) in pre-forked workers.
+"""
+import array
+import copy
+import os
+import pickle
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import List
+
+from .AutograderForkServer import FORK_TIMEOUT_GRACE, ForkServer, describe_status, write_all
+from .AutograderOutput import OutputBuffer
+from .AutograderSubTest import SUB_TESTS_KEY
+from .AutograderTest import AutograderTest
+from .Timeout import Timeout
+
+HEADER = struct.Struct("<Q")
+
+def send_message(fd: int, data: bytes):
+    write_all(fd, HEADER.pack(len(data)) + data)
+
+def read_exact(fd: int, size: int, deadline: float=None) -> bytes:
+    """
+    Reads size bytes from fd. Raises EOFError if the other end closed it and TimeoutError if
+    the deadline (of time.monotonic) passed first.
+    """
+    chunks = []
+    while size > 0:
+        if deadline is not None:
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                raise TimeoutError()
+            readable, _, _ = select.select([fd], [], [], wait)
+            if not readable:
+                continue
+        chunk = os.read(fd, min(size, 1 << 16))
+        if not chunk:
+            raise EOFError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def read_message(fd: int, deadline: float=None) -> bytes:
+    size, = HEADER.unpack(read_exact(fd, HEADER.size, deadline))
+    return read_exact(fd, size, deadline)
+
+def send_fds(sock: socket.socket, data: bytes, fds: list):
+    """
+    Sends data and passes the file descriptors fds along with it (like socket.send_fds of Python 3.9).
+    """
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))] if fds else []
+    sock.sendmsg([data], ancillary)
+
+def recv_fds(sock: socket.socket, size: int, max_fds: int) -> tuple:
+    """
+    Receives a message and the file descriptors passed along with it.
+    """
+    fds = array.array("i")
+    data, ancillary, _, _ = sock.recvmsg(size, socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, fd_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(fd_data[:len(fd_data) - (len(fd_data) % fds.itemsize)])
+    return data, list(fds)
+
+def run_child(fn, *args):
+    """
+    Runs fn in a forked child and exits the child once it returns.
+    """
+    code = 0
+    try:
+        fn(*args)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+class IsolationWorker:
+    def __init__(self, pid: int, requests: int, responses: int):
+        self.pid = pid
+        self.requests = requests
+        self.responses = responses
+
+    def close_pipes(self):
+        for fd in (self.requests, self.responses):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+class IsolationPool:
+    """
+    Runs tests with isolate=True (and subtests) in worker processes which are forked ahead of
+    time, so a segfault or os._exit in a test only fails that test instead of the autograder.
+
+    When the pool starts (after the setups, before any test threads exist), it forks a single
+    threaded forker process. Every worker is forked by the forker, never by the autograder, so
+    no worker can start with a lock held by another thread of the autograder. The threads
+    running tests only send requests to it and to the workers over pipes.
+
+    A worker is a copy of the autograder as it was when the pool started and runs one test at a
+    time. It sends the score, output and extra_data of the test (and what the test added to the
+    output, extra_data and leaderboard of the autograder) back over a pipe, like the ForkServer.
+    Anything else a test changes in memory stays in the worker, where later tests run by the same
+    worker can see it. A worker which crashed or went past the timeout of its test is replaced
+    right away. Tests created after the pool started are unknown to the forker, so they run in
+    the autograder process without isolation.
+    """
+    # This is True in the forker and the workers so the tests run there instead of being sent to a worker.
+    in_worker = False
+
+    def __init__(self, ag: "Autograder", workers: int=1):
+        self.ag = ag
+        self.fork_server = ForkServer(ag)
+        self.size = max(1, workers)
+        self.owner = os.getpid()
+        self.cond = threading.Condition()
+        self.idle = deque()
+        self.workers = []
+        self.starting = 0
+        self.objects = {}
+        self.forker_pid = None
+        self.control = None
+        self.control_lock = threading.Lock()
+
+    @staticmethod
+    def uses_isolation(tests: List[AutograderTest]) -> bool:
+        for test in tests:
+            if test.isolate or any(t.isolate for t in test.__dict__.get(SUB_TESTS_KEY, [])):
+                return True
+        return False
+
+    def knows(self, test: AutograderTest) -> bool:
+        return id(test) in self.objects
+
+    def start(self):
+        for test in self.ag.tests:
+            for t in [test] + test.__dict__.get(SUB_TESTS_KEY, []):
+                self.objects[id(t)] = t
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # The lock of the timeouts is held while forking so the forker does not inherit it locked.
+        with Timeout._lock:
+            pid = os.fork()
+        if pid == 0:
+            parent.close()
+            run_child(self.run_forker, child)
+        child.close()
+        self.forker_pid = pid
+        self.control = parent
+        for _ in range(self.size):
+            worker = self.spawn()
+            with self.cond:
+                self.workers.append(worker)
+                self.idle.append(worker)
+                self.cond.notify()
+        return self
+
+    def stop(self):
+        with self.cond:
+            workers = self.workers
+            self.workers = []
+            self.idle.clear()
+        for worker in workers:
+            worker.close_pipes()
+        if self.control is not None:
+            # The forker kills and waits for the workers which are left once it sees the pool closed.
+            self.control.close()
+            self.control = None
+            os.waitpid(self.forker_pid, 0)
+        return self
+
+    def request(self, message: dict, fds: list=()) -> dict:
+        """
+        Sends a request to the forker and returns its reply.
+        """
+        with self.control_lock:
+            send_fds(self.control, pickle.dumps(message), list(fds))
+            data = self.control.recv(1 << 16)
+        if not data:
+            raise EOFError("The forker of the isolated tests exited!")
+        return pickle.loads(data)
+
+    def run_forker(self, control: socket.socket):
+        IsolationPool.in_worker = True
+        children = set()
+        try:
+            while True:
+                data, fds = recv_fds(control, 1 << 16, 2)
+                if not data:
+                    return
+                message = pickle.loads(data)
+                if message["op"] == "spawn":
+                    requests, responses = fds
+                    pid = os.fork()
+                    if pid == 0:
+                        control.close()
+                        run_child(self.serve, requests, responses)
+                    os.close(requests)
+                    os.close(responses)
+                    children.add(pid)
+                    control.send(pickle.dumps({"pid": pid}))
+                elif message["op"] == "wait":
+                    pid = message["pid"]
+                    if message.get("kill"):
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+                    try:
+                        _, status = os.waitpid(pid, 0)
+                    except ChildProcessError:
+                        status = 0
+                    children.discard(pid)
+                    control.send(pickle.dumps({"status": status}))
+        finally:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+
+    def spawn(self) -> IsolationWorker:
+        requests_r, requests_w = os.pipe()
+        responses_r, responses_w = os.pipe()
+        try:
+            reply = self.request({"op": "spawn"}, [requests_r, responses_w])
+        finally:
+            os.close(requests_r)
+            os.close(responses_w)
+        return IsolationWorker(reply["pid"], requests_w, responses_r)
+
+    def reap(self, worker: IsolationWorker, kill: bool=False) -> int:
+        """
+        Closes the pipes of a worker and returns its exit status once it exited.
+        """
+        worker.close_pipes()
+        return self.request({"op": "wait", "pid": worker.pid, "kill": kill})["status"]
+
+    def serve(self, requests: int, responses: int):
+        # The resources of a test are measured where it was sent from.
+        self.ag.profiler = None
+        while True:
+            try:
+                request = pickle.loads(read_message(requests))
+            except EOFError:
+                return
+            exit = self.run_request(request, responses)
+            if exit:
+                return
+
+    def run_request(self, request: dict, responses: int) -> bool:
+        test = self.objects[request["key"]]
+        test.timeout = request["timeout"]
+        test.score = request["score"]
+        test.output = OutputBuffer(request["output"], max_bytes=test.max_output_bytes)
+        output_start = len(str(self.ag.output)) if self.ag.output is not None else 0
+        leaderboard = dict(self.ag.leaderboard.items)
+        try:
+            extra_data = copy.deepcopy(self.ag.extra_data)
+        except Exception:
+            extra_data = {}
+        exit = False
+        result = None
+        raised = None
+        try:
+            result = test.run(self.ag, handler=request["handler"])
+        except SystemExit:
+            # The test killed the autograder (eg. with kill_autograder_on_error).
+            exit = True
+        except BaseException as e:
+            # eg. a StopSubTestRunner, which is raised again where the test was sent from.
+            raised = e
+        state = self.fork_server.capture(test, output_start)
+        state["extra_data"] = {k: v for k, v in self.ag.extra_data.items() if k not in extra_data or extra_data[k] != v}
+        state["leaderboard"] = {k: v for k, v in self.ag.leaderboard.items.items() if leaderboard.get(k) is not v}
+        state["exit"] = exit
+        for key, value in (("result", result), ("raised", raised)):
+            try:
+                pickle.dumps(value)
+            except Exception:
+                value = None
+            state[key] = value
+        send_message(responses, self.fork_server.encode(state))
+        return exit
+
+    def checkout(self) -> IsolationWorker:
+        with self.cond:
+            while not self.idle and len(self.workers) + self.starting >= self.size:
+                self.cond.wait()
+            if self.idle:
+                return self.idle.popleft()
+            self.starting += 1
+        # A worker which exited (eg. after its test killed the autograder) is replaced.
+        try:
+            worker = self.spawn()
+        finally:
+            with self.cond:
+                self.starting -= 1
+        with self.cond:
+            self.workers.append(worker)
+        return worker
+
+    def checkin(self, worker: IsolationWorker):
+        with self.cond:
+            self.idle.append(worker)
+            self.cond.notify()
+
+    def replace(self, worker: IsolationWorker, kill: bool=False) -> str:
+        """
+        Replaces a worker which crashed or timed out and returns how it exited.
+        """
+        with self.cond:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            self.starting += 1
+        try:
+            status = self.reap(worker, kill=kill)
+            new = self.spawn()
+        finally:
+            with self.cond:
+                self.starting -= 1
+        with self.cond:
+            self.workers.append(new)
+        self.checkin(new)
+        return describe_status(status)
+
+    def run(self, test: AutograderTest, handler=None):
+        """
+        Runs the test in a worker and applies its results. Returns what test.run returned.
+        """
+        try:
+            pickle.dumps(handler)
+        except Exception:
+            # The worker falls back to the default handler of the test.
+            handler = None
+        request = pickle.dumps({
+            "key": id(test),
+            "handler": handler,
+            "timeout": test.timeout,
+            "score": test.score,
+            "output": str(test.output),
+        })
+        score_at_start = self.ag.score
+        worker = self.checkout()
+        start = time.monotonic()
+        deadline = start + test.timeout + FORK_TIMEOUT_GRACE if test.timeout is not None else None
+        data = None
+        timed_out = False
+        try:
+            send_message(worker.requests, request)
+            data = read_message(worker.responses, deadline)
+        except TimeoutError:
+            timed_out = True
+        except (EOFError, OSError):
+            pass
+        if timed_out:
+            self.replace(worker, kill=True)
+            self.fork_server.timed_out(test, time.monotonic() - start)
+            return None
+        if data is None:
+            self.fork_server.crashed(test, self.replace(worker))
+            return None
+        state = pickle.loads(data)
+        if state["exit"]:
+            with self.cond:
+                self.workers.remove(worker)
+            self.reap(worker)
+        else:
+            self.checkin(worker)
+        self.fork_server.apply(test, state, score_at_start)
+        if state["exit"]:
+            raise SystemExit()
+        if state["raised"] is not None:
+            raise state["raised"]
+        return state["result"]
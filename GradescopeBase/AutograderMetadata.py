@@ -0,0 +1,281 @@
+"""
+This lazily loads the submission metadata.
+"""
+import json
+import mmap
+import re
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRUCTURE = re.compile(rb'["\[\]{}]')
+_SCALAR = re.compile(rb"[^ \t\n\r,\]}]+")
+
+_QUOTE, _BACKSLASH, _COLON, _COMMA = ord('"'), ord("\\"), ord(":"), ord(",")
+_OPEN_OBJECT, _CLOSE_OBJECT = ord("{"), ord("}")
+_OPEN_ARRAY, _CLOSE_ARRAY = ord("["), ord("]")
+
+# Pages of the file are given back to the OS after indexing a value larger than this.
+_RELEASE_PAGES_SIZE = 1 << 18
+
+def _skip_whitespace(buf, pos: int) -> int:
+    return _WHITESPACE.match(buf, pos).end()
+
+def _string_end(buf, pos: int) -> int:
+    """
+    Returns where the JSON string starting at pos ends.
+    """
+    end = buf.find(b'"', pos + 1)
+    for _ in range(32):
+        if end == -1:
+            raise ValueError(f"Unterminated JSON string starting at {pos}!")
+        k = end - 1
+        while buf[k] == _BACKSLASH:
+            k -= 1
+        if (end - 1 - k) % 2 == 0:
+            return end + 1
+        end = buf.find(b'"', end + 1)
+    # The string has a lot of escaped quotes so let the json module find its end instead. Since
+    # latin-1 maps every byte to one character, offsets in the decoded text are byte offsets.
+    size = 1 << 16
+    while True:
+        text = buf[pos:pos + size].decode("latin-1")
+        try:
+            return pos + json.decoder.scanstring(text, 1)[1]
+        except ValueError:
+            if pos + size >= len(buf):
+                raise
+            size *= 4
+
+def _value_end(buf, pos: int) -> int:
+    """
+    Returns where the JSON value starting at pos ends without parsing it.
+    """
+    c = buf[pos]
+    if c == _QUOTE:
+        return _string_end(buf, pos)
+    if c == _OPEN_OBJECT or c == _OPEN_ARRAY:
+        depth = 0
+        search = _STRUCTURE.search
+        while True:
+            m = search(buf, pos)
+            if m is None:
+                raise ValueError(f"Unterminated JSON value starting at {pos}!")
+            pos = m.start()
+            c = buf[pos]
+            if c == _QUOTE:
+                pos = _string_end(buf, pos)
+                continue
+            pos += 1
+            if c == _OPEN_OBJECT or c == _OPEN_ARRAY:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+    m = _SCALAR.match(buf, pos)
+    if m is None:
+        raise ValueError(f"Expected a JSON value at {pos}!")
+    return m.end()
+
+def _release_pages(buf, start: int, end: int):
+    if end - start < _RELEASE_PAGES_SIZE or not isinstance(buf, mmap.mmap) or not hasattr(buf, "madvise"):
+        return
+    start -= start % mmap.PAGESIZE
+    try:
+        buf.madvise(mmap.MADV_DONTNEED, start, end - start)
+    except (OSError, ValueError):
+        pass
+
+def _expect(buf, pos: int, c: int) -> int:
+    if pos >= len(buf) or buf[pos] != c:
+        raise ValueError(f"Expected {chr(c)!r} at {pos}!")
+    return pos + 1
+
+def _index_value(buf, pos: int, lazy) -> tuple:
+    """
+    Returns where the JSON value starting at pos ends and, if lazy describes the value (a dict
+    for objects, a list holding the description of the elements for arrays), its index.
+    """
+    c = buf[pos]
+    if isinstance(lazy, dict) and c == _OPEN_OBJECT:
+        return _index_object(buf, pos, lazy)
+    if isinstance(lazy, list) and c == _OPEN_ARRAY:
+        return _index_array(buf, pos, lazy[0] if lazy else None)
+    return _value_end(buf, pos), None
+
+def _index_object(buf, pos: int, lazy: dict) -> tuple:
+    """
+    Indexes the JSON object starting at pos. The index maps every key to the span of its value
+    and the index of the value if it is loaded lazily.
+    """
+    pos = _expect(buf, _skip_whitespace(buf, pos), _OPEN_OBJECT)
+    index = {}
+    pos = _skip_whitespace(buf, pos)
+    if buf[pos] == _CLOSE_OBJECT:
+        return pos + 1, index
+    while True:
+        if buf[pos] != _QUOTE:
+            raise ValueError(f"Expected a key at {pos}!")
+        key_end = _string_end(buf, pos)
+        key = json.loads(buf[pos:key_end])
+        pos = _skip_whitespace(buf, _expect(buf, _skip_whitespace(buf, key_end), _COLON))
+        end, child = _index_value(buf, pos, lazy.get(key))
+        index[key] = (pos, end, child)
+        _release_pages(buf, pos, end)
+        pos = _skip_whitespace(buf, end)
+        if buf[pos] == _CLOSE_OBJECT:
+            return pos + 1, index
+        pos = _skip_whitespace(buf, _expect(buf, pos, _COMMA))
+
+def _index_array(buf, pos: int, lazy) -> tuple:
+    """
+    Indexes the JSON array starting at pos. The index holds the span of every element and the
+    index of the element if it is loaded lazily.
+    """
+    pos = _expect(buf, _skip_whitespace(buf, pos), _OPEN_ARRAY)
+    index = []
+    pos = _skip_whitespace(buf, pos)
+    if buf[pos] == _CLOSE_ARRAY:
+        return pos + 1, index
+    while True:
+        end, child = _index_value(buf, pos, lazy)
+        index.append((pos, end, child))
+        _release_pages(buf, pos, end)
+        pos = _skip_whitespace(buf, end)
+        if buf[pos] == _CLOSE_ARRAY:
+            return pos + 1, index
+        pos = _skip_whitespace(buf, _expect(buf, pos, _COMMA))
+
+def _load(buf, entry: tuple, lazy):
+    start, end, child = entry
+    if child is None:
+        return json.loads(buf[start:end])
+    if isinstance(lazy, dict):
+        return LazyJSONObject(buf, child, lazy)
+    return LazyJSONArray(buf, child, lazy[0] if lazy else None)
+
+def materialize(value):
+    """
+    Converts lazily loaded values into plain dicts and lists.
+    """
+    if isinstance(value, LazyJSONObject):
+        return {k: materialize(v) for k, v in value.items()}
+    if isinstance(value, LazyJSONArray):
+        return [materialize(v) for v in value]
+    return value
+
+# The value of a key of a LazyJSONObject which has not been loaded yet.
+_NOT_LOADED = object()
+
+class LazyJSONObject(dict):
+    """
+    A JSON object which only parses the values of its keys when they are accessed. Values are
+    kept once they are loaded. `lazy` says which of its values are loaded lazily as well.
+
+    It is a dict, so it can be changed and serialized (eg. with json.dumps) like the dict which
+    json.load returns. Anything which needs every value (eg. items, == or json.dumps) loads the
+    rest of its values first, after which it is a plain dict.
+    """
+    def __init__(self, buf, index: dict, lazy: dict=None):
+        super().__init__(dict.fromkeys(index, _NOT_LOADED))
+        self._buf = buf
+        # This is None once every value is loaded.
+        self._index = index
+        self._lazy = lazy if lazy is not None else {}
+
+    def _load_all(self):
+        if self._index is None:
+            return
+        for key in self._index:
+            if dict.get(self, key) is _NOT_LOADED:
+                self[key]
+        self._index = None
+        self._buf = None
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if value is _NOT_LOADED:
+            value = _load(self._buf, self._index[key], self._lazy.get(key))
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        # This is overridden so dict(self) and {**self} get the values with __getitem__.
+        return dict.__iter__(self)
+
+    def __repr__(self) -> str:
+        if self._index is None:
+            return dict.__repr__(self)
+        return f"LazyJSONObject(keys={list(self)})"
+
+    def __reduce_ex__(self, protocol):
+        # Copies and pickles are plain dicts since the file may not be there anymore.
+        return dict, (self.to_dict(),)
+
+    def unload(self, key):
+        """
+        Drops the loaded value of key. It will be loaded again the next time it is accessed.
+        Once every value is loaded, this does nothing.
+        """
+        if self._index is not None and key in self._index:
+            dict.__setitem__(self, key, _NOT_LOADED)
+
+    def to_dict(self) -> dict:
+        return materialize(self)
+
+def _loading(name: str):
+    method = getattr(dict, name)
+
+    def load_all_first(self, *args, **kwargs):
+        self._load_all()
+        return method(self, *args, **kwargs)
+
+    load_all_first.__name__ = name
+    return load_all_first
+
+# These hand out the values without __getitem__.
+for _name in ("__eq__", "__ne__", "__or__", "items", "values", "copy", "pop", "popitem", "setdefault"):
+    # dict only has | since Python 3.9.
+    if hasattr(dict, _name):
+        setattr(LazyJSONObject, _name, _loading(_name))
+
+class LazyJSONArray(list):
+    """
+    A JSON array. The elements which lazy describes (eg. the previous submissions) are loaded
+    lazily themselves, any other element is parsed when the array is loaded.
+    """
+    def __init__(self, buf, index: list, lazy=None):
+        super().__init__(_load(buf, entry, lazy) for entry in index)
+
+    def to_list(self) -> list:
+        return materialize(self)
+
+class SubmissionMetadata(LazyJSONObject):
+    """
+    The submission_metadata.json of a submission. The file is memory mapped and indexed in a
+    single pass without parsing it. Values are only parsed once they are accessed and previous
+    submissions (and their results, which contain the output of every test) are loaded lazily.
+    """
+    LAZY = {
+        "previous_submissions": [{
+            "results": {},
+        }],
+    }
+
+    @classmethod
+    def load(cls, path: str, lazy: dict=None) -> "SubmissionMetadata":
+        if lazy is None:
+            lazy = cls.LAZY
+        with open(path, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be memory mapped.
+                buf = f.read()
+        _, index = _index_object(buf, 0, lazy)
+        return cls(buf, index, lazy)
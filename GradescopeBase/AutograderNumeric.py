@@ -0,0 +1,186 @@
+"""
+This checks large numeric outputs with NumPy instead of comparing one number at a time.
+"""
+import re
+import warnings
+from typing import Union
+
+# NumPy is only needed by autograders which check numeric outputs.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# NumPy 1.18 and later warn when fromstring stops before the end of the text, older versions
+# stop silently so the numbers have to be counted to notice.
+FROMSTRING_WARNS = np is not None and tuple(int(v) for v in re.findall(r"\d+", np.__version__)[:2]) >= (1, 18)
+
+def require_numpy():
+    if np is None:
+        raise ImportError("Checking numeric results needs NumPy, install it with: pip install numpy")
+    return np
+
+def parse_numbers(data: Union[str, bytes], dtype: str="float64", shape: tuple=None, sep: str=None):
+    """
+    Parses text with numbers separated by whitespace (or by sep, eg. ",") into an array in bulk.
+    Raises a ValueError with the position of the first word which is not a number.
+    """
+    require_numpy()
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    if sep is not None:
+        data = data.replace(sep, " ")
+    with warnings.catch_warnings():
+        # NumPy warns instead of failing when it stops before the end of the text.
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            arr = np.fromstring(data, dtype=dtype, sep=" ")
+        except (DeprecationWarning, ValueError):
+            arr = None
+    if arr is None or (not FROMSTRING_WARNS and arr.size != len(data.split())):
+        words = data.split()
+        for i, word in enumerate(words):
+            try:
+                float(word)
+            except ValueError:
+                raise ValueError(f"Could not parse number {i} of the output: {word[:40]!r}") from None
+        arr = np.array(words, dtype=dtype)
+    if shape is not None:
+        if arr.size != int(np.prod(shape)):
+            raise ValueError(f"The output has {arr.size} numbers but the expected shape {tuple(shape)} needs {int(np.prod(shape))}!")
+        arr = arr.reshape(shape)
+    return arr
+
+def load_numbers(path: str, dtype: str="float64", shape: tuple=None, sep: str=None, binary: bool=False):
+    """
+    Loads the numbers in a file. If binary is True, the file is a raw dump of values of dtype
+    (eg. written with fwrite or numpy.tofile) and is read without parsing.
+    """
+    require_numpy()
+    if binary:
+        arr = np.fromfile(path, dtype=dtype)
+        if shape is not None:
+            if arr.size != int(np.prod(shape)):
+                raise ValueError(f"{path} has {arr.size} values but the expected shape {tuple(shape)} needs {int(np.prod(shape))}!")
+            arr = arr.reshape(shape)
+        return arr
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return parse_numbers(f.read(), dtype=dtype, shape=shape, sep=sep)
+
+def json_number(x):
+    # JSON has no NaN or infinity.
+    return x if x == x and x not in (float("inf"), float("-inf")) else str(x)
+
+class NumericComparison:
+    """
+    The result of comparing two arrays element by element. It is truthy if every element matched.
+
+    total counts the elements of the larger array, so missing or extra elements are mismatches.
+    first_mismatches holds (index, expected, actual) of up to max_report failing elements.
+    """
+    def __init__(self, total: int, matched: int, shape_expected: tuple, shape_actual: tuple,
+                 first_mismatches: list, max_abs_error: float, max_rel_error: float, mean_abs_error: float):
+        self.total = total
+        self.matched = matched
+        self.shape_expected = shape_expected
+        self.shape_actual = shape_actual
+        self.first_mismatches = first_mismatches
+        self.max_abs_error = max_abs_error
+        self.max_rel_error = max_rel_error
+        self.mean_abs_error = mean_abs_error
+
+    @property
+    def mismatches(self) -> int:
+        return self.total - self.matched
+
+    @property
+    def fraction(self) -> float:
+        return self.matched / self.total if self.total else 1.0
+
+    @property
+    def shape_matches(self) -> bool:
+        return self.shape_expected == self.shape_actual
+
+    def __bool__(self):
+        return self.mismatches == 0 and self.shape_matches
+
+    def score(self, max_score: float, threshold: float=0) -> float:
+        """
+        Returns the partial credit for the fraction of matching elements. Fractions below
+        threshold get no credit.
+        """
+        if self.fraction < threshold:
+            return 0
+        return max_score * self.fraction
+
+    def export(self) -> dict:
+        return {
+            "total": self.total,
+            "matched": self.matched,
+            "mismatches": self.mismatches,
+            "shape_expected": list(self.shape_expected),
+            "shape_actual": list(self.shape_actual),
+            "first_mismatches": [[list(i), json_number(e), json_number(a)] for i, e, a in self.first_mismatches],
+            "max_abs_error": json_number(self.max_abs_error),
+            "max_rel_error": json_number(self.max_rel_error),
+            "mean_abs_error": json_number(self.mean_abs_error),
+        }
+
+    def __str__(self):
+        if self:
+            return f"All {self.total} values match (max abs error {self.max_abs_error:.3g})."
+        lines = []
+        if not self.shape_matches:
+            lines.append(f"Expected shape {self.shape_expected} but got {self.shape_actual}.")
+        lines.append(f"{self.mismatches} of {self.total} values do not match.")
+        for index, expected, actual in self.first_mismatches:
+            where = index[0] if len(index) == 1 else index
+            lines.append(f"  at {where}: expected {expected!r} but got {actual!r}")
+        if self.mismatches > len(self.first_mismatches):
+            lines.append(f"  ... and {self.mismatches - len(self.first_mismatches)} more.")
+        lines.append(f"Max abs error {self.max_abs_error:.3g}, max rel error {self.max_rel_error:.3g}, mean abs error {self.mean_abs_error:.3g}.")
+        return "\n".join(lines)
+
+def compare_arrays(expected, actual, rel_tol: float=1e-9, abs_tol: float=0, equal_nan: bool=True, max_report: int=10) -> NumericComparison:
+    """
+    Compares two arrays (or anything numpy.asarray takes) with the same tolerances as
+    math.isclose: |a - e| <= max(rel_tol * max(|a|, |e|), abs_tol). If the shapes differ, the
+    values are compared in order as far as both go.
+    """
+    require_numpy()
+    expected, actual = np.asarray(expected), np.asarray(actual)
+    shape_expected, shape_actual = tuple(expected.shape), tuple(actual.shape)
+    total = max(expected.size, actual.size)
+    if shape_expected != shape_actual:
+        n = min(expected.size, actual.size)
+        e, a = expected.reshape(-1)[:n], actual.reshape(-1)[:n]
+        index_shape = (n,)
+    else:
+        e, a = expected, actual
+        index_shape = shape_expected
+    e = e.astype(np.float64, copy=False)
+    a = a.astype(np.float64, copy=False)
+    with np.errstate(invalid="ignore", over="ignore"):
+        abs_error = np.abs(a - e)
+        scale = np.maximum(np.abs(a), np.abs(e))
+        finite = np.isfinite(abs_error)
+        close = (a == e) | (finite & (abs_error <= np.maximum(rel_tol * scale, abs_tol)))
+        if equal_nan:
+            close |= np.isnan(a) & np.isnan(e)
+        errors = abs_error[finite]
+        rel_errors = (abs_error[finite] / np.where(scale[finite] > 0, scale[finite], 1))
+    matched = int(np.count_nonzero(close))
+    first = []
+    if matched < close.size and max_report > 0:
+        failing = np.flatnonzero(~close.reshape(-1))[:max_report]
+        for flat in failing:
+            index = tuple(int(i) for i in np.unravel_index(flat, index_shape))
+            first.append((index, e.reshape(-1)[flat].item(), a.reshape(-1)[flat].item()))
+    # Matching infinities and NaNs do not count as errors but mismatched ones do.
+    if (~close & ~finite).any():
+        max_abs, max_rel = float("inf"), float("inf")
+    else:
+        max_abs = float(errors.max()) if errors.size else 0.0
+        max_rel = float(rel_errors.max()) if rel_errors.size else 0.0
+    mean_abs = float(errors.mean()) if errors.size else 0.0
+    return NumericComparison(total, matched, shape_expected, shape_actual, first, max_abs, max_rel, mean_abs)
@@ -0,0 +1,232 @@
+"""
+This is the output buffer which the autograder, tests and rate limit print to.
+"""
+import threading
+from collections import deque
+
+if hasattr(str, "isascii"):
+    _isascii = str.isascii
+else:
+    # str.isascii needs Python 3.7.
+    def _isascii(s: str) -> bool:
+        return len(s.encode("utf-8")) == len(s)
+
+def _size(s: str) -> int:
+    if _isascii(s):
+        return len(s)
+    return len(s.encode("utf-8"))
+
+def _head(s: str, size: int) -> str:
+    if _isascii(s):
+        return s[:size]
+    return s.encode("utf-8")[:size].decode("utf-8", errors="ignore")
+
+def _tail(s: str, size: int) -> str:
+    if size <= 0:
+        return ""
+    if _isascii(s):
+        return s[-size:]
+    return s.encode("utf-8")[-size:].decode("utf-8", errors="ignore")
+
+class OutputBudget:
+    """
+    A cap on the total number of bytes retained by all of the output buffers which share it.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, size: int) -> int:
+        """
+        Reserves up to size bytes and returns how many bytes were actually reserved.
+        """
+        with self.lock:
+            granted = max(0, min(size, self.max_bytes - self.used))
+            self.used += granted
+            return granted
+
+    def release(self, size: int):
+        with self.lock:
+            self.used = max(0, self.used - size)
+
+class OutputBuffer:
+    """
+    Collects output in chunks so appending does not copy everything printed so far.
+
+    If max_bytes is set, only the first and last max_bytes / 2 bytes of the output are kept
+    and a marker with the number of truncated bytes is put between them. If a budget is
+    given, the bytes kept also count against it. The output is only joined into a string
+    when it is rendered and the rendered string is reused until something else is written.
+    """
+    def __init__(self, initial: str="", max_bytes: int=None, budget: OutputBudget=None):
+        self.lock = threading.RLock()
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self._reset()
+        self.write(initial)
+
+    def _reset(self):
+        self.head = []
+        self.head_size = 0
+        self.head_full = False
+        self.tail = deque()
+        self.tail_size = 0
+        self.tail_reserved = 0
+        self.truncated = 0
+        self.rendered = None
+
+    def _reserve(self, size: int) -> int:
+        if self.budget is None:
+            return size
+        return self.budget.reserve(size)
+
+    def _release(self, size: int):
+        if self.budget is not None and size > 0:
+            self.budget.release(size)
+
+    def head_cap(self) -> float:
+        if self.max_bytes is None:
+            return float("inf")
+        return self.max_bytes // 2
+
+    def tail_cap(self) -> float:
+        if self.max_bytes is None:
+            return float("inf")
+        return self.max_bytes - self.max_bytes // 2
+
+    def write(self, s: str):
+        if not s:
+            return self
+        s = str(s)
+        size = _size(s)
+        with self.lock:
+            self.rendered = None
+            if not self.head_full:
+                room = self._reserve(max(0, min(size, self.head_cap() - self.head_size)))
+                if room >= size:
+                    self.head.append(s)
+                    self.head_size += size
+                    return self
+                self.head_full = True
+                part = _head(s, room)
+                part_size = _size(part)
+                self._release(room - part_size)
+                if part:
+                    self.head.append(part)
+                    self.head_size += part_size
+                # Only what did not fit in the head goes into the tail.
+                s = s[len(part):]
+                size = _size(s)
+            self.tail.append(s)
+            self.tail_size += size
+            self.tail_reserved += self._reserve(max(0, min(self.tail_size, self.tail_cap()) - self.tail_reserved))
+            self._trim_tail(min(self.tail_cap(), self.tail_reserved))
+        return self
+
+    def _trim_tail(self, cap: int):
+        while self.tail_size > cap:
+            chunk = self.tail.popleft()
+            chunk_size = _size(chunk)
+            excess = self.tail_size - cap
+            if chunk_size <= excess:
+                self.tail_size -= chunk_size
+                self.truncated += chunk_size
+                continue
+            kept = _tail(chunk, chunk_size - excess)
+            kept_size = _size(kept)
+            self.tail.appendleft(kept)
+            self.tail_size -= chunk_size - kept_size
+            self.truncated += chunk_size - kept_size
+        if self.tail_reserved > self.tail_size and self.tail_reserved > cap:
+            self._release(self.tail_reserved - max(cap, self.tail_size))
+            self.tail_reserved = max(cap, self.tail_size)
+
+    def prepend(self, s: str):
+        """
+        Puts s in front of the output. This is not counted against any limits.
+        """
+        if not s:
+            return self
+        with self.lock:
+            self.rendered = None
+            self.head.insert(0, str(s))
+            self.head_size += _size(self.head[0])
+        return self
+
+    def replace(self, s: str=""):
+        """
+        Replaces everything in the buffer with s.
+        """
+        with self.lock:
+            self._release(self.head_size + self.tail_reserved)
+            self._reset()
+            self.write(s)
+        return self
+
+    def set_limits(self, max_bytes: int=None, budget: OutputBudget=None):
+        with self.lock:
+            value = self.getvalue()
+            self._release(self.head_size + self.tail_reserved)
+            self.max_bytes = max_bytes
+            self.budget = budget
+            self._reset()
+            self.write(value)
+        return self
+
+    def getvalue(self) -> str:
+        with self.lock:
+            if self.rendered is None:
+                head = "".join(self.head)
+                self.head = [head] if head else []
+                if self.truncated:
+                    self.rendered = head + f"\n[... {self.truncated} bytes truncated ...]\n" + "".join(self.tail)
+                else:
+                    self.rendered = head + "".join(self.tail)
+            return self.rendered
+
+    @staticmethod
+    def wrap(output, **kwargs) -> "OutputBuffer":
+        """
+        Converts whatever was assigned to an output attribute into an OutputBuffer.
+        """
+        if isinstance(output, OutputBuffer):
+            return output
+        if output is None:
+            output = ""
+        return OutputBuffer(str(output), **kwargs)
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+    def __repr__(self) -> str:
+        return f"OutputBuffer({self.getvalue()!r})"
+
+    def nbytes(self) -> int:
+        """
+        Returns the number of bytes kept (in UTF-8, without the truncation marker).
+        """
+        return self.head_size + self.tail_size
+
+    def __len__(self) -> int:
+        return len(self.getvalue())
+
+    def __bool__(self) -> bool:
+        return self.nbytes() > 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (str, OutputBuffer)):
+            return self.getvalue() == str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return id(self)
+
+    def __iadd__(self, other: str) -> "OutputBuffer":
+        return self.write(other)
+
+    def __add__(self, other: str) -> str:
+        return self.getvalue() + str(other)
+
+    def __radd__(self, other: str) -> str:
+        return str(other) + self.getvalue()
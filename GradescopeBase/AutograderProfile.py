@@ -0,0 +1,112 @@
+"""
+This measures the resources used by setups, tests and teardowns.
+"""
+import datetime
+import resource
+import threading
+import time
+
+# CPU time of the current thread so tests running in parallel are not counted together.
+# Children and peak RSS can only be measured for the whole process.
+_RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+class ResourceUsage:
+    """
+    Measures the wall time, CPU time (user/sys of the thread and of finished child processes)
+    and the growth of the peak RSS of the process while inside of the block.
+    """
+    def __init__(self):
+        self.wall_time = None
+        self.user_time = None
+        self.sys_time = None
+        self.children_user_time = None
+        self.children_sys_time = None
+        self.peak_rss_delta_kb = None
+
+    def __enter__(self):
+        self._start_wall = time.perf_counter()
+        self._start_self = resource.getrusage(_RUSAGE_THREAD)
+        self._start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._start_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return self
+
+    def __exit__(self, *args):
+        end_self = resource.getrusage(_RUSAGE_THREAD)
+        end_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.wall_time = time.perf_counter() - self._start_wall
+        self.user_time = end_self.ru_utime - self._start_self.ru_utime
+        self.sys_time = end_self.ru_stime - self._start_self.ru_stime
+        self.children_user_time = end_children.ru_utime - self._start_children.ru_utime
+        self.children_sys_time = end_children.ru_stime - self._start_children.ru_stime
+        self.peak_rss_delta_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self._start_peak
+        return False
+
+    def export(self) -> dict:
+        return {
+            "wall_time": round(self.wall_time, 6),
+            "user_time": round(self.user_time, 6),
+            "sys_time": round(self.sys_time, 6),
+            "children_user_time": round(self.children_user_time, 6),
+            "children_sys_time": round(self.children_sys_time, 6),
+            "peak_rss_delta_kb": self.peak_rss_delta_kb,
+        }
+
+class Profiler:
+    """
+    Collects the resource usage of every setup, test, subtest and teardown of a run. Tests and
+    subtests get theirs in extra_data["profile"], setups and teardowns get theirs in the extra_data
+    of the autograder and everything is written to profile_file (if set) once the run finishes.
+    """
+    def __init__(self, profile_file: str=None):
+        self.profile_file = profile_file
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, kind: str, name: str, usage: ResourceUsage, **extra) -> dict:
+        profile = usage.export()
+        with self.lock:
+            self.records.append(dict(kind=kind, name=name, **extra, **profile))
+        return profile
+
+    @staticmethod
+    def add_to_extra_data(obj, profile: dict):
+        if obj.extra_data is None:
+            obj.extra_data = {}
+        if isinstance(obj.extra_data, dict):
+            obj.extra_data["profile"] = profile
+
+    def record_test(self, test: "AutograderTest", usage: ResourceUsage, kind: str="test"):
+        profile = self.record(kind, test.name, usage, number=test.number)
+        subtests = getattr(test, "subtest_profiles", None)
+        if subtests:
+            profile["subtests"] = subtests
+        self.add_to_extra_data(test, profile)
+        return profile
+
+    def record_subtest(self, test: "AutograderTest", subtest: "AutograderTest", usage: ResourceUsage):
+        profile = self.record("subtest", subtest.name, usage, number=subtest.number, test=test.name)
+        self.add_to_extra_data(subtest, profile)
+        with self.lock:
+            if getattr(test, "subtest_profiles", None) is None:
+                test.subtest_profiles = []
+            test.subtest_profiles.append(dict(name=subtest.name, number=subtest.number, **profile))
+        return profile
+
+    def record_step(self, ag: "Autograder", kind: str, name: str, usage: ResourceUsage):
+        profile = self.record(kind, name, usage)
+        with self.lock:
+            steps = ag.extra_data.setdefault("profile", {}).setdefault(f"{kind}s", [])
+            steps.append(dict(name=name, **profile))
+        return profile
+
+    def dump(self, ag: "Autograder"):
+        if self.profile_file is None:
+            return self
+        data = {
+            "id": ag.extra_data.get("id"),
+            "created_at": datetime.datetime.now().isoformat(),
+            "execution_time": (datetime.datetime.now() - ag.start_time).total_seconds(),
+            "records": self.records,
+        }
+        ag.results_writer.dump(self.profile_file, data)
+        return self
@@ -1,10 +1,21 @@
+import bisect
 import datetime
+import functools
+import math
 import time
-from typing import List
+from typing import List, Optional, Tuple
 
 from . import Autograder
+from .AutograderOutput import OutputBuffer
 from .Utils import is_local
 
+@functools.lru_cache(maxsize=4096)
+def parse_submission_time(s: str) -> float:
+    """
+    Converts a Gradescope timestamp (eg. "2020-01-30T16:13:26.123456-08:00") to seconds since the epoch.
+    """
+    return time.mktime(time.strptime(s[:-13], "%Y-%m-%dT%H:%M:%S"))
+
 class RateLimit:
     def __init__(
         self,
@@ -24,7 +35,7 @@ class RateLimit:
         self.hours = hours
         self.days = days
         self.reset_time = reset_time
-        self.output = ""
+        self.output = OutputBuffer()
 
         self.pull_prev_run = pull_prev_run
 
@@ -38,6 +49,8 @@ class RateLimit:
         self.main_string = ""
         self.tokens_used = ""
 
+        self._submission_times = None
+
     def is_enabled(self):
         return not (self.tokens is None or self.tokens <= 0)
 
@@ -45,7 +58,7 @@ class RateLimit:
         msg = sep.join(map(str, args)) + end
         if also_stdout:
             print(msg)
-        self.output += msg
+        self.output.write(msg)
 
     def set_next_token_regen(self, oldest_token_time, current_submission_time):
         self.oldest_token_time = oldest_token_time
@@ -58,21 +71,12 @@ class RateLimit:
     def get_rate_limit_str(self, ag: Autograder):
         if not self.is_enabled():
             return ""
-        datetime_regen_rate = datetime.timedelta(seconds=self.total_seconds())
-        sub_to_count = None
-        if self.oldest_token_time:
-            sub_to_count = self.oldest_token_time
-        else:
-            if self.rate_limit_does_submission_count(ag):
-                sub_to_count = self.current_submission_time
-        
-
         tu = self.tokens_used
         if not self.rate_limit_does_submission_count(ag):
             tu -= 1
 
-        if sub_to_count is not None:
-            next_token_regen = sub_to_count + datetime_regen_rate
+        next_token_regen = self.get_next_token_regen(ag)
+        if next_token_regen is not None:
             next_token_regen_str = f"[Rate Limit]: As of this submission time, your next token will regenerate at {next_token_regen.ctime()} (PT).\n\n"
         else:
             next_token_regen_str = "[Rate Limit]: As of this submission time, you have not used any tokens!\n\n"
@@ -82,6 +86,92 @@ class RateLimit:
     def total_seconds(self):
         return self.seconds + 60 * (self.minutes + 60 * (self.hours + (24 * self.days)))
 
+    def get_submission_times(self, ag: Autograder) -> List[Tuple[float, int]]:
+        """
+        Returns the (time, index) of every previous submission sorted by time. The times are
+        parsed once per list of previous submissions.
+        """
+        prev_subs = ag.metadata["previous_submissions"]
+        if self._submission_times is None or self._submission_times[0] is not prev_subs:
+            times = sorted((parse_submission_time(v["submission_time"]), i) for i, v in enumerate(prev_subs))
+            self._submission_times = (prev_subs, times)
+        return self._submission_times[1]
+
+    def does_previous_submission_count(self, ag: Autograder, i: int, verbose: bool=False) -> Optional[bool]:
+        """
+        Returns if the previous submission used a token or None if it could not be checked, in
+        which case it is assumed to have used a token.
+        """
+        prev_sub = ag.metadata["previous_submissions"][i]
+        try:
+            if verbose:
+                print(prev_sub)
+                print(str(prev_sub.keys()))
+                print("Current submission data: " + str(prev_sub["results"]["extra_data"]))
+            ed = prev_sub["results"]["extra_data"]
+            if ed is not None:
+                subID = ed.get("id")
+                return (ed["sub_counts"] == 1) and bool(subID and (subID not in self.submission_id_exclude))
+            if verbose:
+                print(f"Extra data not available in previous submission {i}!")
+            return False
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            print(e)
+            return None
+
+    def get_counted_submissions(self, ag: Autograder, start_time: float, restart_time: float=None, verbose: bool=False) -> List[float]:
+        """
+        Returns the times of the previous submissions at or after start_time (and restart_time)
+        which used a token, in order. Submissions which could not be checked are assumed to
+        have used a token but their time is None since they do not decide when a token regenerates.
+        """
+        times = self.get_submission_times(ag)
+        if restart_time is not None and restart_time > start_time:
+            start_time = restart_time
+        lo = bisect.bisect_left(times, (start_time, -1))
+        if verbose and lo > 0:
+            print(f"Ignoring {lo} submission(s), too early!")
+        counted = []
+        for subm_time, i in times[lo:]:
+            if verbose:
+                print("Subm time: " + str(subm_time))
+                print("Tokens used: " + str(len(counted)))
+            counts = self.does_previous_submission_count(ag, i, verbose=verbose)
+            if counts is None:
+                counted.append(None)
+            elif counts:
+                counted.append(subm_time)
+            if verbose:
+                print("-" * 30)
+        return counted
+
+    def get_tokens_used(self, ag: Autograder, current_time: float, restart_time: float=None, verbose: bool=False) -> Tuple[int, float]:
+        """
+        Returns how many tokens are in use at current_time and the time the oldest of those
+        tokens was used (or None). Submissions within the last period use up a token.
+        """
+        window_start = math.floor(current_time - self.total_seconds()) + 1
+        counted = self.get_counted_submissions(ag, window_start, restart_time, verbose=verbose)
+        return len(counted), next((t for t in counted if t is not None), None)
+
+    def get_next_token_regen(self, ag: Autograder) -> datetime.datetime:
+        if self.oldest_token_time:
+            return self.oldest_token_time + datetime.timedelta(seconds=self.total_seconds())
+        if self.rate_limit_does_submission_count(ag):
+            return self.current_submission_time + datetime.timedelta(seconds=self.total_seconds())
+        return None
+
+    def get_policy_str(self, pretty_time: str) -> str:
+        return f"Students can get up to {self.tokens} graded submissions within any given period of {pretty_time}."
+
+    def get_usage_str(self, pretty_time: str) -> str:
+        return "In the last period, you have had {} graded submissions."
+
+    def get_no_tokens_str(self, tokens_used: int, pretty_time: str) -> str:
+        return f"You have already had {tokens_used} graded submissions within the last {pretty_time}"
+
     def rate_limit_main(self, ag: Autograder, verbose=None):
         if verbose is None:
             verbose = self.verbose
@@ -92,13 +182,6 @@ class RateLimit:
             return
         tokens = self.tokens
         restart_subm_string = self.reset_time
-        s = self.seconds
-        m = self.minutes
-        h = self.hours
-        d = self.days
-        regen_time_seconds = self.total_seconds()
-        def get_submission_time(s):
-            return s[:-13]
         def pretty_time_str(s, m, h, d):
             sstr = "" if s == 0 else str(s) + " second"
             sstr += "" if sstr == "" or s == 1 else "s"
@@ -116,70 +199,34 @@ class RateLimit:
             if st == "":
                 st = "none"
             return st
-        current_subm_string = get_submission_time(ag.metadata["created_at"])
-        current_time = time.strptime(current_subm_string,"%Y-%m-%dT%H:%M:%S")
-        restart_time = time.strptime(restart_subm_string, "%Y-%m-%dT%H:%M:%S") if restart_subm_string is not None else None
-        tokens_used = 0
+        pretty_time = pretty_time_str(self.seconds, self.minutes, self.hours, self.days)
+        current_time = parse_submission_time(ag.metadata["created_at"])
+        restart_time = time.mktime(time.strptime(restart_subm_string, "%Y-%m-%dT%H:%M:%S")) if restart_subm_string is not None else None
         if verbose:
             print("=" * 30)
-        oldest_counted_submission = None
-        for i, v in enumerate(ag.metadata["previous_submissions"]):
-            subm_string = get_submission_time(v["submission_time"])
-            subm_time = time.strptime(subm_string,"%Y-%m-%dT%H:%M:%S")
-            if restart_time is not None and time.mktime(subm_time) - time.mktime(restart_time) < 0:
-                if verbose:
-                    print("Ignoring a submission, too early!")
-                continue
-            if verbose:
-                print("Current time: " + str(time.mktime(current_time)))
-                print("Subm time: " + str(time.mktime(subm_time)))
-            if (time.mktime(current_time) - time.mktime(subm_time) < regen_time_seconds): 
-                try:
-                    if verbose:
-                        print(ag.metadata["previous_submissions"][i])
-                        print("Tokens used: " + str(tokens_used))
-                        print(str(ag.metadata["previous_submissions"][i].keys()))
-                        print("Current submission data: " + str(ag.metadata["previous_submissions"][i]["results"]["extra_data"]))
-                    ed = ag.metadata["previous_submissions"][i]["results"]["extra_data"]
-                    if ed is not None:
-                        subID = ed.get("id")
-                        if (ed["sub_counts"] == 1) and (subID and (subID not in self.submission_id_exclude)): 
-                            if oldest_counted_submission is None:
-                                oldest_counted_submission = subm_time
-                            tokens_used = tokens_used + 1
-                    else:
-                        if verbose:
-                            print(f"Extra data not available in previous submission {i}!")
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    print(e)
-                    tokens_used = tokens_used + 1
-                    pass
-            if verbose:
-                print("-" * 30)
+            print("Current time: " + str(current_time))
+        tokens_used, oldest_counted_submission = self.get_tokens_used(ag, current_time, restart_time, verbose=verbose)
         if verbose:
             print("=" * 30)
-        datetime_regen_rate = datetime.timedelta(seconds=regen_time_seconds)
-        if oldest_counted_submission:
-            oldest_counted_submission = datetime.datetime.fromtimestamp(time.mktime(oldest_counted_submission))
-        if current_time:
-            datetime_current_time = datetime.datetime.fromtimestamp(time.mktime(current_time))
+        if oldest_counted_submission is not None:
+            oldest_counted_submission = datetime.datetime.fromtimestamp(oldest_counted_submission)
+        datetime_current_time = datetime.datetime.fromtimestamp(current_time)
         if tokens_used < tokens:
             ag.extra_data["sub_counts"] = 1
             tokens_used += 1 # This is to include the current submission.
-            self.rate_limit_set_main_string(f"[Rate Limit]: Students can get up to {tokens} graded submissions within any given period of {pretty_time_str(s, m, h, d)}. In the last period, you have had {{}} graded submissions.\n", tokens_used)
+            self.rate_limit_set_main_string(f"[Rate Limit]: {self.get_policy_str(pretty_time)} {self.get_usage_str(pretty_time)}\n", tokens_used)
             self.set_next_token_regen(oldest_counted_submission, datetime_current_time)
         else:
             ag.extra_data["sub_counts"] = 0
+            self.set_next_token_regen(oldest_counted_submission, datetime_current_time)
             if self.pull_prev_run:
                 msg = ", so the results of your last graded submission are being displayed."
             else:
                 msg = "."
-            ag.print(f"[Rate Limit]: Students can get up to {tokens} graded submissions within any given period of {pretty_time_str(s, m, h, d)}. You have already had {tokens_used} graded submissions within the last {pretty_time_str(s, m, h, d)}{msg} Because you do not have any more tokens, this submission will not count as a graded submission.")
+            ag.print(f"[Rate Limit]: {self.get_policy_str(pretty_time)} {self.get_no_tokens_str(tokens_used, pretty_time)}{msg} Because you do not have any more tokens, this submission will not count as a graded submission.")
 
-            if oldest_counted_submission:
-                next_token_regen = oldest_counted_submission + datetime_regen_rate
+            next_token_regen = self.get_next_token_regen(ag)
+            if next_token_regen is not None:
                 ag.print(f"[Rate Limit]: As of this submission time, your next token will regenerate at {next_token_regen.ctime()} (PT).\n")
             else:
                 ag.print(f"[Rate Limit]: As of this submisison, you have not used any tokens.\n")
@@ -187,16 +234,15 @@ class RateLimit:
             if self.pull_prev_run:
                 prev_subs = ag.metadata["previous_submissions"]
                 prev_sub = prev_subs[len(prev_subs) - 1]
-                if prev_sub and "results" not in prev_sub or prev_sub["results"] and "tests" not in prev_sub["results"]:
+                pulled = self.get_submission_results(prev_sub)
+                if pulled is None:
                     ag.print("[ERROR]: Could not pull the data from your previous submission! This is probably due to it not have finished running!")
                     tests = []
                     ag.set_score(0)
                     leaderboard = None
                 else:
-                    res = prev_sub["results"]
-                    tests = res["tests"]
-                    leaderboard = res["leaderboard"]
-                    ag.set_score(prev_sub.get("score"))
+                    tests, leaderboard, score = pulled
+                    ag.set_score(score)
             else:
                     tests = []
                     ag.set_score(0)
@@ -208,10 +254,130 @@ class RateLimit:
             sys.exit()
             # raise AutograderHalt("Rate limited!")
 
+    @staticmethod
+    def get_submission_results(prev_sub) -> Optional[Tuple[list, list, float]]:
+        """
+        Returns the tests, leaderboard and score of a previous submission or None if it does not
+        have any results (eg. it has not finished running).
+        """
+        if prev_sub and "results" not in prev_sub or prev_sub["results"] and "tests" not in prev_sub["results"]:
+            return None
+        res = prev_sub["results"]
+        if res is None:
+            return None
+        return res["tests"], res.get("leaderboard"), prev_sub.get("score")
+
     @staticmethod
     def rate_limit_unset_submission(ag: Autograder):
         ag.extra_data["sub_counts"] = 0
 
     @staticmethod
     def rate_limit_does_submission_count(ag: Autograder):
-        return ag.extra_data["sub_counts"]
\ No newline at end of file
+        return ag.extra_data["sub_counts"]
+
+class TokenBucketRateLimit(RateLimit):
+    """
+    Students start with a bucket of `tokens` tokens. Every graded submission takes a token out
+    of the bucket and the bucket gains back one token per period, up to `tokens` tokens.
+    """
+    def get_tokens_used(self, ag: Autograder, current_time: float, restart_time: float=None, verbose: bool=False) -> Tuple[int, float]:
+        period = self.total_seconds()
+        available = self.tokens
+        last = None
+        for subm_time in self.get_counted_submissions(ag, float("-inf"), restart_time, verbose=verbose):
+            if subm_time is not None:
+                if last is not None and period > 0:
+                    available = min(self.tokens, available + (subm_time - last) / period)
+                last = subm_time
+            available = max(0, available - 1)
+        if last is not None and period > 0:
+            available = min(self.tokens, available + (current_time - last) / period)
+        self.available_tokens = available
+        self.current_time = current_time
+        return self.tokens - math.floor(available + 1e-9), None
+
+    def get_next_token_regen(self, ag: Autograder) -> datetime.datetime:
+        available = self.available_tokens
+        if self.rate_limit_does_submission_count(ag):
+            available -= 1
+        if available >= self.tokens:
+            return None
+        return datetime.datetime.fromtimestamp(self.current_time + (1 - (available - math.floor(available))) * self.total_seconds())
+
+    def get_policy_str(self, pretty_time: str) -> str:
+        return f"Students can hold up to {self.tokens} tokens and get back one token every {pretty_time}."
+
+    def get_usage_str(self, pretty_time: str) -> str:
+        return "You are currently using {} of your tokens."
+
+    def get_no_tokens_str(self, tokens_used: int, pretty_time: str) -> str:
+        return f"You have already used all {self.tokens} of your tokens"
+
+class LeakyBucketRateLimit(RateLimit):
+    """
+    Every graded submission goes into a bucket which holds up to `tokens` submissions. The
+    bucket leaks at a steady rate of `tokens` submissions per period, so submissions are
+    spread out over the period instead of being allowed in bursts after a quiet period.
+    """
+    def get_tokens_used(self, ag: Autograder, current_time: float, restart_time: float=None, verbose: bool=False) -> Tuple[int, float]:
+        rate = self.tokens / self.total_seconds() if self.total_seconds() > 0 else float("inf")
+        level = 0
+        last = None
+        for subm_time in self.get_counted_submissions(ag, float("-inf"), restart_time, verbose=verbose):
+            if subm_time is not None:
+                if last is not None:
+                    level = max(0, level - (subm_time - last) * rate)
+                last = subm_time
+            level += 1
+        if last is not None:
+            level = max(0, level - (current_time - last) * rate)
+        self.level = level
+        self.leak_rate = rate
+        self.current_time = current_time
+        return math.ceil(level - 1e-9), None
+
+    def get_next_token_regen(self, ag: Autograder) -> datetime.datetime:
+        level = self.level
+        if self.rate_limit_does_submission_count(ag):
+            level += 1
+        if level <= 0 or self.leak_rate == float("inf"):
+            return None
+        drained = level - (math.ceil(level - 1e-9) - 1)
+        return datetime.datetime.fromtimestamp(self.current_time + drained / self.leak_rate)
+
+    def get_policy_str(self, pretty_time: str) -> str:
+        return f"Students can have up to {self.tokens} graded submissions in the bucket, which empties at a steady rate of {self.tokens} submissions per {pretty_time}."
+
+    def get_usage_str(self, pretty_time: str) -> str:
+        return "You currently have {} graded submissions in the bucket."
+
+    def get_no_tokens_str(self, tokens_used: int, pretty_time: str) -> str:
+        return f"Your bucket already has {tokens_used} graded submissions in it"
+
+class DailyQuotaRateLimit(RateLimit):
+    """
+    Students can get up to `tokens` graded submissions each calendar day (in the time zone of
+    the autograder). The period arguments are ignored.
+    """
+    def get_day_start(self, t: float) -> float:
+        return time.mktime(datetime.datetime.fromtimestamp(t).date().timetuple())
+
+    def get_tokens_used(self, ag: Autograder, current_time: float, restart_time: float=None, verbose: bool=False) -> Tuple[int, float]:
+        counted = self.get_counted_submissions(ag, self.get_day_start(current_time), restart_time, verbose=verbose)
+        self.current_time = current_time
+        return len(counted), next((t for t in counted if t is not None), None)
+
+    def get_next_token_regen(self, ag: Autograder) -> datetime.datetime:
+        if not self.oldest_token_time and not self.rate_limit_does_submission_count(ag):
+            return None
+        today = datetime.datetime.fromtimestamp(self.current_time).date()
+        return datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time())
+
+    def get_policy_str(self, pretty_time: str) -> str:
+        return f"Students can get up to {self.tokens} graded submissions each day."
+
+    def get_usage_str(self, pretty_time: str) -> str:
+        return "Today, you have had {} graded submissions."
+
+    def get_no_tokens_str(self, tokens_used: int, pretty_time: str) -> str:
+        return f"You have already had {tokens_used} graded submissions today"
@@ -0,0 +1,353 @@
+"""
+This regrades a directory of exported submissions locally.
+
+Usage:
+    python -m GradescopeBase.AutograderRegrade SOURCE_DIR SUBMISSIONS_DIR OUTPUT_DIR [-j N] -- python3 run_tests.py
+    python -m GradescopeBase.AutograderRegrade SOURCE_DIR SUBMISSIONS_DIR OUTPUT_DIR [-j N] --fork-server run_tests:make_autograder
+
+Every folder in SUBMISSIONS_DIR is one submission which contains its own submission/ folder and
+submission_metadata.json.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+from .AutograderForkServer import SubmissionForkServer
+from .AutograderResultsWriter import ResultsWriter
+
+class Regrade:
+    """
+    Runs the autograder in source_dir on every submission in submissions_dir.
+
+    Each submission is graded in a working directory of its own (OUTPUT_DIR/work/NAME) which
+    holds a copy of the autograder source, the submission/ folder, the submission_metadata.json
+    and an empty results/ folder. The command is run inside of it with IS_LOCAL=true, so
+    root_dir(), submission_dir(), submission_metadata_dir() and results_path() all point into it.
+    Up to `workers` submissions are graded at the same time, each in its own process.
+
+    The results of every submission are saved to OUTPUT_DIR/results/NAME.json and its output to
+    OUTPUT_DIR/logs/NAME.log. Every finished submission is appended to OUTPUT_DIR/state.jsonl so
+    an interrupted regrade can be resumed by running it again: submissions which were already
+    graded are skipped (unless retry_failed is set and they failed). OUTPUT_DIR/summary.json
+    holds the outcome of every submission once the regrade finishes.
+
+    If factory is given (a function which returns the Autograder without running it, or
+    "module:function" of a module in source_dir), the command is not used. Instead, a fork
+    server loads the autograder and runs its warm setups once and every submission is graded
+    in a fork of it (see SubmissionForkServer).
+    """
+    def __init__(
+        self,
+        source_dir: str,
+        submissions_dir: str,
+        output_dir: str,
+        command: List[str]=None,
+        workers: int=None,
+        timeout: float=None,
+        retry_failed: bool=False,
+        keep_workdirs: bool=False,
+        verbose: bool=True,
+        factory=None,
+    ):
+        if not command and factory is None:
+            raise ValueError("You must give the command which runs the autograder or a factory for it!")
+        self.source_dir = os.path.abspath(source_dir)
+        self.submissions_dir = os.path.abspath(submissions_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.command = command
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.timeout = timeout
+        self.retry_failed = retry_failed
+        self.keep_workdirs = keep_workdirs
+        self.verbose = verbose
+        self.writer = ResultsWriter()
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.processes = {}
+        self.factory = factory
+        self.fork_server = None
+
+    def path(self, *parts) -> str:
+        return os.path.join(self.output_dir, *parts)
+
+    def get_submissions(self) -> List[str]:
+        names = []
+        for name in sorted(os.listdir(self.submissions_dir)):
+            path = os.path.join(self.submissions_dir, name)
+            if os.path.isdir(os.path.join(path, "submission")):
+                names.append(name)
+            elif self.verbose and os.path.isdir(path):
+                print(f"[Regrade]: Skipping {name} since it does not have a submission folder!")
+        return names
+
+    def load_state(self) -> dict:
+        """
+        Returns the latest record of every submission which finished in an earlier run.
+        """
+        state = {}
+        if not os.path.isfile(self.path("state.jsonl")):
+            return state
+        with open(self.path("state.jsonl"), "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                # The last line was cut short since the regrade was killed while writing it. It
+                # is dropped so the next record does not get appended to it.
+                data = data[:data.rfind(b"\n") + 1]
+                f.truncate(len(data))
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            state[record["name"]] = record
+        return state
+
+    def is_done(self, record: dict) -> bool:
+        if record is None or not os.path.isfile(self.path("results", f"{record['name']}.json")):
+            return False
+        return record["status"] == "ok" or not self.retry_failed
+
+    def save_record(self, record: dict):
+        with self.lock:
+            with open(self.path("state.jsonl"), "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def ignore_source_files(self, directory: str, names: List[str]) -> List[str]:
+        # The output or submissions may be inside of the source dir.
+        skip = {self.output_dir, self.submissions_dir}
+        return [n for n in names if os.path.abspath(os.path.join(directory, n)) in skip]
+
+    def prepare_workdir(self, name: str) -> str:
+        workdir = self.path("work", name)
+        if os.path.exists(workdir):
+            shutil.rmtree(workdir)
+        shutil.copytree(self.source_dir, workdir, symlinks=True, ignore=self.ignore_source_files)
+        src = os.path.join(self.submissions_dir, name)
+        for sub in ["submission", "results"]:
+            if os.path.exists(os.path.join(workdir, sub)):
+                shutil.rmtree(os.path.join(workdir, sub))
+        shutil.copytree(os.path.join(src, "submission"), os.path.join(workdir, "submission"), symlinks=True)
+        if os.path.isfile(os.path.join(src, "submission_metadata.json")):
+            shutil.copy2(os.path.join(src, "submission_metadata.json"), os.path.join(workdir, "submission_metadata.json"))
+        os.makedirs(os.path.join(workdir, "results"))
+        return workdir
+
+    def get_env(self) -> dict:
+        env = dict(os.environ)
+        env["IS_LOCAL"] = "true"
+        return env
+
+    def run_command(self, name: str, workdir: str, log) -> tuple:
+        """
+        Runs the command in the workdir and returns its return code and whether it timed out.
+        """
+        if self.fork_server is not None:
+            return self.fork_server.grade(workdir, log.name, timeout=self.timeout)
+        proc = subprocess.Popen(
+            self.command,
+            cwd=workdir,
+            env=self.get_env(),
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        with self.lock:
+            self.processes[name] = proc
+        try:
+            proc.wait(timeout=self.timeout)
+            return proc.returncode, False
+        except subprocess.TimeoutExpired:
+            self.kill(proc)
+            proc.wait()
+            return proc.returncode, True
+        finally:
+            with self.lock:
+                self.processes.pop(name, None)
+
+    @staticmethod
+    def kill(proc: subprocess.Popen):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def grade(self, name: str) -> dict:
+        record = {
+            "name": name,
+            "started_at": datetime.datetime.now().isoformat(),
+        }
+        start = time.monotonic()
+        workdir = None
+        try:
+            workdir = self.prepare_workdir(name)
+            with open(self.path("logs", f"{name}.log"), "wb") as log:
+                returncode, timed_out = self.run_command(name, workdir, log)
+            record["returncode"] = returncode
+            results_file = os.path.join(workdir, "results", "results.json")
+            if timed_out:
+                record["status"] = "timeout"
+            elif not os.path.isfile(results_file):
+                record["status"] = "no_results"
+            else:
+                with open(results_file, "rb") as f:
+                    data = f.read()
+                try:
+                    results = json.loads(data)
+                    record["status"] = "ok"
+                    record["score"] = self.get_score(results)
+                    record["execution_time"] = results.get("execution_time")
+                except ValueError:
+                    record["status"] = "invalid_results"
+                self.writer.write(self.path("results", f"{name}.json"), data)
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+        finally:
+            if workdir is not None and not self.keep_workdirs:
+                shutil.rmtree(workdir, ignore_errors=True)
+        record["elapsed"] = round(time.monotonic() - start, 3)
+        return record
+
+    @staticmethod
+    def get_score(results: dict):
+        """
+        Gradescope uses the sum of the scores of the tests if the results do not have a score.
+        """
+        if results.get("score") is not None:
+            return results["score"]
+        scores = [t.get("score") for t in results.get("tests") or []]
+        if not any(isinstance(score, (int, float)) for score in scores):
+            return None
+        return sum(score for score in scores if isinstance(score, (int, float)))
+
+    def stop(self):
+        """
+        Stops grading new submissions and kills the ones being graded.
+        """
+        with self.lock:
+            self.stopping = True
+            for proc in self.processes.values():
+                self.kill(proc)
+        if self.fork_server is not None:
+            self.fork_server.kill_all()
+
+    def write_summary(self, state: dict, names: List[str]):
+        records = [state[name] for name in names if name in state]
+        counts = {}
+        for record in records:
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+        scores = [r["score"] for r in records if r["status"] == "ok" and isinstance(r.get("score"), (int, float))]
+        summary = {
+            "created_at": datetime.datetime.now().isoformat(),
+            "source_dir": self.source_dir,
+            "submissions_dir": self.submissions_dir,
+            "command": self.command,
+            "factory": self.factory if isinstance(self.factory, str) else None,
+            "total": len(names),
+            "finished": len(records),
+            "counts": counts,
+            "mean_score": sum(scores) / len(scores) if scores else None,
+            "submissions": records,
+        }
+        self.writer.dump(self.path("summary.json"), summary)
+        return summary
+
+    def run(self) -> dict:
+        for sub in ["results", "logs", "work"]:
+            os.makedirs(self.path(sub), exist_ok=True)
+        names = self.get_submissions()
+        state = self.load_state()
+        todo = [name for name in names if not self.is_done(state.get(name))]
+        if self.verbose:
+            print(f"[Regrade]: {len(names)} submissions, {len(names) - len(todo)} already graded, {len(todo)} to grade with {self.workers} workers.")
+
+        def grade(name: str):
+            if self.stopping:
+                return None
+            return self.grade(name)
+
+        if self.factory is not None and todo:
+            self.fork_server = SubmissionForkServer(self.source_dir, self.factory)
+            if not self.fork_server.start():
+                raise RuntimeError("The fork server could not load the autograder or one of its warm setups failed!")
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {pool.submit(grade, name): name for name in todo}
+            for i, future in enumerate(as_completed(futures)):
+                record = future.result()
+                if record is None:
+                    continue
+                if self.stopping:
+                    # The submission was killed part way through so it is graded again next time.
+                    continue
+                self.save_record(record)
+                state[record["name"]] = record
+                if self.verbose:
+                    print(f"[Regrade]: ({i + 1}/{len(todo)}) {record['name']}: {record['status']} (score: {record.get('score')}, {record['elapsed']}s)")
+                    if "error" in record:
+                        print(f"[Regrade]: {record['error']}")
+        except KeyboardInterrupt:
+            print("[Regrade]: Interrupted! Run the regrade again to resume it.")
+            self.stop()
+            raise
+        finally:
+            self.stop()
+            pool.shutdown(wait=True)
+            if self.fork_server is not None:
+                self.fork_server.stop()
+                self.fork_server = None
+            summary = self.write_summary(state, names)
+        if self.verbose:
+            print(f"[Regrade]: Finished {summary['finished']}/{summary['total']} submissions: {summary['counts']}")
+        return summary
+
+def main(argv: List[str]=None):
+    parser = argparse.ArgumentParser(
+        description="Regrades a directory of exported submissions locally.",
+        usage="%(prog)s [options] SOURCE_DIR SUBMISSIONS_DIR OUTPUT_DIR -- COMMAND...",
+    )
+    parser.add_argument("source_dir", help="The autograder source (what would be in /autograder/source).")
+    parser.add_argument("submissions_dir", help="A folder with one folder per submission containing submission/ and submission_metadata.json.")
+    parser.add_argument("output_dir", help="Where the results, logs and summary are written.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="How many submissions to grade at once (default: the number of CPUs).")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds after which a submission is killed.")
+    parser.add_argument("--retry-failed", action="store_true", help="Grade submissions which failed in an earlier run again.")
+    parser.add_argument("--keep-workdirs", action="store_true", help="Do not delete the working directory of each submission.")
+    parser.add_argument("--fork-server", metavar="MODULE:FUNCTION", default=None, help="Grade in forks of the autograder returned by this function of the source instead of running a command.")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    if argv is None:
+        argv = sys.argv[1:]
+    split = argv.index("--") if "--" in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+    command = argv[split + 1:]
+    if not command and args.fork_server is None:
+        parser.error("You must give the command which runs the autograder after -- (or use --fork-server)!")
+    regrade = Regrade(
+        args.source_dir,
+        args.submissions_dir,
+        args.output_dir,
+        command,
+        workers=args.workers,
+        timeout=args.timeout,
+        retry_failed=args.retry_failed,
+        keep_workdirs=args.keep_workdirs,
+        verbose=not args.quiet,
+        factory=args.fork_server,
+    )
+    summary = regrade.run()
+    return 0 if summary["finished"] == summary["total"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+This lets the autograder reuse the results of identical submissions.
+"""
+import functools
+import hashlib
+import json
+import os
+from typing import Optional, Tuple
+
+from .AutograderRateLimit import RateLimit
+from .AutograderSubmission import SubmissionManifest
+from .Utils import VERSION, root_dir, submission_dir, results_path
+
+class ResultCache:
+    """
+    Reuses the results of a previous submission when the files of this submission are identical
+    to it and the autograder has not changed.
+
+    The key of a submission is a hash of every file in the submission (see
+    Autograder.submission) together with the GradescopeBase version and the version of the autograder, which is a hash of the python files
+    in root_dir() unless one is given. Once the tests ran without an error (and the submission was
+    not rate limited), the key is saved in the extra_data of the results together with a graded
+    marker so later submissions can find it in metadata["previous_submissions"]. Submissions
+    without the marker are never reused. If cache_dir is set, results are also saved there under the key.
+
+    Token counting (sub_counts):
+    - By default, the cache is checked before the rate limit. A hit does not use up a token, since
+      nothing was graded, and it is shown even if the student is out of tokens.
+    - If consume_token is True, the rate limit is checked first as usual (so students who are out
+      of tokens are limited before the cache is checked) and a hit uses up a token like any other
+      graded submission.
+    """
+    def __init__(
+        self,
+        cache_dir: str=None,
+        version: str=None,
+        use_previous_submissions: bool=True,
+        consume_token: bool=False,
+        key_name: str="submission_hash",
+    ):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.use_previous_submissions = use_previous_submissions
+        self.consume_token = consume_token
+        self.key_name = key_name
+        self.graded_name = f"{key_name}_graded"
+        self.key = None
+
+    @staticmethod
+    def hash_dir(h, base: str, filter_fn=None, skip_dirs=()):
+        skip_dirs = {os.path.abspath(d) for d in skip_dirs}
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames[:] = sorted(d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in skip_dirs)
+            for filename in sorted(filenames):
+                if filter_fn is not None and not filter_fn(filename):
+                    continue
+                path = os.path.join(dirpath, filename)
+                h.update(os.path.relpath(path, base).encode("utf-8", errors="surrogateescape") + b"\0")
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+                h.update(b"\0")
+        return h
+
+    def get_version(self) -> str:
+        if self.version is not None:
+            return self.version
+        skip_dirs = [submission_dir(), os.path.dirname(results_path())]
+        if self.cache_dir is not None:
+            skip_dirs.append(self.cache_dir)
+        return hash_source(os.path.abspath(root_dir()), tuple(os.path.abspath(d) for d in skip_dirs))
+
+    def get_key(self, ag: "Autograder"=None) -> str:
+        if self.key is None:
+            manifest = ag.submission if ag is not None else SubmissionManifest()
+            h = hashlib.sha256()
+            h.update(f"GradescopeBase {VERSION}\0{self.get_version()}\0".encode("utf-8"))
+            h.update(manifest.hash().encode("ascii"))
+            self.key = h.hexdigest()
+        return self.key
+
+    def cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def lookup(self, ag: "Autograder") -> Optional[Tuple[list, list, float]]:
+        """
+        Returns the tests, leaderboard and score of an identical submission or None.
+        """
+        key = self.get_key(ag)
+        if self.use_previous_submissions and ag.metadata is not None:
+            prev_subs = ag.metadata.get("previous_submissions") or []
+            for i in range(len(prev_subs) - 1, -1, -1):
+                prev_sub = prev_subs[i]
+                try:
+                    ed = prev_sub["results"]["extra_data"]
+                except (KeyError, TypeError):
+                    continue
+                if not ed or ed.get(self.key_name) != key or ed.get(self.graded_name) is not True:
+                    continue
+                res = RateLimit.get_submission_results(prev_sub)
+                if res is not None:
+                    return res
+        if self.cache_dir is not None and os.path.isfile(self.cache_path(key)):
+            try:
+                with open(self.cache_path(key), "r") as f:
+                    results = json.load(f)
+                return results.get("tests", []), results.get("leaderboard"), results.get("score")
+            except Exception as e:
+                print(f"[Cache]: Could not read the cached results for {key}: {e}")
+        return None
+
+    def try_reuse(self, ag: "Autograder") -> Optional[Tuple[list, list, float]]:
+        """
+        Returns the results to reuse if there is a hit.
+        """
+        res = self.lookup(ag)
+        if res is None:
+            return None
+        if not self.consume_token and ag.rate_limit.is_enabled():
+            ag.rate_limit.rate_limit_unset_submission(ag)
+        ag.extra_data["cached"] = True
+        ag.print("[Cache]: This submission is identical to a previous submission so its results are being reused.")
+        return res
+
+    def mark_graded(self, ag: "Autograder"):
+        """
+        Saves the key of the submission once it has results which can be reused.
+        """
+        ag.extra_data[self.key_name] = self.get_key(ag)
+        ag.extra_data[self.graded_name] = True
+        return self
+
+    def store(self, ag: "Autograder", results: dict):
+        if self.cache_dir is None:
+            return self
+        os.makedirs(self.cache_dir, exist_ok=True)
+        ag.results_writer.dump(self.cache_path(self.get_key(ag)), results)
+        return self
+
+@functools.lru_cache(maxsize=8)
+def hash_source(root: str, skip_dirs: tuple) -> str:
+    """
+    Returns a hash of the python files of the autograder. It is only computed once per process.
+    """
+    h = hashlib.sha256()
+    ResultCache.hash_dir(h, root, filter_fn=lambda f: f.endswith(".py"), skip_dirs=skip_dirs)
+    return h.hexdigest()
@@ -0,0 +1,91 @@
+"""
+This handles writing the results json to disk.
+"""
+import json
+import os
+import tempfile
+import time
+
+class ResultsWriter:
+    """
+    Writes the results of the autograder to the results file.
+
+    Every write goes to a temporary file which then replaces the results file so a run
+    which is killed part way through always leaves a valid results file behind. When
+    checkpointing after tests, only the tests which have finished since the last
+    checkpoint are serialized again and checkpoints can be limited to at most one every
+    min_interval seconds or every_n_tests tests.
+    """
+    def __init__(self, min_interval: float=0, every_n_tests: int=1):
+        self.min_interval = min_interval
+        self.every_n_tests = every_n_tests
+        self.fragments = {}
+        self.finished_since_checkpoint = 0
+        self.last_checkpoint = None
+
+    @staticmethod
+    def encode(data) -> bytes:
+        return json.dumps(data, ensure_ascii=False).encode("ascii", errors="backslashreplace")
+
+    def write(self, path: str, data: bytes):
+        # The temporary file is unique so threads (and forked processes) writing at once do not share it.
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory)
+        try:
+            # mkstemp makes the file readable only by its owner, unlike open.
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self
+
+    def dump(self, path: str, results: dict):
+        return self.write(path, self.encode(results))
+
+    def test_finished(self, test: "AutograderTest"):
+        self.fragments.pop(id(test), None)
+        self.finished_since_checkpoint += 1
+        return self
+
+    def should_checkpoint(self) -> bool:
+        if self.finished_since_checkpoint == 0:
+            return False
+        if self.every_n_tests is not None and self.finished_since_checkpoint < self.every_n_tests:
+            return False
+        if self.last_checkpoint is not None and time.monotonic() - self.last_checkpoint < self.min_interval:
+            return False
+        return True
+
+    def get_fragment(self, test: "AutograderTest") -> bytes:
+        fragment = self.fragments.get(id(test))
+        if fragment is None:
+            res = test.get_results()
+            fragment = self.encode(res) if res else b""
+            self.fragments[id(test)] = fragment
+        return fragment
+
+    def checkpoint(self, ag: "Autograder"):
+        """
+        Writes the current (partial) results of the autograder. If the autograder modifies its
+        results, the full results have to be generated since the modifier expects all of them.
+        """
+        self.finished_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+        if ag.modify_results is not None and ag.modify_results is not ag.default_modify_results:
+            ag.generate_results(print_main_score_warning_error=False)
+            return self
+        fragments = [f for f in (self.get_fragment(test) for test in ag.get_ordered_tests()) if f]
+        has_score = any(test.get_score() is not None for test in ag.tests)
+        results = ag.get_results_summary(has_tests=bool(fragments), has_score=has_score, print_main_score_warning_error=False)
+        data = self.encode(results)
+        if fragments:
+            tests = b'"tests": [' + b", ".join(fragments) + b"]"
+            if data == b"{}":
+                data = b"{" + tests + b"}"
+            else:
+                data = data[:-1] + b", " + tests + b"}"
+        self.write(ag.results_file, data)
+        return self
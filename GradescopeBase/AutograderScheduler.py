@@ -0,0 +1,225 @@
+"""
+This fits setups, tests and teardowns into a time budget.
+"""
+import datetime
+import threading
+
+# How long is kept at the very end to write the results, even after the teardowns.
+RESULTS_RESERVE = 1
+
+def test_key(test) -> str:
+    """
+    Returns the key of a test (or of the results of a test) in the durations and previous results.
+    """
+    if isinstance(test, dict):
+        name, number = test.get("name"), test.get("number")
+    else:
+        name, number = test.name, test.number
+    return f"{number} {name}" if number is not None else str(name)
+
+def previous_durations(metadata, key: str="durations") -> dict:
+    """
+    Returns the durations recorded in the extra_data of the latest previous submission which has them.
+    """
+    if metadata is None:
+        return {}
+    prev_subs = metadata.get("previous_submissions") or []
+    for i in range(len(prev_subs) - 1, -1, -1):
+        try:
+            durations = prev_subs[i]["results"]["extra_data"][key]
+        except (KeyError, TypeError):
+            continue
+        if isinstance(durations, dict):
+            return durations
+    return {}
+
+class Scheduler:
+    """
+    Keeps a run of the autograder within time_budget seconds (since the autograder started).
+
+    Before a test starts, it gets a timeout from the time left (minus reserve, which is kept for
+    the teardowns and the results). Every remaining test is given the time it took in the
+    previous submission (its cost, if it ran before) and whatever time is left over is split
+    between them by their max_score. If the time left is not enough for everything, a test gets its cost as long as it
+    fits. A test which does not fit anymore is skipped with a message. The timeout of a test only
+    ever gets shorter. Setups and teardowns are capped to the time left as well. Since a timeout
+    can not stop a sync test on a worker thread, the autograder runs sync tests on the main thread
+    while it has a scheduler, unless they are isolated (see Autograder.get_test_batches).
+
+    The durations of this run are saved in extra_data["durations"] for the next submission. Costs
+    can also be given with history (eg. from a run of the reference solution), in the same format.
+    """
+    def __init__(self, time_budget: float, reserve: float=10, history: dict=None, min_timeout: float=1):
+        self.time_budget = time_budget
+        self.reserve = reserve
+        self.history = history
+        self.min_timeout = min_timeout
+        self.lock = threading.Lock()
+        self.ag = None
+        self.pending = {}
+        self.timeouts = {}
+        self.durations = {"tests": {}, "teardowns": {}}
+
+    def start(self, ag: "Autograder"):
+        self.ag = ag
+        history = self.history if self.history is not None else previous_durations(ag.metadata)
+        self.costs = dict(history.get("tests") or {})
+        self.teardown_costs = dict(history.get("teardowns") or {})
+        # Keep the old durations of tests which do not run this time.
+        self.durations = {"tests": dict(self.costs), "teardowns": dict(self.teardown_costs)}
+        self.pending = {id(test): test for test in ag.tests if not test.reused}
+        return self.save()
+
+    def save(self):
+        # This is set again every time since tests in a fork server send back the extra_data of the autograder.
+        self.ag.extra_data["durations"] = self.durations
+        return self
+
+    def elapsed(self) -> float:
+        return (datetime.datetime.now() - self.ag.start_time).total_seconds()
+
+    def remaining(self) -> float:
+        return self.time_budget - self.elapsed()
+
+    def available(self) -> float:
+        """
+        Returns how long the tests may still take.
+        """
+        teardowns = sum(self.teardown_costs.get(t.name, 0) for t in self.ag.teardowns)
+        return self.remaining() - max(self.reserve, teardowns + RESULTS_RESERVE)
+
+    def estimate(self, test: "AutograderTest") -> float:
+        # Tests which did not run before only need min_timeout to fit.
+        return self.costs.get(test_key(test), 0)
+
+    @staticmethod
+    def weight(test: "AutograderTest") -> float:
+        return test.max_score if test.max_score else 1
+
+    def allot(self, test: "AutograderTest") -> float:
+        """
+        Returns the timeout of a test which is about to start or None if it does not fit.
+        """
+        available = self.available()
+        pending = list(self.pending.values())
+        cost = self.estimate(test)
+        if available < max(self.min_timeout, cost):
+            return None
+        costs = sum(self.estimate(t) for t in pending)
+        slack = available - costs
+        if slack >= 0:
+            timeout = cost + slack * self.weight(test) / sum(self.weight(t) for t in pending)
+        else:
+            timeout = min(available, max(cost, self.min_timeout))
+        if test.timeout is not None:
+            timeout = min(timeout, test.timeout)
+        return timeout
+
+    def begin(self, test: "AutograderTest") -> bool:
+        """
+        Gives the test its timeout before it runs. Returns False if the test was skipped instead.
+        """
+        with self.lock:
+            timeout = self.allot(test)
+            self.pending.pop(id(test), None)
+            if timeout is None:
+                self.skip(test)
+                return False
+            self.timeouts[id(test)] = (test.timeout, timeout)
+            test.timeout = timeout
+        return True
+
+    def end(self, test: "AutograderTest"):
+        with self.lock:
+            original, timeout = self.timeouts.pop(id(test), (test.timeout, None))
+            test.timeout = original
+            if test.execution_time is not None:
+                self.durations["tests"][test_key(test)] = round(test.execution_time, 3)
+            self.save()
+        if timeout is not None and (original is None or timeout < original) and test.execution_time is not None and test.execution_time >= timeout:
+            test.print(f"[Time Budget]: This test only had {timeout:.2f} seconds to fit the time budget of the autograder.")
+        return self
+
+    def skip(self, test: "AutograderTest"):
+        test.ran = True
+        test.completed = False
+        test.print("[Time Budget]: This test was skipped since there was not enough time left to run it!")
+        if not test.do_not_set_score:
+            test.set_score(0)
+
+    def run_step(self, step, available: float) -> bool:
+        """
+        Runs a setup or teardown with its timeout capped to the time available.
+        """
+        if available <= 0:
+            print(f"[Error]: ({step.name}) There is no time left in the time budget to run it!")
+            return False
+        original = step.timeout
+        step.timeout = available if original is None else min(original, available)
+        try:
+            return step.run(self.ag)
+        finally:
+            step.timeout = original
+
+    def run_setup(self, setup: "AutograderSetup") -> bool:
+        return self.run_step(setup, self.available())
+
+    def run_teardown(self, teardown: "AutograderTeardown") -> bool:
+        # Teardowns always get to run, even if a test which could not be interrupted went over.
+        res = self.run_step(teardown, max(self.remaining() - RESULTS_RESERVE, self.min_timeout))
+        if teardown.execution_time is not None:
+            self.durations["teardowns"][teardown.name] = round(teardown.execution_time, 3)
+        self.save()
+        return res
+
+def previous_test_results(metadata) -> dict:
+    """
+    Returns the results of the tests of the latest previous submission which has results by their key.
+    """
+    if metadata is None:
+        return {}
+    prev_subs = metadata.get("previous_submissions") or []
+    for i in range(len(prev_subs) - 1, -1, -1):
+        try:
+            tests = prev_subs[i]["results"]["tests"]
+        except (KeyError, TypeError):
+            continue
+        if isinstance(tests, list):
+            return {test_key(t): t for t in tests if isinstance(t, dict)}
+    return {}
+
+def order_by_history(ag: "Autograder", tests: list) -> list:
+    """
+    Orders tests by the previous submission: tests which failed last time run first, then tests
+    which did not run last time and then tests which passed. Within each group, cheaper tests
+    (by their durations, see Scheduler) run first. Only serial tests stay where they were declared
+    so they still see every test declared before them as finished; every other test (eg. a test
+    with a timeout, which runs on the main thread) is reordered.
+    """
+    previous = previous_test_results(ag.metadata)
+    durations = previous_durations(ag.metadata).get("tests") or {}
+    if not previous and not durations:
+        return list(tests)
+
+    def group(test) -> int:
+        res = previous.get(test_key(test))
+        if res is None or res.get("score") is None:
+            return 1
+        max_score = res.get("max_score")
+        failed = float(res["score"]) < float(max_score) if max_score is not None else float(res["score"]) <= 0
+        return 0 if failed else 2
+
+    def sort_key(test):
+        return group(test), durations.get(test_key(test), 0)
+
+    ordered = []
+    segment = []
+    for test in tests:
+        if not test.serial:
+            segment.append(test)
+            continue
+        ordered += sorted(segment, key=sort_key)
+        segment = []
+        ordered.append(test)
+    ordered += sorted(segment, key=sort_key)
+    return ordered
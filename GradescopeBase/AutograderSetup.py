@@ -6,30 +6,42 @@
  * @Last Modified time: 2020-01-23 21:00:55
  */
 """
+from .AutograderProfile import ResourceUsage
 from .Timeout import Timeout
 from .Utils import WhenToRun
 
 global_setups = []
 
 class AutograderSetup:
-    def __init__(self, setupfn, name, timeout: int=None, when_to_run: WhenToRun=WhenToRun.BOTH):
+    def __init__(self, setupfn, name, timeout: float=None, when_to_run: WhenToRun=WhenToRun.BOTH, warm: bool=False):
+        """
+        Warm setups only run once in a fork server (see AutograderForkServer) and every
+        submission graded by it starts from their result.
+        """
         self.setupfn = setupfn
         self.name = name
         self.timeout = timeout
         self.when_to_run = when_to_run
+        self.warm = warm
+        self.execution_time = None
         global_setups.append(self)
 
     def run(self, ag: "Autograder"):
         success = False
         def f():
             nonlocal success
+            timeout = Timeout(self.timeout)
             try:
-                with Timeout(self.timeout):
+                with timeout:
                     success = self.setupfn(ag)
             except Timeout.Timeout:
-                print(f"The setup {self.name} has timed out!")
+                if not timeout.expired:
+                    raise
+                print(f"The setup {self.name} has timed out after {timeout.elapsed:.2f} seconds!")
                 ag.print("[ERROR]: A setup step timed out!")
                 success = False
+            finally:
+                self.execution_time = timeout.elapsed
 
         def handler(exception):
             nonlocal success
@@ -37,6 +49,11 @@ class AutograderSetup:
             print(f"The setup {self.name} has encountered an error!")
             ag.print("[Error]: An unexpected error occured in the Autograder when attempting to run a setup of the Autograder! Please contact a TA if this persists.")
 
-        ag.safe_env(f, handler=handler)
+        usage = ResourceUsage()
+        with usage:
+            ag.safe_env(f, handler=handler)
+        profiler = getattr(ag, "profiler", None)
+        if profiler is not None:
+            profiler.record_step(ag, "setup", self.name, usage)
         return success
     
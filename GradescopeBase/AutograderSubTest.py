@@ -6,12 +6,18 @@
  * @Last Modified time: 2020-01-30 16:17:58
  */
 """
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .AutograderOutput import OutputBuffer
+from .AutograderProfile import ResourceUsage
 from .AutograderTest import AutograderTest
 from .Autograder import Autograder, AutograderSafeEnvError
 from . import Visibility
 from typing import Callable, List
 from .AutograderErrors import AutograderFormatError
-from .Utils import NoneLooseVersion
+from .Utils import NoneLooseVersion, run_coroutine
 
 SUB_TESTS_KEY = "sub_tests"
 ISPASSFAIL = True
@@ -30,10 +36,12 @@ class AutograderSubTest(AutograderTest):
         extra_data=None,
         kill_autograder_on_error: bool=False,
         do_not_set_score: bool=False,
-        timeout: int=None,
+        timeout: float=None,
         ceil: bool=True,
         floor: bool=True,
         do_not_override_test_fn: bool=False,
+        max_output_bytes: int=None,
+        isolate: bool=False,
     ):
         self.test = test
         self.test_fn = test_fn
@@ -43,12 +51,16 @@ class AutograderSubTest(AutograderTest):
         self.tags = tags
         self.extra_data = extra_data
         self.score = score
-        self.output = ""
+        self.max_output_bytes = max_output_bytes
+        self.output = OutputBuffer(max_bytes=max_output_bytes)
         self.kill_autograder_on_error = kill_autograder_on_error
         self.do_not_set_score = do_not_set_score
         self.timeout = timeout
         self.ceil = ceil
         self.floor = floor
+        # With isolate, only this subtest runs in a worker process (see IsolationPool).
+        self.isolate = isolate
+        self.completed = False
         test_case_has_test_runner_fn = False
         if issubclass(type(test.test_fn), SubTestRunner):
             test_case_has_test_runner_fn = True
@@ -68,6 +80,10 @@ class AutograderSubTest(AutograderTest):
             return
         return super().set_score(score)
 
+    def record_usage(self, ag, usage: ResourceUsage):
+        # The SubTestRunner records the usage of subtests.
+        pass
+
     def passed(self):
         if self.score is True or self.score == self.max_score:
             return True
@@ -93,10 +109,26 @@ class SubTestRunner(object):
         self,
         is_pass_fail: bool=True,
         pass_fail_ratio: float=1,
+        parallel: int=None,
+        short_circuit: bool=False,
+        async_concurrency: int=None,
     ):
+        """
+        If parallel is set, up to that many subtests run at the same time on threads. The output
+        and the order of the hooks are the same as when they run one at a time, except that
+        run_test runs on the threads. The timeouts of subtests on those threads only fail them
+        once they finished (see Timeout), so use isolate on subtests which may run for too long.
+        Otherwise, consecutive async subtests run together on one event loop, up to
+        async_concurrency (by default the async_concurrency of the autograder) at a time.
+        If short_circuit is set (and is_pass_fail is True), the remaining subtests are skipped once
+        whether the test passes can no longer change. Skipped subtests count as not passed.
+        """
         self.separator_count = 40
         self.is_pass_fail = is_pass_fail
         self.pass_fail_ratio = pass_fail_ratio
+        self.parallel = parallel
+        self.short_circuit = short_circuit
+        self.async_concurrency = async_concurrency
 
     def pre_test_run(self, ag: Autograder, test: AutograderTest, data):
         pass
@@ -158,6 +190,40 @@ class SubTestRunner(object):
     def add_test_passed_status(self, data, status):
         data["passed"].append(status)
 
+    def is_decided(self, data) -> bool:
+        """
+        Returns True if the outcome of the pass/fail test is the same no matter how the
+        remaining subtests do.
+        """
+        if not self.short_circuit or not self.is_pass_fail:
+            return False
+        total = data.get("total")
+        if not total:
+            return False
+        done = len(data["passed"])
+        remaining = total - done
+        if remaining <= 0:
+            return False
+        passed = sum(data["passed"])
+        best = (passed + remaining) / total
+        worst = passed / total
+        return best < self.pass_fail_ratio or worst >= self.pass_fail_ratio
+
+    def skip_sub_tests(self, ag: Autograder, test: AutograderTest, sub_test: List[AutograderSubTest], data):
+        for t in sub_test:
+            self.skip_subtest(ag, test, t, data)
+
+    def skip_subtest(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest, data):
+        t.set_score(False)
+        self.add_test_passed_status(data, False)
+        data["skipped"].append(t.name)
+        test.print("=" * self.separator_count)
+        test.print(f"[SubTest]: {t.name}")
+        test.print("-" * self.separator_count)
+        test.print("[-] NOT RUN (outcome already determined)")
+        test.print("_" * self.separator_count)
+        test.print("\n")
+
     def did_pass(self, data):
         amt = len(data["passed"])
         if amt == 0:
@@ -165,16 +231,33 @@ class SubTestRunner(object):
         return sum(data["passed"]) / amt >= self.pass_fail_ratio
 
     def run_test(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest, data):
+        res = self.run_subtest(ag, test, t)
+        return self.check_subtest_result(ag, test, t, data, res)
+
+    def run_subtest(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest):
+        """
+        Runs the subtest and returns what it returned or the StopSubTestRunner it raised.
+        """
+        usage = ResourceUsage()
         try:
-            res = t.run(ag, handler=self.stopSubTestRunnerHandler)
+            with usage:
+                return t.run(ag, handler=self.stopSubTestRunnerHandler)
         except StopSubTestRunner as e:
-            if e.info:
-                test.print(e.info)
             return e
+        finally:
+            if ag.profiler is not None:
+                ag.profiler.record_subtest(test, t, usage)
+
+    def check_subtest_result(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest, data, res):
+        if isinstance(res, StopSubTestRunner):
+            if res.info:
+                test.print(res.info)
+            return res
         if isinstance(res, AutograderSafeEnvError):
             if isinstance(res.info, AssertionError):
                 t.print(f"[AssertionError]: {res.info}")
                 t.set_score(False)
+                t.completed = True
                 return
             t.print(f"[Error]: An unexpected error occured in the Autograder when attempting to run this testcase! Please contact a TA if this persists.")
             t.set_score(False)
@@ -189,6 +272,214 @@ class SubTestRunner(object):
         if isinstance(r, StopSubTestRunner):
             print(f"[Warning]: The subtest runner stopped on {r.info}! ({test.name})")
 
+    def run_sub_tests(self, ag: Autograder, test: AutograderTest, sub_test: List[AutograderSubTest], data):
+        i = 0
+        while i < len(sub_test):
+            if self.gathers(sub_test[i]):
+                # pre_subtest_run is called for the consecutive async subtests before they start
+                # and what it prints is kept aside until they finish in order.
+                group = []
+                blocked = None
+                while i < len(sub_test) and self.gathers(sub_test[i]):
+                    t = sub_test[i]
+                    i += 1
+                    section, res = self.run_pre_subtest(ag, test, t, data)
+                    if res is False:
+                        blocked = (t, section)
+                        break
+                    group.append((t, section))
+                results = run_coroutine(self.run_sub_tests_async(ag, test, [t for t, _ in group], data))
+                for j, ((t, section), res) in enumerate(zip(group, results)):
+                    test.print(section, end="")
+                    res = self.check_subtest_result(ag, test, t, data, res)
+                    r = self.finish_subtest(ag, test, t, data, res)
+                    if isinstance(r, StopSubTestRunner):
+                        return r
+                    if self.is_decided(data):
+                        # The subtests which ran together with this one are skipped like the others.
+                        skipped = [t for t, _ in group[j + 1:]]
+                        if blocked is not None:
+                            skipped.append(blocked[0])
+                        self.skip_sub_tests(ag, test, skipped + sub_test[i:], data)
+                        return
+                if blocked is None:
+                    continue
+                t, section = blocked
+                test.print(section, end="")
+                r = self.part_stopped("pre_subtest_run", ag, test, t, data)
+                if isinstance(r, StopSubTestRunner):
+                    return r
+            else:
+                t = sub_test[i]
+                i += 1
+                if self.pre_subtest_run(ag, test, t, data) is False:
+                    r = self.part_stopped("pre_subtest_run", ag, test, t, data)
+                    if isinstance(r, StopSubTestRunner):
+                        return r
+            res = self.run_test(ag, test, t, data)
+            r = self.finish_subtest(ag, test, t, data, res)
+            if isinstance(r, StopSubTestRunner):
+                return r
+            if self.is_decided(data):
+                self.skip_sub_tests(ag, test, sub_test[i:], data)
+                return
+
+    def gathers(self, t: AutograderSubTest) -> bool:
+        """
+        Returns if the subtest runs together with the async subtests next to it. This is not
+        done if run_test is overridden, since the subtests are run with run_subtest_async instead.
+        """
+        return t.is_async() and type(self).run_test is SubTestRunner.run_test
+
+    async def run_sub_tests_async(self, ag: Autograder, test: AutograderTest, sub_test: List[AutograderSubTest], data) -> list:
+        """
+        Runs the subtests together on the current event loop and returns what each returned.
+        """
+        limit = self.async_concurrency if self.async_concurrency is not None else ag.async_concurrency
+        semaphore = asyncio.Semaphore(limit) if limit is not None else None
+
+        async def run(t: AutograderSubTest):
+            if semaphore is None:
+                return await self.run_subtest_async(ag, test, t)
+            async with semaphore:
+                return await self.run_subtest_async(ag, test, t)
+
+        return await asyncio.gather(*[run(t) for t in sub_test])
+
+    async def run_subtest_async(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest):
+        """
+        The same as run_subtest for an async subtest, which runs on the current event loop.
+        """
+        usage = ResourceUsage()
+        try:
+            with usage:
+                return await t.run_async(ag, handler=self.stopSubTestRunnerHandler)
+        except StopSubTestRunner as e:
+            return e
+        finally:
+            if ag.profiler is not None:
+                ag.profiler.record_subtest(test, t, usage)
+
+    def finish_subtest(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest, data, res):
+        is_subtest_stopper = isinstance(res, StopSubTestRunner)
+        if res is False or is_subtest_stopper:
+            r = self.part_stopped("run_test", ag, test, t, data)
+            if isinstance(r, StopSubTestRunner):
+                return r
+        if self.post_subtest_run(ag, test, t, data) is False:
+            r = self.part_stopped("post_subtest_run", ag, test, t, data)
+            if isinstance(r, StopSubTestRunner):
+                return r
+
+    def run_pre_subtest(self, ag: Autograder, test: AutograderTest, t: AutograderSubTest, data):
+        """
+        Runs pre_subtest_run with what it prints to the test kept in a section of its own.
+        """
+        output = test.output
+        test.output = OutputBuffer(max_bytes=test.max_output_bytes)
+        try:
+            res = self.pre_subtest_run(ag, test, t, data)
+            return test.output, res
+        finally:
+            test.output = output
+
+    def run_sub_tests_parallel(self, ag: Autograder, test: AutograderTest, sub_test: List[AutograderSubTest], data):
+        """
+        Runs the subtests (with run_test) on self.parallel threads. pre_subtest_run is called in
+        order right before a subtest starts, and what it and run_test print to the test is kept
+        in a section of the subtest until every subtest before it has finished. Then the subtests
+        are finished in order on this thread (post_subtest_run), so the output and the scores are
+        the same as when running them one at a time. Once the runner stops, subtests which have
+        not started are not run. Running ones cannot be stopped, so they are waited for (or left
+        to finish on their own if this thread is interrupted, eg. by the timeout of the test).
+        """
+        lock = threading.Lock()
+        pending = deque()
+        stopped = False
+        sections = threading.local()
+
+        def work(t: AutograderSubTest, section: OutputBuffer):
+            with lock:
+                if stopped:
+                    return StopSubTestRunner()
+            sections.output = section
+            try:
+                return self.run_test(ag, test, t, data)
+            finally:
+                sections.output = None
+
+        def stop():
+            nonlocal stopped
+            with lock:
+                stopped = True
+                for _, future, _ in pending:
+                    future.cancel()
+
+        def submit(t: AutograderSubTest, section: OutputBuffer):
+            pending.append((t, pool.submit(work, t, section), section))
+
+        def run():
+            remaining = iter(sub_test)
+            exhausted = False
+            # A subtest whose pre_subtest_run returned False waits until every subtest before it finished.
+            blocked = None
+            while True:
+                while not exhausted and blocked is None and sum(not f.done() for _, f, _ in pending) < self.parallel:
+                    t = next(remaining, None)
+                    if t is None:
+                        exhausted = True
+                        break
+                    section, res = self.run_pre_subtest(ag, test, t, data)
+                    if res is False:
+                        blocked = (t, section)
+                        break
+                    submit(t, section)
+                while pending and pending[0][1].done():
+                    t, future, section = pending.popleft()
+                    res = future.result()
+                    test.print(section, end="")
+                    r = self.finish_subtest(ag, test, t, data, res)
+                    if isinstance(r, StopSubTestRunner):
+                        return r
+                    if self.is_decided(data):
+                        # The subtests which already started are skipped like the others once they finished.
+                        stop()
+                        wait([f for _, f, _ in pending])
+                        skipped = [t for t, _, _ in pending]
+                        if blocked is not None:
+                            skipped.append(blocked[0])
+                        self.skip_sub_tests(ag, test, skipped + list(remaining), data)
+                        return
+                if blocked is not None and not pending:
+                    t, section = blocked
+                    blocked = None
+                    test.print(section, end="")
+                    r = self.part_stopped("pre_subtest_run", ag, test, t, data)
+                    if isinstance(r, StopSubTestRunner):
+                        return r
+                    submit(t, OutputBuffer(max_bytes=test.max_output_bytes))
+                    continue
+                if not pending:
+                    if exhausted:
+                        return
+                    continue
+                wait([f for _, f, _ in pending if not f.done()], return_when=FIRST_COMPLETED)
+
+        pool = ThreadPoolExecutor(max_workers=self.parallel)
+        test.thread_output = sections
+        try:
+            r = run()
+        except BaseException:
+            stop()
+            pool.shutdown(wait=False)
+            raise
+        else:
+            stop()
+            pool.shutdown()
+        finally:
+            del test.thread_output
+        return r
+
     @staticmethod
     def stopSubTestRunnerHandler(exception):
         if isinstance(exception, (StopSubTestRunner, AssertionError)):
@@ -199,8 +490,13 @@ class SubTestRunner(object):
         data = {
             "score": 0,
             "passed": [],
+            "skipped": [],
         }
         sub_test = self.get_sub_tests(ag, test, data)
+        if sub_test is not False and sub_test is not None:
+            # get_sub_tests may return any iterable (eg. a generator) but the count is needed up front.
+            sub_test = list(sub_test)
+            data["total"] = len(sub_test)
         if sub_test is False:
             r = self.part_stopped("get_sub_tests", ag, test, None, data)
             if isinstance(r, StopSubTestRunner):
@@ -209,21 +505,12 @@ class SubTestRunner(object):
             r = self.part_stopped("pre_test_run", ag, test, None, data)
             if isinstance(r, StopSubTestRunner):
                 return r
-        for t in sub_test:
-            if self.pre_subtest_run(ag, test, t, data) is False:
-                r = self.part_stopped("pre_subtest_run", ag, test, t, data)
-                if isinstance(r, StopSubTestRunner):
-                    return r
-            res = self.run_test(ag, test, t, data)
-            is_subtest_stopper = isinstance(res, StopSubTestRunner)
-            if res is False or is_subtest_stopper:
-                r = self.part_stopped("run_test", ag, test, t, data)
-                if isinstance(r, StopSubTestRunner):
-                    return r
-            if self.post_subtest_run(ag, test, t, data) is False:
-                r = self.part_stopped("post_subtest_run", ag, test, t, data)
-                if isinstance(r, StopSubTestRunner):
-                    return r
+        if self.parallel is not None and self.parallel > 1:
+            r = self.run_sub_tests_parallel(ag, test, sub_test, data)
+        else:
+            r = self.run_sub_tests(ag, test, sub_test, data)
+        if isinstance(r, StopSubTestRunner):
+            return r
         if self.score_post(ag, test, data) is False:
             r = self.part_stopped("score_post", ag, test, None, data)
             if isinstance(r, StopSubTestRunner):
@@ -0,0 +1,181 @@
+"""
+This indexes the files of the submission once so checks do not have to walk it again.
+"""
+import hashlib
+import os
+import re
+from typing import Dict, Iterator, List, Optional
+
+from .Utils import submission_dir
+
+class SubmissionFile:
+    """
+    A file of the submission. path is relative to the submission (with / as the separator).
+    The sha256 of the content is only computed when it is first needed.
+    """
+    __slots__ = ["path", "abspath", "size", "mtime_ns", "_sha256"]
+
+    def __init__(self, path: str, abspath: str, size: int, mtime_ns: int):
+        self.path = path
+        self.abspath = abspath
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._sha256 = None
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            h = hashlib.sha256()
+            with open(self.abspath, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            self._sha256 = h.hexdigest()
+        return self._sha256
+
+    def read_bytes(self) -> bytes:
+        with open(self.abspath, "rb") as f:
+            return f.read()
+
+    def read_text(self, encoding: str="utf-8", errors: str="replace") -> str:
+        with open(self.abspath, "r", encoding=encoding, errors=errors) as f:
+            return f.read()
+
+    def __repr__(self):
+        return f"SubmissionFile({self.path!r}, size={self.size})"
+
+def glob_to_regex(pattern: str):
+    """
+    Turns a glob into a regex on paths relative to the submission. * and ? do not match /,
+    ** matches any number of directories and [...] matches a character like in fnmatch.
+    """
+    i = 0
+    regex = ""
+    pattern = pattern.replace(os.sep, "/").lstrip("/")
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[" and pattern.find("]", i + 1) != -1:
+            end = pattern.find("]", i + 1)
+            chars = pattern[i + 1:end].replace("\\", "\\\\")
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            regex += f"[{chars}]"
+            i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex + r"\Z")
+
+class SubmissionManifest:
+    """
+    Every file in the submission (base, which defaults to submission_dir()) with its size and
+    mtime, found with a single os.scandir pass. Symlinked directories are followed unless they
+    point to a directory they are in.
+
+    max_files, max_file_size and max_total_size (in bytes) are limits which check_limits reports
+    on. The manifest is built once, so call refresh if the submission is changed afterwards.
+    """
+    def __init__(self, base: str=None, max_files: int=None, max_file_size: int=None, max_total_size: int=None):
+        self.base = base if base is not None else submission_dir()
+        self.max_files = max_files
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.files: Dict[str, SubmissionFile] = {}
+        self.total_size = 0
+        self.refresh()
+
+    def refresh(self):
+        files = {}
+        total_size = 0
+        try:
+            st = os.stat(self.base)
+        except OSError:
+            st = None
+        # Every directory keeps the (st_dev, st_ino) of the directories it is in, so a symlink
+        # back to one of them is not followed again.
+        stack = [("", self.base, frozenset([(st.st_dev, st.st_ino)] if st is not None else []))]
+        while stack:
+            prefix, directory, parents = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                path = prefix + entry.name
+                try:
+                    if entry.is_dir():
+                        st = entry.stat()
+                        key = (st.st_dev, st.st_ino)
+                        if key not in parents:
+                            stack.append((path + "/", entry.path, parents | {key}))
+                    elif entry.is_file():
+                        st = entry.stat()
+                        files[path] = SubmissionFile(path, entry.path, st.st_size, st.st_mtime_ns)
+                        total_size += st.st_size
+                except OSError:
+                    continue
+        self.files = dict(sorted(files.items()))
+        self.total_size = total_size
+        return self
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        return os.path.normpath(path).replace(os.sep, "/").lstrip("/")
+
+    def get(self, path: str) -> Optional[SubmissionFile]:
+        return self.files.get(self.normalize(path))
+
+    def __contains__(self, path: str) -> bool:
+        return self.get(path) is not None
+
+    def __iter__(self) -> Iterator[SubmissionFile]:
+        return iter(self.files.values())
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def missing(self, paths: List[str]) -> List[str]:
+        """
+        Returns the paths which are not files in the submission.
+        """
+        return [path for path in paths if path not in self]
+
+    def glob(self, pattern: str) -> List[SubmissionFile]:
+        regex = glob_to_regex(pattern)
+        return [f for path, f in self.files.items() if regex.match(path)]
+
+    def hash(self, paths: List[str]=None) -> str:
+        """
+        Returns a hash of the paths and contents of the given files (or of every file).
+        """
+        h = hashlib.sha256()
+        files = self.files.values() if paths is None else [self.files[p] for p in sorted(paths)]
+        for f in files:
+            h.update(f.path.encode("utf-8", errors="surrogateescape") + b"\0" + f.sha256.encode("ascii") + b"\0")
+        return h.hexdigest()
+
+    def check_limits(self) -> List[str]:
+        """
+        Returns a message for every limit the submission goes over.
+        """
+        problems = []
+        if self.max_files is not None and len(self.files) > self.max_files:
+            problems.append(f"The submission has {len(self.files)} files but at most {self.max_files} are allowed!")
+        if self.max_total_size is not None and self.total_size > self.max_total_size:
+            problems.append(f"The submission is {self.total_size} bytes but at most {self.max_total_size} bytes are allowed!")
+        if self.max_file_size is not None:
+            for f in self.files.values():
+                if f.size > self.max_file_size:
+                    problems.append(f"{f.path} is {f.size} bytes but files can be at most {self.max_file_size} bytes!")
+        return problems
@@ -6,30 +6,37 @@
  * @Last Modified time: 2020-01-23 21:02:51 
  */
 """
+from .AutograderProfile import ResourceUsage
 from .Timeout import Timeout
 from .Utils import WhenToRun
 
 global_teardowns = []
 
 class AutograderTeardown:
-    def __init__(self, teardownfn, name, timeout: int=None, when_to_run: WhenToRun=WhenToRun.BOTH):
+    def __init__(self, teardownfn, name, timeout: float=None, when_to_run: WhenToRun=WhenToRun.BOTH):
         self.teardownfn = teardownfn
         self.name = name
         self.timeout = timeout
         self.when_to_run = when_to_run
+        self.execution_time = None
         global_teardowns.append(self)
 
     def run(self, ag: "Autograder"):
         success = False
         def f():
             nonlocal success
+            timeout = Timeout(self.timeout)
             try:
-                with Timeout(self.timeout):
+                with timeout:
                     success = self.teardownfn(ag)
             except Timeout.Timeout:
-                print(f"The teardown {self.name} has timed out!")
+                if not timeout.expired:
+                    raise
+                print(f"The teardown {self.name} has timed out after {timeout.elapsed:.2f} seconds!")
                 ag.print("[ERROR]: A teardown step timed out!")
                 success = False
+            finally:
+                self.execution_time = timeout.elapsed
 
         def handler(exception):
             nonlocal success
@@ -37,6 +44,11 @@ class AutograderTeardown:
             print(f"The teardown {self.name} has encountered an error!")
             ag.print("[Error]: An unexpected error occured in the Autograder when attempting to run a teardown of the Autograder! Please contact a TA if this persists.")
 
-        ag.safe_env(f, handler=handler)
+        usage = ResourceUsage()
+        with usage:
+            ag.safe_env(f, handler=handler)
+        profiler = getattr(ag, "profiler", None)
+        if profiler is not None:
+            profiler.record_step(ag, "teardown", self.name, usage)
         return success
     
@@ -10,10 +10,16 @@
 """
 This is a test in gradescope.
 """
+import asyncio
+import time
+from .AutograderBenchmark import Benchmark, BenchmarkStats
+from .AutograderNumeric import NumericComparison, compare_arrays, parse_numbers
+from .AutograderOutput import OutputBuffer
+from .AutograderProfile import ResourceUsage
 from .Timeout import Timeout
 from . import Visibility
-from .Utils import root_dir, submission_dir
-from typing import Callable
+from .Utils import root_dir, submission_dir, run_coroutine
+from typing import Callable, List
 
 global_tests = []
 
@@ -33,14 +39,26 @@ class AutograderTest:
         extra_data=None,
         kill_autograder_on_error: bool=False,
         do_not_set_score: bool=False,
-        timeout: int=None,
+        timeout: float=None,
         ceil: bool=True,
         floor: bool=True,
         ran: bool=False,
+        serial: bool=False,
+        max_output_bytes: int=None,
+        depends_on: List[str]=None,
+        isolate: bool=False,
     ):
         """
         The test_fn MUST take in parameters Autograder and AutograderTest in that order.
-        It is how the test will interact with the autograder.
+        It is how the test will interact with the autograder. The test_fn may be an async function,
+        in which case it runs on an event loop together with the other async tests around it.
+        Set serial to True if the test cannot run at the same time as other tests when
+        the autograder runs tests in parallel (eg. it modifies shared files).
+        If max_output_bytes is set, only the start and end of the output of the test are kept.
+        depends_on is a list of globs of the submission files the test depends on. If none of
+        them changed since the previous submission, its result is reused (see IncrementalRegrade).
+        Set isolate to True to run the test in a worker process so a crash (eg. a segfault in
+        student code loaded with ctypes) only fails this test (see IsolationPool).
         """
         self.test_fn = test_fn
         self.max_score = max_score
@@ -50,20 +68,37 @@ class AutograderTest:
         self.visibility = visibility
         self.extra_data = extra_data
         self.score = score
-        self.output = ""
+        self.max_output_bytes = max_output_bytes
+        self.output = OutputBuffer(max_bytes=max_output_bytes)
         self.kill_autograder_on_error = kill_autograder_on_error
         self.do_not_set_score = do_not_set_score
         self.timeout = timeout
         self.ceil = ceil
         self.floor = floor
         self.ran = ran
+        self.execution_time = None
+        # This is set once the test finished by returning or failing an assertion, so not when it
+        # timed out, crashed, raised an unexpected error or was skipped.
+        self.completed = False
+        self.serial = serial
+        self.depends_on = depends_on
+        self.reused = False
+        self.isolate = isolate
         global_tests.append(self)
 
     def print(self, *args, sep=' ', end='\n', file=None, flush=True, also_stdout=False):
         msg = sep.join(map(str, args)) + end
         if also_stdout:
             print(msg)
-        self.output += msg
+        # While its subtests run on threads, what a worker thread prints goes to the section of
+        # the subtest it runs (see SubTestRunner.run_sub_tests_parallel).
+        sections = self.__dict__.get("thread_output")
+        section = getattr(sections, "output", None) if sections is not None else None
+        if section is not None:
+            section.write(msg)
+            return
+        self.output = OutputBuffer.wrap(self.output, max_bytes=self.max_output_bytes)
+        self.output.write(msg)
 
     def set_score(self, score):
         if score is None:
@@ -89,42 +124,174 @@ class AutograderTest:
     def get_score(self):
         return self.score
 
+    def can_run_in_parallel(self) -> bool:
+        # A Timeout off the main thread cannot interrupt the test (see Timeout), so tests with a
+        # timeout run on the main thread with SIGALRM unless something else enforces it: async tests are cancelled and isolated tests have their worker killed.
+        return not self.serial and (self.timeout is None or self.isolate or self.is_async())
+
+    def is_async(self) -> bool:
+        return asyncio.iscoroutinefunction(self.test_fn) or asyncio.iscoroutinefunction(getattr(self.test_fn, "__call__", None))
+
+    def set_result(self, r):
+        if self.do_not_set_score:
+            return
+        self.set_score(r)
+
+    def default_handler(self, exception):
+        if isinstance(exception, AssertionError):
+            self.print(f"[AssertionError]: {exception}")
+            self.set_score(False)
+            self.completed = True
+            return True
+        if not self.do_not_set_score:
+            self.set_score(False)
+        if self.kill_autograder_on_error:
+            return False
+        self.print("[Error]: An unexpected error occured in the Autograder when attempting to run this testcase! Please contact a TA if this persists.")
+        return True
+
     def run(self, ag, handler=None):
+        pool = self.get_isolation_pool(ag)
+        if pool is not None:
+            return self.run_isolated(ag, pool, handler=handler)
+        if self.is_async():
+            return run_coroutine(self.run_async(ag, handler=handler))
         self.ran = True
+        self.completed = False
         if self.test_fn is None:
             self.print("[ERROR]: This test case does not have a callable function!")
             self.set_score(0)
             return
-        
-        def set_score(r):
-            if self.do_not_set_score:
-                return
-            self.set_score(r)
 
         def f():
+            timeout = Timeout(self.timeout)
             try:
-                with Timeout(self.timeout):
+                with timeout:
                     r = self.test_fn(ag, self)
-                    set_score(r)
+                    self.set_result(r)
+                self.completed = True
             except Timeout.Timeout:
-                self.print("[ERROR]: This test timed out!")
-                set_score(0)
-
-        def default_handler(exception):
-            if isinstance(exception, AssertionError):
-                self.print(f"[AssertionError]: {exception}")
-                self.set_score(False)
-                return True
-            if not self.do_not_set_score:
-                self.set_score(False)
-            if self.kill_autograder_on_error:
-                return False
-            self.print("[Error]: An unexpected error occured in the Autograder when attempting to run this testcase! Please contact a TA if this persists.")
-            return True
-        return ag.safe_env(f, handler=handler if handler is not None else default_handler)
+                if not timeout.expired:
+                    raise
+                self.print(f"[ERROR]: This test timed out after {timeout.elapsed:.2f} seconds!")
+                self.set_result(0)
+            finally:
+                self.execution_time = timeout.elapsed
+
+        usage = ResourceUsage()
+        with usage:
+            res = ag.safe_env(f, handler=handler if handler is not None else self.default_handler)
+        self.record_usage(ag, usage)
+        return res
+
+    async def run_async(self, ag, handler=None):
+        """
+        Runs an async test_fn on the current event loop. The timeout cancels the test_fn instead
+        of using signals so other tests on the loop keep running.
+        """
+        pool = self.get_isolation_pool(ag)
+        if pool is not None:
+            return await asyncio.get_event_loop().run_in_executor(None, self.run_isolated, ag, pool, handler)
+        self.ran = True
+        self.completed = False
+
+        async def f():
+            start = time.monotonic()
+            try:
+                r = await asyncio.wait_for(self.test_fn(ag, self), self.timeout)
+                self.set_result(r)
+                self.completed = True
+            except asyncio.TimeoutError:
+                if self.timeout is None or time.monotonic() - start < self.timeout:
+                    raise
+                self.print(f"[ERROR]: This test timed out after {time.monotonic() - start:.2f} seconds!")
+                self.set_result(0)
+            finally:
+                self.execution_time = time.monotonic() - start
+
+        # Other tests on the loop run while this one waits so the CPU times include theirs.
+        usage = ResourceUsage()
+        with usage:
+            res = await ag.safe_env_async(f, handler=handler if handler is not None else self.default_handler)
+        self.record_usage(ag, usage)
+        return res
+
+    def get_isolation_pool(self, ag):
+        """
+        Returns the IsolationPool to run this test in or None if it runs in this process.
+        """
+        if not self.isolate:
+            return None
+        from .AutograderIsolation import IsolationPool
+        if IsolationPool.in_worker:
+            return None
+        pool = ag.get_isolation_pool()
+        if not pool.knows(self):
+            print(f"[Warning]: ({self.name}) This test was created after the isolated tests started so it runs without isolation!")
+            return None
+        return pool
+
+    def run_isolated(self, ag, pool, handler=None):
+        usage = ResourceUsage()
+        with usage:
+            res = pool.run(self, handler=handler)
+        self.record_usage(ag, usage)
+        return res
+
+    def record_usage(self, ag, usage: ResourceUsage):
+        profiler = getattr(ag, "profiler", None)
+        if profiler is not None:
+            profiler.record_test(self, usage)
+
+    def benchmark(self, ag, fn: Callable, args: tuple=(), kwargs: dict=None, name: str=None,
+                  statistic: str="median", leaderboard: str=None, order: str="asc", scale: float=1,
+                  **options) -> BenchmarkStats:
+        """
+        Times fn(*args, **kwargs) with a Benchmark (options are passed to it, eg. repeats, warmup,
+        time_budget, cpu or outlier_threshold) and saves the stats in extra_data["benchmarks"][name].
+        If leaderboard is set, the statistic times scale (eg. 1000 for milliseconds) is added to
+        the leaderboard of the autograder under that name.
+        """
+        bench = Benchmark(fn, name=name, **options)
+        stats = bench.run(*args, **(kwargs or {}))
+        if self.extra_data is None:
+            self.extra_data = {}
+        if isinstance(self.extra_data, dict):
+            self.extra_data.setdefault("benchmarks", {})[bench.name] = stats.export()
+        if leaderboard is not None:
+            ag.leaderboard.add_item(leaderboard, stats.get(statistic) * scale, order=order)
+        return stats
+
+    def check_numeric(self, expected, actual, name: str=None, partial_credit: bool=True, threshold: float=0,
+                      shape: tuple=None, dtype: str="float64", sep: str=None, **options) -> NumericComparison:
+        """
+        Compares numeric output (text or bytes to parse, or arrays) to the expected values with
+        compare_arrays (options are passed to it, eg. rel_tol, abs_tol or max_report). The
+        mismatches are printed and the score is set to the fraction of matching values (or to 0
+        unless everything matches if partial_credit is False). If name is set, the summary is
+        saved in extra_data["numeric"][name]. Needs NumPy.
+        """
+        if isinstance(expected, (str, bytes)):
+            expected = parse_numbers(expected, dtype=dtype, shape=shape, sep=sep)
+        if isinstance(actual, (str, bytes)):
+            actual = parse_numbers(actual, dtype=dtype, sep=sep)
+            if shape is not None and actual.size == expected.size:
+                actual = actual.reshape(shape)
+        res = compare_arrays(expected, actual, **options)
+        if not res:
+            self.print(res)
+        if name is not None:
+            if self.extra_data is None:
+                self.extra_data = {}
+            if isinstance(self.extra_data, dict):
+                self.extra_data.setdefault("numeric", {})[name] = res.export()
+        if self.max_score is not None:
+            score = res.score(self.max_score, threshold) if partial_credit else bool(res)
+            self.set_result(score)
+        return res
 
     def get_results(self):
-        o = self.output
+        o = str(self.output)
         if self.ran is False:
             o = "[WARNING]: This test did not run!"
         data = {"output": o}
@@ -140,6 +307,8 @@ class AutograderTest:
             data["visibility"] = self.visibility.name
         if self.extra_data is not None:
             data["extra_data"] = self.extra_data
+        if self.execution_time is not None and isinstance(self.extra_data, (dict, type(None))):
+            data["extra_data"] = dict(self.extra_data or {}, execution_time=round(self.execution_time, 3))
         if self.score is not None:
             data["score"] = self.score
         return data
@@ -1,29 +1,226 @@
 """
 /*
- * @Author: ThaumicMekanism [Stephan K.] 
- * @Date: 2020-01-23 21:03:47 
- * @Last Modified by:   ThaumicMekanism [Stephan K.] 
- * @Last Modified time: 2020-01-23 21:03:47 
+ * @Author: ThaumicMekanism [Stephan K.]
+ * @Date: 2020-01-23 21:03:47
+ * @Last Modified by:   ThaumicMekanism [Stephan K.]
+ * @Last Modified time: 2020-01-23 21:03:47
  */
 """
+import os
 import signal
+import subprocess
+import threading
+import time
 
 class Timeout():
-    """Timeout class using ALARM signal."""
+    """
+    Raises Timeout.Timeout in the thread which entered it once sec (which may be a float)
+    seconds have passed.
+
+    Timeouts can be nested and the earliest deadline wins; check `expired` to know which one
+    ran out. On the main thread, the timeout uses SIGALRM (setitimer) so blocking calls are
+    interrupted. The previous SIGALRM handler is put back once no timeout is active.
+
+    On any other thread the timeout is only best-effort: nothing can interrupt the thread, so
+    the block runs to the end and Timeout.Timeout is raised when it exits (unless it raised
+    something else). Code which runs for long can call Timeout.check() to stop early. To really
+    stop code off the main thread, run it in a process (eg. with isolate, see IsolationPool) or
+    as a coroutine which can be cancelled. Processes added with add_process (or started with
+    Timeout.popen) have their process group killed by a watchdog thread when the timeout
+    expires, on any thread, which also wakes up a thread waiting on them.
+    """
     class Timeout(Exception):
         pass
- 
-    def __init__(self, sec):
+
+    _lock = threading.RLock()
+    _wakeup = threading.Condition(_lock)
+    _active = {}
+    _watchdog = None
+    _watchdog_pid = None
+    _alarm_installed = False
+    _previous_handler = None
+
+    def __init__(self, sec: float=None):
         self.sec = sec
- 
+        self.deadline = None
+        self.start_time = None
+        self.end_time = None
+        self.expired = False
+        self.thread_id = None
+        self.uses_signal = False
+        self.processes = []
+
     def __enter__(self):
+        self.start_time = time.monotonic()
+        self.end_time = None
+        self.expired = False
+        self.thread_id = threading.get_ident()
+        self.uses_signal = Timeout._can_use_signal()
         if self.sec is not None:
-            signal.signal(signal.SIGALRM, self.raise_timeout)
-            signal.alarm(self.sec)
- 
-    def __exit__(self, *args):
+            self.deadline = self.start_time + self.sec
+        with Timeout._lock:
+            Timeout._active.setdefault(self.thread_id, []).append(self)
         if self.sec is not None:
-            signal.alarm(0)    # disable alarm
- 
-    def raise_timeout(self, *args):
-        raise Timeout.Timeout()
\ No newline at end of file
+            Timeout._schedule(self.uses_signal)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_time = time.monotonic()
+        with Timeout._lock:
+            stack = Timeout._active.get(self.thread_id, [])
+            if self in stack:
+                stack.remove(self)
+            if not stack:
+                Timeout._active.pop(self.thread_id, None)
+        if self.sec is not None:
+            Timeout._schedule(self.uses_signal)
+        if self.expired and not self.uses_signal and exc_type is None:
+            # The watchdog could not interrupt the block, so it is reported once the block finished.
+            raise Timeout.Timeout()
+        return False
+
+    @property
+    def elapsed(self) -> float:
+        if self.start_time is None:
+            return 0
+        end = self.end_time if self.end_time is not None else time.monotonic()
+        return end - self.start_time
+
+    def remaining(self) -> float:
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic())
+
+    def add_process(self, proc):
+        """
+        Kills proc (a Popen or a pid) and its process group if this timeout expires.
+        """
+        with Timeout._lock:
+            self.processes.append(proc)
+        return proc
+
+    @staticmethod
+    def current() -> "Timeout":
+        """
+        Returns the innermost timeout entered by the current thread.
+        """
+        with Timeout._lock:
+            stack = Timeout._active.get(threading.get_ident())
+            return stack[-1] if stack else None
+
+    @staticmethod
+    def check():
+        """
+        Raises Timeout.Timeout if a timeout entered by the current thread expired. Off the main
+        thread this is the only way to stop before the end of the block.
+        """
+        with Timeout._lock:
+            expired = any(t.expired for t in Timeout._active.get(threading.get_ident(), []))
+        if expired:
+            raise Timeout.Timeout()
+
+    @staticmethod
+    def popen(*args, **kwargs) -> subprocess.Popen:
+        """
+        Starts a process in its own session which is killed if the current timeout expires.
+        """
+        kwargs.setdefault("start_new_session", True)
+        proc = subprocess.Popen(*args, **kwargs)
+        current = Timeout.current()
+        if current is not None:
+            current.add_process(proc)
+        return proc
+
+    @staticmethod
+    def _can_use_signal() -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    @staticmethod
+    def _schedule(uses_signal: bool):
+        if uses_signal:
+            Timeout._arm_alarm()
+            return
+        with Timeout._lock:
+            if Timeout._watchdog is None or Timeout._watchdog_pid != os.getpid() or not Timeout._watchdog.is_alive():
+                Timeout._watchdog = threading.Thread(target=Timeout._watch, name="TimeoutWatchdog", daemon=True)
+                Timeout._watchdog_pid = os.getpid()
+                Timeout._watchdog.start()
+            Timeout._wakeup.notify()
+
+    @staticmethod
+    def _arm_alarm():
+        with Timeout._lock:
+            stack = Timeout._active.get(threading.get_ident(), [])
+            deadlines = [t.deadline for t in stack if t.deadline is not None and not t.expired]
+        if not deadlines:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            if Timeout._alarm_installed:
+                Timeout._alarm_installed = False
+                # None means the handler was not set from Python, so it cannot be put back.
+                if Timeout._previous_handler is not None:
+                    signal.signal(signal.SIGALRM, Timeout._previous_handler)
+            return
+        if not Timeout._alarm_installed:
+            Timeout._previous_handler = signal.signal(signal.SIGALRM, Timeout._handle_alarm)
+            Timeout._alarm_installed = True
+        signal.setitimer(signal.ITIMER_REAL, max(min(deadlines) - time.monotonic(), 0.0001))
+
+    @staticmethod
+    def _handle_alarm(*args):
+        with Timeout._lock:
+            stack = list(Timeout._active.get(threading.get_ident(), []))
+            expired = Timeout._expire(stack, time.monotonic())
+        Timeout._arm_alarm()
+        if expired:
+            raise Timeout.Timeout()
+
+    @staticmethod
+    def _expire(stack: list, now: float) -> bool:
+        """
+        Marks every timeout in the stack which has passed its deadline as expired and kills the
+        processes of those timeouts and of every timeout nested inside of them.
+        """
+        first = None
+        for i, t in enumerate(stack):
+            if t.deadline is not None and not t.expired and t.deadline <= now:
+                t.expired = True
+                if first is None:
+                    first = i
+        if first is None:
+            return False
+        for t in stack[first:]:
+            for proc in t.processes:
+                Timeout._kill(proc)
+        return True
+
+    @staticmethod
+    def _kill(proc):
+        if isinstance(proc, subprocess.Popen):
+            if proc.poll() is not None:
+                return
+            pid = proc.pid
+        else:
+            pid = proc
+        try:
+            pgid = os.getpgid(pid)
+            if pgid != os.getpgrp():
+                os.killpg(pgid, signal.SIGKILL)
+            else:
+                os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _watch():
+        with Timeout._lock:
+            while True:
+                now = time.monotonic()
+                earliest = None
+                for stack in list(Timeout._active.values()):
+                    if any(t.uses_signal for t in stack):
+                        continue
+                    Timeout._expire(stack, now)
+                    for t in stack:
+                        if t.deadline is not None and not t.expired and (earliest is None or t.deadline < earliest):
+                            earliest = t.deadline
+                Timeout._wakeup.wait(None if earliest is None else max(earliest - now, 0))
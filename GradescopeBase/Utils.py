@@ -6,6 +6,7 @@
  * @Last Modified time: 2020-01-30 16:27:10
  */
 """
+import asyncio
 import enum
 import os
 import pathlib
@@ -55,6 +56,30 @@ def results_path() -> str:
         return "./results/results.json"
     return "/autograder/results/results.json"
 
+def run_coroutine(coro):
+    """
+    Runs the coroutine on a new event loop and closes the loop afterwards, like asyncio.run
+    (which needs Python 3.7).
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            all_tasks = asyncio.all_tasks if hasattr(asyncio, "all_tasks") else asyncio.Task.all_tasks
+            tasks = [task for task in all_tasks(loop) if not task.done()]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            if hasattr(loop, "shutdown_default_executor"):
+                loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
 class NoneLooseVersion(LooseVersion):
     def __init__ (self, vstring=None):
         if vstring:
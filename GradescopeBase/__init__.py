@@ -7,7 +7,15 @@
  */
  """
 from .Autograder import Autograder, RateLimit
+from .AutograderRateLimit import TokenBucketRateLimit, LeakyBucketRateLimit, DailyQuotaRateLimit
+from .AutograderResultCache import ResultCache
+from .AutograderIncremental import IncrementalRegrade
+from .AutograderSubmission import SubmissionManifest
+from .AutograderScheduler import Scheduler
+from .AutograderIsolation import IsolationPool
 from .AutograderTest import AutograderTest, Max, global_tests
+from .AutograderBenchmark import Benchmark, BenchmarkStats
+from .AutograderNumeric import NumericComparison, compare_arrays, parse_numbers, load_numbers
 from .AutograderSetup import AutograderSetup
 from .AutograderTeardown import AutograderTeardown
 from .AutograderSubTest import AutograderSubTest, SubTestRunner, StopSubTestRunner
@@ -62,10 +70,24 @@ def SubTest(test: AutograderTest, *args, **kwargs):
 __all__ = [
     "Autograder",
     "RateLimit",
+    "TokenBucketRateLimit",
+    "LeakyBucketRateLimit",
+    "DailyQuotaRateLimit",
+    "ResultCache",
+    "IncrementalRegrade",
+    "SubmissionManifest",
+    "Scheduler",
+    "IsolationPool",
     "AutograderTest",
     "Visibility",
     "Max",
     "global_tests",
+    "Benchmark",
+    "BenchmarkStats",
+    "NumericComparison",
+    "compare_arrays",
+    "parse_numbers",
+    "load_numbers",
     "Test",
     "Setup",
     "Teardown",
@@ -0,0 +1,213 @@
+import math
+import mmap
+import os
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE_MODES = ("exact", "trailing", "collapse", "ignore")
+
+
+class Mismatch(object):
+    """A line which differs. expected or actual is None if that output has no such line."""
+
+    def __init__(self, line, expected, actual):
+        self.line = line
+        self.expected = expected
+        self.actual = actual
+
+    def column(self):
+        if self.expected is None or self.actual is None:
+            return 0
+        for i, (a, b) in enumerate(zip(self.expected, self.actual)):
+            if a != b:
+                return i
+        return min(len(self.expected), len(self.actual))
+
+
+class ComparisonResult(object):
+    """The result of a comparison. It is truthy if the outputs matched.
+
+    If the comparison stopped after max_mismatches mismatches, truncated is
+    True and there may be more differences after the last one.
+    """
+
+    def __init__(self, equal, mismatches=None, lines=0, truncated=False):
+        self.equal = equal
+        self.mismatches = mismatches or []
+        self.lines = lines
+        self.truncated = truncated
+
+    def __bool__(self):
+        return self.equal
+
+    @staticmethod
+    def shorten(line, column, width):
+        if len(line) <= width:
+            return repr(line)
+        start = max(0, min(column - width // 2, len(line) - width))
+        snippet = repr(line[start:start + width])
+        return ("..." if start > 0 else "") + snippet + ("..." if start + width < len(line) else "")
+
+    def diff(self, width=80):
+        """Returns a short description of the mismatches, with long lines cut
+        down to width characters around the first difference."""
+        if self.equal:
+            return "The output matches the expected output."
+        parts = []
+        for m in self.mismatches:
+            column = m.column()
+            if m.actual is None:
+                parts.append("Line {}: your output ended but expected {}".format(
+                    m.line, self.shorten(m.expected, column, width)))
+            elif m.expected is None:
+                parts.append("Line {}: expected the output to end but got {}".format(
+                    m.line, self.shorten(m.actual, column, width)))
+            else:
+                parts.append("Line {} (column {}):\n  expected: {}\n  actual:   {}".format(
+                    m.line, column + 1, self.shorten(m.expected, column, width),
+                    self.shorten(m.actual, column, width)))
+        if self.truncated:
+            parts.append("(Stopped after {} mismatches, there may be more.)".format(len(self.mismatches)))
+        return "\n".join(parts)
+
+    def __str__(self):
+        return self.diff()
+
+
+class Comparator(object):
+    """Compares two outputs line by line without loading them into memory.
+
+    - whitespace: "exact", "trailing" (ignore whitespace at the end of lines),
+      "collapse" (runs of whitespace count as one space, ends are ignored) or
+      "ignore" (all whitespace is ignored).
+    - normalize_line_endings treats \\r\\n (and a lone \\r at the end of a
+      line) like \\n. A missing newline at the end of the output is ignored.
+    - If rel_tol or abs_tol is set, words which are numbers only have to be
+      close (see math.isclose) instead of equal.
+    - The comparison stops after max_mismatches differing lines.
+    """
+
+    def __init__(self, whitespace="exact", normalize_line_endings=True, rel_tol=None, abs_tol=None,
+                 max_mismatches=1, encoding="utf-8", errors="replace"):
+        if whitespace not in WHITESPACE_MODES:
+            raise ValueError("whitespace must be one of {}!".format(WHITESPACE_MODES))
+        self.whitespace = whitespace
+        self.normalize_line_endings = normalize_line_endings
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        self.max_mismatches = max(1, max_mismatches)
+        self.encoding = encoding
+        self.errors = errors
+
+    def decode(self, line):
+        if isinstance(line, bytes):
+            line = line.decode(self.encoding, errors=self.errors)
+        if line.endswith("\n"):
+            line = line[:-1]
+        if self.normalize_line_endings and line.endswith("\r"):
+            line = line[:-1]
+        return line
+
+    def normalize(self, line):
+        if self.whitespace == "trailing":
+            return line.rstrip()
+        if self.whitespace == "collapse":
+            return " ".join(line.split())
+        if self.whitespace == "ignore":
+            return "".join(line.split())
+        return line
+
+    @staticmethod
+    def to_number(word):
+        try:
+            return float(word)
+        except ValueError:
+            return None
+
+    def lines_match(self, expected, actual):
+        expected, actual = self.normalize(expected), self.normalize(actual)
+        if expected == actual:
+            return True
+        if self.rel_tol is None and self.abs_tol is None:
+            return False
+        expected_words, actual_words = expected.split(), actual.split()
+        if len(expected_words) != len(actual_words):
+            return False
+        for e, a in zip(expected_words, actual_words):
+            if e == a:
+                continue
+            e_num, a_num = self.to_number(e), self.to_number(a)
+            if e_num is None or a_num is None:
+                return False
+            if not math.isclose(e_num, a_num, rel_tol=self.rel_tol or 0, abs_tol=self.abs_tol or 0):
+                return False
+        return True
+
+    def compare_lines(self, expected_lines, actual_lines):
+        """Compares two iterables of lines (str or bytes)."""
+        mismatches = []
+        expected_lines, actual_lines = iter(expected_lines), iter(actual_lines)
+        line = 0
+        while True:
+            expected = next(expected_lines, None)
+            actual = next(actual_lines, None)
+            if expected is None and actual is None:
+                return ComparisonResult(not mismatches, mismatches, line)
+            line += 1
+            expected = self.decode(expected) if expected is not None else None
+            actual = self.decode(actual) if actual is not None else None
+            if expected is not None and actual is not None and self.lines_match(expected, actual):
+                continue
+            if expected is None or actual is None:
+                # Blank lines at the end only differ by trailing whitespace.
+                other = expected if actual is None else actual
+                if self.whitespace != "exact" and not other.strip():
+                    continue
+            mismatches.append(Mismatch(line, expected, actual))
+            if len(mismatches) >= self.max_mismatches:
+                more = next(expected_lines, None) is not None or next(actual_lines, None) is not None
+                return ComparisonResult(False, mismatches, line, truncated=more)
+
+    def compare_streams(self, expected, actual):
+        """Compares two readable files (text or binary) one line at a time."""
+        return self.compare_lines(iter(expected.readline, expected.read(0)), iter(actual.readline, actual.read(0)))
+
+    def compare_files(self, expected_path, actual_path):
+        """Compares two files. Identical files are found by comparing their
+        memory maps in chunks without splitting them into lines."""
+        if os.path.getsize(expected_path) == os.path.getsize(actual_path) and files_identical(expected_path, actual_path):
+            return ComparisonResult(True)
+        with open(expected_path, "rb") as expected, open(actual_path, "rb") as actual:
+            return self.compare_streams(expected, actual)
+
+
+def files_identical(path_a, path_b):
+    """Returns if two files have the same bytes, using memory maps to compare them in chunks."""
+    size = os.path.getsize(path_a)
+    if size != os.path.getsize(path_b):
+        return False
+    if size == 0:
+        return True
+    with open(path_a, "rb") as a, open(path_b, "rb") as b:
+        with mmap.mmap(a.fileno(), 0, access=mmap.ACCESS_READ) as map_a, \
+                mmap.mmap(b.fileno(), 0, access=mmap.ACCESS_READ) as map_b:
+            for start in range(0, size, CHUNK_SIZE):
+                if map_a[start:start + CHUNK_SIZE] != map_b[start:start + CHUNK_SIZE]:
+                    return False
+    return True
+
+
+def compare_files(expected_path, actual_path, **options):
+    """Compares the file with the expected output to the actual output file.
+    The options are the ones of Comparator.
+
+    eg. result = compare_files('expected/out1.txt', 'out1.txt', whitespace='trailing')
+        if not result:
+            test.print(result.diff())
+    """
+    return Comparator(**options).compare_files(expected_path, actual_path)
+
+
+def compare_streams(expected, actual, **options):
+    """Compares two readable files (eg. the stdout of a process). The options
+    are the ones of Comparator."""
+    return Comparator(**options).compare_streams(expected, actual)
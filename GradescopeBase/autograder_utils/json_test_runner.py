@@ -1,13 +1,61 @@
 """Running tests"""
 from __future__ import print_function
 
+import io
 import sys
 import time
 import json
+import multiprocessing
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from unittest import result
 from unittest.signals import registerResult
 
+# The runner and shards of the current sharded run. Workers are forked so they inherit these
+# instead of having to pickle the tests.
+_shard_state = None
+
+
+def _run_shard(index):
+    runner, shards = _shard_state
+    return runner.runShard(shards[index])
+
+
+def _fork_pool(workers):
+    """Returns a process pool whose workers are forked."""
+    if sys.version_info < (3, 7):
+        # mp_context is new in Python 3.7, before that the pool uses the
+        # default start method, which canShard checks is fork.
+        return ProcessPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+
+
+class ShardFixture(object):
+    """Stands in for a class or module fixture of a shard (eg.
+    setUpClass) in the results of the main process, since only tests can
+    be referred to by their index in the shard.
+    """
+
+    def __init__(self, description):
+        self.description = description
+
+    def id(self):
+        return self.description
+
+    def shortDescription(self):
+        return None
+
+    def countTestCases(self):
+        return 0
+
+    def __str__(self):
+        return self.description
+
+    def __repr__(self):
+        return "<ShardFixture {0}>".format(self.description)
+
 
 class JSONTestResult(result.TestResult):
     """A test result class that can print formatted text results to a stream.
@@ -19,6 +67,10 @@ class JSONTestResult(result.TestResult):
         self.descriptions = descriptions
         self.results = results
         self.leaderboard = leaderboard
+        # The test of every entry of results and leaderboard, so sharded
+        # runs can put them back in order.
+        self.result_tests = []
+        self.leaderboard_tests = []
 
     def getDescription(self, test):
         doc_first_line = test.shortDescription()
@@ -101,8 +153,10 @@ class JSONTestResult(result.TestResult):
     def processResult(self, test, err=None):
         if self.getLeaderboardData(test)[0]:
             self.leaderboard.append(self.buildLeaderboardEntry(test))
+            self.leaderboard_tests.append(test)
         else:
             self.results.append(self.buildResult(test, err))
+            self.result_tests.append(test)
 
     def addSuccess(self, test):
         super(JSONTestResult, self).addSuccess(test)
@@ -127,7 +181,8 @@ class JSONTestRunner(object):
 
     def __init__(self, stream=sys.stdout, descriptions=True, verbosity=1,
                  failfast=False, buffer=True, visibility=None,
-                 stdout_visibility=None, post_processor=None):
+                 stdout_visibility=None, post_processor=None,
+                 workers=None, shard_by="module"):
         """
         Set buffer to True to include test output in JSON
 
@@ -136,8 +191,20 @@ class JSONTestRunner(object):
         data before it is written, allowing the caller to overwrite the
         test results (e.g. add a late penalty) by editing the results
         dict in the first argument.
+
+        workers: if more than 1, the suite is split into shards by module
+        (or by test class if shard_by is "class") which run in that many
+        forked processes. The results are put back in the order the tests
+        have in the suite so the JSON is the same as when running in one
+        process.
+        When sharding by class, setUpModule and tearDownModule run once
+        per class shard instead of once per module.
         """
+        if shard_by not in ("class", "module"):
+            raise ValueError("shard_by must be either \"class\" or \"module\"!")
         self.stream = stream
+        self.workers = workers
+        self.shard_by = shard_by
         self.descriptions = descriptions
         self.verbosity = verbosity
         self.failfast = failfast
@@ -155,6 +222,190 @@ class JSONTestRunner(object):
         return self.resultclass(self.stream, self.descriptions, self.verbosity,
                                 self.json_data["tests"], self.json_data["leaderboard"])
 
+    def getTests(self, test):
+        """Returns the test cases in the test (case or suite) in the order
+        they run in one process.
+        """
+        tests = []
+
+        def visit(t):
+            if isinstance(t, unittest.TestSuite):
+                for sub in t:
+                    visit(sub)
+                return
+            tests.append(t)
+
+        visit(test)
+        return tests
+
+    def getShards(self, test):
+        """Splits the test (case or suite) into lists of test cases which
+        share a class (or a module), in the order they first appear.
+        """
+        shards = {}
+        for t in self.getTests(test):
+            cls = type(t)
+            if self.shard_by == "module":
+                key = cls.__module__
+            else:
+                key = (cls.__module__, cls.__qualname__)
+            shards.setdefault(key, []).append(t)
+        return list(shards.values())
+
+    def runShard(self, tests):
+        """Runs a shard in a worker and returns its results in a form
+        which can be sent back to the main process. Tests are referred to
+        by their index in the shard.
+        """
+        shard_result = self.resultclass(self.stream, self.descriptions, self.verbosity, [], [])
+        shard_result.failfast = self.failfast
+        shard_result.buffer = self.buffer
+        stdout, stderr = io.StringIO(), io.StringIO()
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            shard_result.startTestRun()
+            try:
+                unittest.TestSuite(tests)(shard_result)
+            finally:
+                shard_result.stopTestRun()
+        finally:
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+        indices = {id(t): i for i, t in enumerate(tests)}
+
+        def export(pairs):
+            return [(indices.get(id(t)), str(t), reason) for t, reason in pairs]
+
+        return {
+            "tests": shard_result.results,
+            "testIndices": [indices.get(id(t)) for t in shard_result.result_tests],
+            "leaderboard": shard_result.leaderboard,
+            "leaderboardIndices": [indices.get(id(t)) for t in shard_result.leaderboard_tests],
+            "testsRun": shard_result.testsRun,
+            "failures": export(shard_result.failures),
+            "errors": export(shard_result.errors),
+            "skipped": export(shard_result.skipped),
+            "expectedFailures": export(shard_result.expectedFailures),
+            "unexpectedSuccesses": export((t, None) for t in shard_result.unexpectedSuccesses),
+            "shouldStop": shard_result.shouldStop,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+
+    def crashedShard(self, result, tests, exc):
+        """The results of a shard whose worker died (eg. the student's
+        code crashed the interpreter or called os._exit).
+        """
+        message = "Test Failed: The process running this test crashed! ({0})\n".format(exc)
+        tests_data = []
+        for t in tests:
+            tests_data.append({
+                "name": result.getDescription(t),
+                "score": 0.0,
+                "max_score": result.getWeight(t),
+                "output": message,
+            })
+        return {
+            "tests": tests_data,
+            "testIndices": list(range(len(tests))),
+            "leaderboard": [],
+            "leaderboardIndices": [],
+            "testsRun": len(tests),
+            "failures": [],
+            "errors": [(i, str(t), message) for i, t in enumerate(tests)],
+            "skipped": [],
+            "expectedFailures": [],
+            "unexpectedSuccesses": [],
+            "shouldStop": self.failfast,
+            "stdout": "",
+            "stderr": "",
+        }
+
+    def rerunShard(self, result, shards, index):
+        """Reruns a shard on its own after the pool broke so only the shard
+        which crashed the worker is reported as crashed.
+        """
+        try:
+            with _fork_pool(1) as pool:
+                return pool.submit(_run_shard, index).result()
+        except BrokenProcessPool as exc:
+            return self.crashedShard(result, shards[index], exc)
+
+    @staticmethod
+    def getPositions(tests, indices, positions):
+        """Returns the position in the suite of the test of every result of
+        a shard. Results which are not tied to a test stay after the result
+        before them.
+        """
+        keys = []
+        last = positions[id(tests[0])] if tests else 0
+        for i in indices:
+            if i is not None:
+                last = positions[id(tests[i])]
+            keys.append(last)
+        return keys
+
+    def mergeShard(self, result, tests, data):
+        sys.stdout.write(data["stdout"])
+        sys.stderr.write(data["stderr"])
+        result.results.extend(data["tests"])
+        result.leaderboard.extend(data["leaderboard"])
+        result.testsRun += data["testsRun"]
+
+        def get_test(index, description):
+            if index is None:
+                # Errors in class or module fixtures are not tied to a test.
+                return ShardFixture(description)
+            return tests[index]
+
+        for name in ("failures", "errors", "skipped", "expectedFailures"):
+            getattr(result, name).extend((get_test(i, d), reason) for i, d, reason in data[name])
+        result.unexpectedSuccesses.extend(get_test(i, d) for i, d, _ in data["unexpectedSuccesses"])
+        if data["shouldStop"]:
+            result.shouldStop = True
+
+    def runShards(self, result, shards, tests=None):
+        """Runs the shards in forked workers and merges their results into
+        result in the order of tests (the test cases of the suite, see
+        getTests), which defaults to the order of the shards.
+        """
+        global _shard_state
+        _shard_state = (self, shards)
+        if tests is None:
+            tests = [t for shard in shards for t in shard]
+        positions = {id(t): i for i, t in enumerate(tests)}
+        start, leaderboard_start = len(result.results), len(result.leaderboard)
+        keys, leaderboard_keys = [], []
+        try:
+            with _fork_pool(self.workers) as pool:
+                futures = [pool.submit(_run_shard, i) for i in range(len(shards))]
+                for index, future in enumerate(futures):
+                    try:
+                        data = future.result()
+                    except BrokenProcessPool:
+                        data = self.rerunShard(result, shards, index)
+                    self.mergeShard(result, shards[index], data)
+                    keys += self.getPositions(shards[index], data["testIndices"], positions)
+                    leaderboard_keys += self.getPositions(shards[index], data["leaderboardIndices"], positions)
+                    if self.failfast and result.shouldStop:
+                        for f in futures:
+                            f.cancel()
+                        break
+        finally:
+            _shard_state = None
+        # sorted is stable so results of the same test keep their order.
+        for entries, first, entry_keys in ((result.results, start, keys), (result.leaderboard, leaderboard_start, leaderboard_keys)):
+            order = sorted(range(len(entry_keys)), key=entry_keys.__getitem__)
+            entries[first:] = [entries[first + i] for i in order]
+
+    def canShard(self, shards):
+        can_fork = "fork" in multiprocessing.get_all_start_methods()
+        if sys.version_info < (3, 7):
+            # The pool can only use the default start method (see _fork_pool).
+            can_fork = can_fork and multiprocessing.get_start_method(allow_none=True) in (None, "fork")
+        return (self.workers is not None and self.workers > 1 and len(shards) > 1
+                and can_fork)
+
     def run(self, test):
         "Run the given test case or test suite."
         result = self._makeResult()
@@ -162,15 +413,19 @@ class JSONTestRunner(object):
         result.failfast = self.failfast
         result.buffer = self.buffer
         startTime = time.time()
-        startTestRun = getattr(result, 'startTestRun', None)
-        if startTestRun is not None:
-            startTestRun()
-        try:
-            test(result)
-        finally:
-            stopTestRun = getattr(result, 'stopTestRun', None)
-            if stopTestRun is not None:
-                stopTestRun()
+        shards = self.getShards(test) if self.workers is not None and self.workers > 1 else []
+        if self.canShard(shards):
+            self.runShards(result, shards, self.getTests(test))
+        else:
+            startTestRun = getattr(result, 'startTestRun', None)
+            if startTestRun is not None:
+                startTestRun()
+            try:
+                test(result)
+            finally:
+                stopTestRun = getattr(result, 'stopTestRun', None)
+                if stopTestRun is not None:
+                    stopTestRun()
         stopTime = time.time()
         timeTaken = stopTime - startTime
 
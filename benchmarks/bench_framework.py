@@ -0,0 +1,387 @@
+"""
+Benchmarks the overhead of GradescopeBase itself on synthetic autograders.
+
+Every benchmark builds its autograder in a temporary directory (with IS_LOCAL=true) so nothing
+outside of it is touched, then times only the part of the framework it is named after. The
+results are written as JSON which can be compared against an earlier run:
+
+    python benchmarks/bench_framework.py -o before.json
+    python benchmarks/bench_framework.py -o after.json --compare before.json
+
+--compare exits with a non-zero status if the median of any benchmark got slower than the
+threshold so it can be used to catch regressions in the hot paths before a deadline.
+"""
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["IS_LOCAL"] = "true"
+
+from GradescopeBase import Autograder, AutograderTest, AutograderSubTest, RateLimit, SubTestRunner
+from GradescopeBase.AutograderSetup import global_setups
+from GradescopeBase.AutograderTeardown import global_teardowns
+from GradescopeBase.AutograderTest import global_tests
+from GradescopeBase.Utils import VERSION
+
+FORMAT_VERSION = 1
+
+benchmarks = []
+
+def benchmark(name: str, quick: bool=True, **params):
+    """
+    Registers a benchmark. The decorated function gets the params and returns a (setup, run)
+    pair: setup is called before every repeat (untimed) and its result is passed to run (timed).
+    Benchmarks with quick=False are skipped when running with --quick.
+    """
+    def inner(func):
+        # Decorators are applied bottom up so this keeps the benchmarks of func in the order they are written.
+        index = next((i for i, b in enumerate(benchmarks) if b["func"] is func), len(benchmarks))
+        benchmarks.insert(index, {"name": name, "func": func, "params": params, "quick": quick})
+        return func
+    return inner
+
+def clear_globals():
+    global_tests.clear()
+    global_setups.clear()
+    global_teardowns.clear()
+
+def timestamp(t: float) -> str:
+    """
+    Formats t the way Gradescope does in submission_metadata.json.
+    """
+    return datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%dT%H:%M:%S.%f") + "-08:00"
+
+def write_metadata(previous_submissions: int, output_size: int=200, tests_per_submission: int=10):
+    """
+    Writes a submission_metadata.json with previous_submissions submissions made over the last
+    week, each with tests_per_submission tests which printed output_size characters.
+    """
+    rng = random.Random(previous_submissions)
+    now = time.time()
+    times = sorted(now - rng.uniform(0, 7 * 24 * 60 * 60) for _ in range(previous_submissions))
+    prev_subs = []
+    for i, t in enumerate(times):
+        prev_subs.append({
+            "submission_time": timestamp(t),
+            "score": 10.0,
+            "results": {
+                "score": 10.0,
+                "execution_time": 1.0,
+                "extra_data": {"id": i, "sub_counts": rng.randint(0, 1)},
+                "tests": [
+                    {"name": f"Test {j}", "score": 1, "max_score": 1, "output": "x" * output_size}
+                    for j in range(tests_per_submission)
+                ],
+            },
+        })
+    metadata = {
+        "id": previous_submissions,
+        "created_at": timestamp(now),
+        "assignment": {"title": "Benchmark"},
+        "users": [{"email": "student@example.com", "name": "Student"}],
+        "previous_submissions": prev_subs,
+    }
+    with open("submission_metadata.json", "w") as f:
+        json.dump(metadata, f)
+
+def new_autograder(**kwargs) -> Autograder:
+    return Autograder(print_welcome_message=False, **kwargs)
+
+def add_tests(ag: Autograder, count: int, output_size: int=0, chunk_size: int=1000):
+    line = "x" * (chunk_size - 1)
+    chunks = output_size // chunk_size
+    def test_fn(ag, test):
+        for _ in range(chunks):
+            test.print(line)
+        return True
+    for i in range(count):
+        ag.add_test(AutograderTest(test_fn, name=f"Test {i}", max_score=1, number=str(i)))
+    clear_globals()
+    return ag
+
+def add_subtest_tree(test: AutograderTest, depth: int, width: int, runner_kwargs: dict):
+    """
+    Gives test width subtests, each of which has a tree of subtests depth - 1 levels deep.
+    """
+    test.test_fn = SubTestRunner(**runner_kwargs)
+    for i in range(width):
+        if depth <= 1:
+            AutograderSubTest(test, lambda ag, t: True, name=f"{test.name}.{i}", max_score=1, number=str(i))
+        else:
+            sub = AutograderSubTest(test, SubTestRunner(**runner_kwargs), name=f"{test.name}.{i}", max_score=1, number=str(i))
+            add_subtest_tree(sub, depth - 1, width, runner_kwargs)
+
+@benchmark("import_tests", tests=1)
+@benchmark("import_tests", tests=100)
+@benchmark("import_tests", tests=10000, quick=False)
+def bench_import_tests(tests: int, tests_per_file: int=100):
+    # The repo has a tests package of its own, so the test files get a package no one else uses.
+    package = f"bench_tests_{os.getpid()}_{tests}"
+    os.makedirs(package, exist_ok=True)
+    open(os.path.join(package, "__init__.py"), "w").close()
+    for i in range(0, tests, tests_per_file):
+        with open(os.path.join(package, f"test_{i:06d}.py"), "w") as f:
+            f.write("from GradescopeBase import Test\n")
+            for j in range(i, min(i + tests_per_file, tests)):
+                f.write(f"@Test('Test {j}', 1)\ndef test_{j}(ag, test):\n    return True\n")
+    def setup():
+        # Forget the previous import so the test files are imported (and their tests created) again.
+        for module in [m for m in sys.modules if m == package or m.startswith(package + ".")]:
+            del sys.modules[module]
+        clear_globals()
+        return new_autograder()
+    def run(ag):
+        ag.import_tests(tests_dir=package, blacklist=[], verbose=False)
+        # import_tests only prints the files it could not import, so make sure it did not measure nothing.
+        assert len(global_tests) == tests, f"imported {len(global_tests)} of {tests} tests"
+    return setup, run
+
+@benchmark("run_tests", tests=1)
+@benchmark("run_tests", tests=100)
+@benchmark("run_tests", tests=1000)
+@benchmark("run_tests", tests=10000, export_every_n_tests=100, quick=False)
+@benchmark("run_tests", tests=10000, export_tests_after_test=False, quick=False)
+@benchmark("run_tests", tests=100, export_tests_after_test=False)
+@benchmark("run_tests", tests=100, parallel=8)
+def bench_run_tests(tests: int, export_tests_after_test: bool=True, export_every_n_tests: int=1, parallel: int=None):
+    def setup():
+        ag = new_autograder(export_tests_after_test=export_tests_after_test, export_every_n_tests=export_every_n_tests, parallel=parallel)
+        return add_tests(ag, tests)
+    def run(ag):
+        ag.run_tests()
+    return setup, run
+
+@benchmark("run_tests_async", tests=100)
+@benchmark("run_tests_async", tests=1000, async_concurrency=10)
+def bench_run_tests_async(tests: int, async_concurrency: int=None):
+    async def test_fn(ag, test):
+        await asyncio.sleep(0)
+        return True
+    def setup():
+        ag = new_autograder(export_tests_after_test=False, async_concurrency=async_concurrency)
+        for i in range(tests):
+            ag.add_test(AutograderTest(test_fn, name=f"Test {i}", max_score=1, number=str(i)))
+        clear_globals()
+        return ag
+    def run(ag):
+        ag.run_tests()
+    return setup, run
+
+@benchmark("run_tests_large_output", tests=10, output_size=1000000)
+@benchmark("run_tests_large_output", tests=10, output_size=1000000, max_test_output_bytes=10000)
+def bench_run_tests_large_output(tests: int, output_size: int, max_test_output_bytes: int=None):
+    def setup():
+        ag = new_autograder(export_tests_after_test=False, max_test_output_bytes=max_test_output_bytes)
+        return add_tests(ag, tests, output_size=output_size)
+    def run(ag):
+        ag.run_tests()
+    return setup, run
+
+@benchmark("generate_results", tests=1)
+@benchmark("generate_results", tests=100)
+@benchmark("generate_results", tests=10000, quick=False)
+@benchmark("generate_results", tests=10, output_size=1000000)
+def bench_generate_results(tests: int, output_size: int=0):
+    ag = add_tests(new_autograder(export_tests_after_test=False), tests, output_size=output_size)
+    ag.run_tests()
+    def setup():
+        return ag
+    def run(ag):
+        ag.generate_results(dump=False)
+    return setup, run
+
+@benchmark("dump_results", tests=1)
+@benchmark("dump_results", tests=100)
+@benchmark("dump_results", tests=10000, quick=False)
+@benchmark("dump_results", tests=10, output_size=1000000)
+def bench_dump_results(tests: int, output_size: int=0):
+    ag = add_tests(new_autograder(export_tests_after_test=False), tests, output_size=output_size)
+    ag.run_tests()
+    results = ag.generate_results(dump=False)
+    def setup():
+        return ag
+    def run(ag):
+        ag.dump_results(results)
+    return setup, run
+
+@benchmark("rate_limit_main", previous_submissions=1000)
+@benchmark("rate_limit_main", previous_submissions=1000, output_size=10000)
+@benchmark("rate_limit_main", previous_submissions=1000, pull_prev_run=True, tokens=1)
+def bench_rate_limit_main(previous_submissions: int, output_size: int=200, tokens: int=1000, pull_prev_run: bool=False):
+    write_metadata(previous_submissions, output_size=output_size)
+    def setup():
+        # The metadata is loaded as part of creating the autograder which is timed separately.
+        ag = new_autograder(rate_limit=RateLimit(tokens=tokens, days=1, pull_prev_run=pull_prev_run))
+        ag.use_ratelimit_when_local = True
+        return ag
+    def run(ag):
+        try:
+            ag.rate_limit.rate_limit_main(ag)
+        except SystemExit:
+            # Students without tokens get the results of their last submission and the autograder exits.
+            pass
+    return setup, run
+
+@benchmark("load_metadata", previous_submissions=1000)
+@benchmark("load_metadata", previous_submissions=1000, output_size=10000)
+def bench_load_metadata(previous_submissions: int, output_size: int=200):
+    write_metadata(previous_submissions, output_size=output_size)
+    def setup():
+        return None
+    def run(_):
+        new_autograder()
+    return setup, run
+
+@benchmark("subtest_runner", depth=1, width=1000)
+@benchmark("subtest_runner", depth=3, width=10)
+@benchmark("subtest_runner", depth=5, width=4)
+@benchmark("subtest_runner", depth=3, width=10, is_pass_fail=False)
+@benchmark("subtest_runner", depth=1, width=1000, parallel=8)
+def bench_subtest_runner(depth: int, width: int, is_pass_fail: bool=True, parallel: int=None):
+    def setup():
+        ag = new_autograder(export_tests_after_test=False)
+        test = AutograderTest(name="Tree", max_score=1)
+        add_subtest_tree(test, depth, width, {"is_pass_fail": is_pass_fail, "parallel": parallel})
+        ag.add_test(test)
+        clear_globals()
+        return ag
+    def run(ag):
+        ag.run_tests()
+    return setup, run
+
+def summarize(times: list) -> dict:
+    return {
+        "repeat": len(times),
+        "min": min(times),
+        "max": max(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "times": times,
+    }
+
+def get_key(name: str, params: dict) -> str:
+    if not params:
+        return name
+    return name + "[" + ",".join(f"{k}={v}" for k, v in sorted(params.items())) + "]"
+
+def run_benchmark(b: dict, repeat: int) -> dict:
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="gsbase_bench_")
+    try:
+        os.chdir(workdir)
+        # Test files are imported relative to the working directory like in a real autograder.
+        sys.path.insert(0, workdir)
+        os.makedirs("results")
+        clear_globals()
+        setup, run = b["func"](**b["params"])
+        # One untimed run warms up caches (imports, lru caches, the filesystem).
+        run(setup())
+        times = []
+        for _ in range(repeat):
+            state = setup()
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                run(state)
+                times.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+        return times
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(workdir)
+        clear_globals()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_benchmarks(repeat: int=5, quick: bool=False, pattern: str=None, verbose: bool=True) -> dict:
+    results = {}
+    for b in benchmarks:
+        if quick and not b["quick"]:
+            continue
+        key = get_key(b["name"], b["params"])
+        if pattern is not None and not re.search(pattern, key):
+            continue
+        times = run_benchmark(b, repeat)
+        results[key] = dict(name=b["name"], params=b["params"], **summarize(times))
+        if verbose:
+            r = results[key]
+            print(f"{key:<72} median {r['median'] * 1000:10.3f} ms  min {r['min'] * 1000:10.3f} ms  stddev {r['stddev'] * 1000:8.3f} ms", file=sys.stderr)
+    return {
+        "format_version": FORMAT_VERSION,
+        "gradescopebase_version": VERSION,
+        "created_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "quick": quick,
+        "benchmarks": results,
+    }
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Prints how every benchmark in both runs changed and returns the keys of the ones whose
+    median got slower by more than threshold (eg. 0.1 for 10%).
+    """
+    if baseline.get("format_version") != current.get("format_version"):
+        print("[WARNING]: The benchmark results were written by different versions of the benchmark suite!")
+    regressions = []
+    for key, cur in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(key)
+        if base is None:
+            print(f"{key:<72} (new)")
+            continue
+        ratio = cur["median"] / base["median"] if base["median"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  (faster)"
+        print(f"{key:<72} {base['median'] * 1000:10.3f} ms -> {cur['median'] * 1000:10.3f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the overhead of GradescopeBase.")
+    parser.add_argument("-o", "--output", help="Where to write the results JSON (default: stdout).")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="How many timed runs each benchmark gets.")
+    parser.add_argument("-k", "--filter", dest="pattern", help="Only run benchmarks whose key matches this regex.")
+    parser.add_argument("--quick", action="store_true", help="Skip the largest benchmarks.")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown of the median which counts as a regression.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(repeat=args.repeat, quick=args.quick, pattern=args.pattern)
+    data = json.dumps(results, indent=2)
+    if args.output is None:
+        print(data)
+    else:
+        with open(args.output, "w") as f:
+            f.write(data)
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}!")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -93,6 +93,7 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'numeric': ['numpy'],
     },
 
     # If there are data files included in your packages that need to be
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from GradescopeBase.AutograderSetup import global_setups
+from GradescopeBase.AutograderTeardown import global_teardowns
+from GradescopeBase.AutograderTest import global_tests
+
+class AutograderTestCase(unittest.TestCase):
+    """
+    Runs every test in a new directory set up like a local run (with results and submission
+    directories) and forgets the tests, setups and teardowns it created afterwards.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        os.makedirs("results")
+        os.makedirs("submission")
+        self.is_local = os.environ.get("IS_LOCAL")
+        os.environ["IS_LOCAL"] = "true"
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        if self.is_local is None:
+            os.environ.pop("IS_LOCAL", None)
+        else:
+            os.environ["IS_LOCAL"] = self.is_local
+        self.clear_globals()
+
+    def clear_globals(self):
+        """
+        Forgets the tests, setups and teardowns created so far, eg. to run another autograder.
+        """
+        for registered in (global_tests, global_setups, global_teardowns):
+            del registered[:]
+
+    def write_submission(self, path: str, content: str):
+        path = os.path.join("submission", path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def write_metadata(self, *previous_results: dict):
+        """
+        Writes a submission_metadata.json with a previous submission for each of the results given.
+        """
+        previous_submissions = [
+            {"submission_time": "2020-01-01T00:00:00.000000-08:00", "score": results.get("score", 0), "results": results}
+            for results in previous_results
+        ]
+        metadata = {
+            "id": len(previous_submissions),
+            "created_at": "2020-01-02T00:00:00.000000-08:00",
+            "assignment": {"title": "Test"},
+            "users": [{"email": "student@example.com", "name": "Student"}],
+            "previous_submissions": previous_submissions,
+        }
+        with open("submission_metadata.json", "w") as f:
+            json.dump(metadata, f)
+
+    def run_autograder(self, ag) -> dict:
+        """
+        Runs the autograder with the tests, setups and teardowns created so far and returns its
+        results with the tests by name.
+        """
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                ag.run()
+            except SystemExit:
+                pass
+        with open(ag.results_file) as f:
+            results = json.load(f)
+        results["by_name"] = {t["name"]: t for t in results.get("tests", [])}
+        return results
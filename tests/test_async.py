@@ -0,0 +1,83 @@
+import asyncio
+import time
+import unittest
+
+from GradescopeBase import Autograder, AutograderSubTest, AutograderTest, SubTestRunner
+
+from .helpers import AutograderTestCase
+
+def sleeper(seconds: float, result=True):
+    async def fn(ag, test):
+        await asyncio.sleep(seconds)
+        test.print(f"slept {seconds}")
+        return result
+    return fn
+
+class TestAsyncTests(AutograderTestCase):
+    def test_async_tests_run_together(self):
+        for i in range(5):
+            AutograderTest(sleeper(0.3), name=f"t{i}", max_score=1)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False))
+        self.assertLess(time.monotonic() - start, 1.2)
+        self.assertEqual([t["score"] for t in results["tests"]], [1] * 5)
+
+    def test_async_concurrency(self):
+        for i in range(4):
+            AutograderTest(sleeper(0.2), name=f"t{i}", max_score=1)
+        start = time.monotonic()
+        self.run_autograder(Autograder(print_welcome_message=False, async_concurrency=1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.8)
+
+    def test_timeout_cancels(self):
+        AutograderTest(sleeper(5), name="slow", max_score=1, timeout=0.2)
+        AutograderTest(sleeper(0.1), name="fast", max_score=1, timeout=2)
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertEqual(results["slow"]["score"], 0)
+        self.assertIn("timed out", results["slow"]["output"])
+        self.assertEqual(results["fast"]["score"], 1)
+
+class TestAsyncSubTests(AutograderTestCase):
+    def make_parent(self, runner: SubTestRunner, count: int=5, seconds: float=0.3) -> AutograderTest:
+        parent = AutograderTest(runner, name="parent", max_score=count)
+        for i in range(count):
+            AutograderSubTest(parent, sleeper(seconds), name=f"s{i}", max_score=1)
+        return parent
+
+    def test_subtests_run_together_in_order(self):
+        self.make_parent(SubTestRunner(is_pass_fail=False))
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertLess(time.monotonic() - start, 1.2)
+        self.assertEqual(results["parent"]["score"], 5)
+        output = results["parent"]["output"]
+        positions = [output.index(f"[SubTest]: s{i}") for i in range(5)]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_subtest_concurrency(self):
+        self.make_parent(SubTestRunner(is_pass_fail=False, async_concurrency=2), count=4, seconds=0.2)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(results["parent"]["score"], 4)
+
+    def test_overridden_run_test_is_used(self):
+        class Runner(SubTestRunner):
+            def run_test(self, ag, test, t, data):
+                t.print("checked by run_test")
+                return super().run_test(ag, test, t, data)
+        self.make_parent(Runner(is_pass_fail=False), count=2, seconds=0.01)
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertEqual(results["parent"]["output"].count("checked by run_test"), 2)
+
+    def test_short_circuit(self):
+        parent = AutograderTest(SubTestRunner(short_circuit=True), name="parent", max_score=1)
+        AutograderSubTest(parent, sleeper(0.01, result=False), name="fails", max_score=1)
+        AutograderSubTest(parent, sleeper(0.01), name="async", max_score=1)
+        AutograderSubTest(parent, lambda ag, t: True, name="sync", max_score=1)
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertEqual(results["parent"]["score"], 0)
+        self.assertEqual(results["parent"]["output"].count("NOT RUN"), 2)
+
+if __name__ == "__main__":
+    unittest.main()
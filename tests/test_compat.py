@@ -0,0 +1,45 @@
+import os
+import re
+import shutil
+import subprocess
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def oldest_python() -> str:
+    """
+    Returns the interpreter of the oldest Python version setup.py supports, if it is installed.
+    """
+    with open(os.path.join(ROOT, "setup.py")) as f:
+        version = re.search(r'python_requires\s*=\s*">=\s*([0-9.]+)"', f.read()).group(1)
+    python = os.environ.get("OLDEST_PYTHON") or shutil.which(f"python{version}")
+    # eg. a pyenv shim of a version which is not selected does not run.
+    if python is None or subprocess.run([python, "-c", "pass"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode != 0:
+        return None
+    return python
+
+class TestOldestPython(unittest.TestCase):
+    def setUp(self):
+        self.python = oldest_python()
+        if self.python is None:
+            self.skipTest("The oldest supported Python is not installed.")
+
+    def run_python(self, code: str):
+        p = subprocess.run([self.python, "-c", code], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        self.assertEqual(p.returncode, 0, p.stdout)
+        return p.stdout
+
+    def test_import(self):
+        self.run_python("import GradescopeBase, GradescopeBase.autograder_utils.json_test_runner, GradescopeBase.autograder_utils.files")
+
+    def test_compile(self):
+        # Every module is compiled, including the ones the package does not import.
+        self.run_python(
+            "import os\n"
+            "for d, _, files in os.walk('GradescopeBase'):\n"
+            "    for name in files:\n"
+            "        if name.endswith('.py'):\n"
+            "            path = os.path.join(d, name)\n"
+            "            with open(path, encoding='utf-8') as f:\n"
+            "                compile(f.read(), path, 'exec')\n"
+        )
@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+import time
+import unittest
+
+from GradescopeBase import Autograder, AutograderTest
+from GradescopeBase.AutograderForkServer import SubmissionForkServer
+
+from .helpers import AutograderTestCase
+
+GRADER = '''
+import os
+import time
+from GradescopeBase import Autograder, AutograderSetup, AutograderTest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+state = {"warm": False}
+
+def make_autograder():
+    def warm(ag):
+        with open(os.path.join(HERE, "warm.log"), "a") as f:
+            f.write("warm\\n")
+        state["warm"] = True
+        return True
+    def answer(ag, test):
+        test.print(f"warm: {state['warm']}")
+        with open("submission/answer.txt") as f:
+            answer = f.read().strip()
+        if answer == "hang":
+            time.sleep(30)
+        return answer == "42"
+    AutograderSetup(warm, "warm", warm=True)
+    AutograderTest(answer, name="answer", max_score=1)
+    return Autograder(print_welcome_message=False)
+'''
+
+class TestForkTests(AutograderTestCase):
+    def test_tests_start_from_the_same_state(self):
+        state = []
+        def change(ag, test):
+            state.append(test.name)
+            ag.extra_data[test.name] = len(state)
+            return True
+        for name in ("a", "b"):
+            AutograderTest(change, name=name, max_score=1)
+        results = self.run_autograder(Autograder(print_welcome_message=False, fork_tests=True, parallel=2))
+        self.assertEqual(results["extra_data"]["a"], 1)
+        self.assertEqual(results["extra_data"]["b"], 1)
+        self.assertEqual(state, [])
+
+    def test_crash_and_timeout(self):
+        AutograderTest(lambda ag, t: os._exit(3), name="exits", max_score=1)
+        AutograderTest(lambda ag, t: time.sleep(30), name="hangs", max_score=1, timeout=0.5)
+        AutograderTest(lambda ag, t: True, name="passes", max_score=1)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False, fork_tests=True))["by_name"]
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(results["exits"]["score"], 0)
+        self.assertIn("exited with code 3", results["exits"]["output"])
+        self.assertEqual(results["hangs"]["score"], 0)
+        self.assertIn("timed out", results["hangs"]["output"])
+        self.assertEqual(results["passes"]["score"], 1)
+
+class TestSubmissionForkServer(AutograderTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs("source")
+        with open("source/fork_server_grader.py", "w") as f:
+            f.write(GRADER)
+        self.server = SubmissionForkServer("source", "fork_server_grader:make_autograder")
+
+    def tearDown(self):
+        self.server.stop()
+        sys.path[:] = [p for p in sys.path if p != os.path.abspath("source")]
+        super().tearDown()
+
+    def make_workdir(self, name: str, answer: str) -> str:
+        workdir = os.path.abspath(name)
+        os.makedirs(os.path.join(workdir, "submission"))
+        os.makedirs(os.path.join(workdir, "results"))
+        with open(os.path.join(workdir, "submission", "answer.txt"), "w") as f:
+            f.write(answer)
+        return workdir
+
+    def test_warm_setups_run_once(self):
+        self.assertTrue(self.server.start())
+        scores = []
+        for i, answer in enumerate(("42", "41", "42")):
+            workdir = self.make_workdir(f"sub{i}", answer)
+            returncode, timed_out = self.server.grade(workdir, os.path.join(workdir, "log.txt"), timeout=30)
+            self.assertEqual((returncode, timed_out), (0, False))
+            results = self.load_results(workdir)
+            self.assertIn("warm: True", results["tests"][0]["output"])
+            scores.append(results["tests"][0]["score"])
+        self.assertEqual(scores, [1, 0, 1])
+        with open("source/warm.log") as f:
+            self.assertEqual(f.read(), "warm\n")
+
+    def test_timeout_kills_the_submission(self):
+        self.assertTrue(self.server.start())
+        workdir = self.make_workdir("sub", "hang")
+        start = time.monotonic()
+        returncode, timed_out = self.server.grade(workdir, os.path.join(workdir, "log.txt"), timeout=0.5)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertTrue(timed_out)
+        self.assertEqual(returncode, -9)
+
+    def load_results(self, workdir: str) -> dict:
+        with open(os.path.join(workdir, "results", "results.json")) as f:
+            return json.load(f)
+
+if __name__ == "__main__":
+    unittest.main()
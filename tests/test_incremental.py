@@ -0,0 +1,68 @@
+import unittest
+
+from GradescopeBase import Autograder, AutograderTest
+
+from .helpers import AutograderTestCase
+
+class TestIncrementalRegrade(AutograderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_submission("a.py", "a = 1\n")
+        self.write_submission("b.py", "b = 1\n")
+
+    def grade(self, ran: list, **kwargs) -> dict:
+        """
+        Runs an autograder with a test for each file and one without dependencies, and returns
+        its results with the tests by name. The names of the tests which ran are added to ran.
+        """
+        self.clear_globals()
+        def make_fn(name, result=True):
+            def fn(ag, test):
+                ran.append(name)
+                test.print(f"ran {name}")
+                if isinstance(result, Exception):
+                    raise result
+                return result
+            return fn
+        AutograderTest(make_fn("a"), name="a", max_score=1, depends_on=["a.py"])
+        AutograderTest(make_fn("b", result=0.5), name="b", max_score=1, depends_on=["*.py"])
+        AutograderTest(make_fn("always"), name="always", max_score=1)
+        AutograderTest(make_fn("errors", result=RuntimeError("oops")), name="errors", max_score=1, depends_on=["a.py"])
+        return self.run_autograder(Autograder(print_welcome_message=False, **kwargs))
+
+    def test_unchanged_tests_are_reused(self):
+        ran = []
+        first = self.grade(ran)
+        self.assertEqual(ran, ["a", "b", "always", "errors"])
+        del first["by_name"]
+        self.write_metadata(first)
+        ran = []
+        results = self.grade(ran)["by_name"]
+        # A test which did not complete normally is not reused.
+        self.assertEqual(ran, ["always", "errors"])
+        self.assertEqual(results["a"]["score"], 1)
+        self.assertEqual(results["b"]["score"], 0.5)
+        self.assertTrue(results["b"]["output"].startswith("[Reused]:"))
+        self.assertEqual(results["b"]["output"].count("[Reused]:"), 1)
+        self.assertIn("ran b", results["b"]["output"])
+
+    def test_changed_files_are_graded_again(self):
+        first = self.grade([])
+        del first["by_name"]
+        self.write_metadata(first)
+        self.write_submission("b.py", "b = 2\n")
+        ran = []
+        self.grade(ran)
+        self.assertEqual(ran, ["b", "always", "errors"])
+
+    def test_reuse_can_be_turned_off(self):
+        first = self.grade([])
+        del first["by_name"]
+        self.write_metadata(first)
+        ran = []
+        results = self.grade(ran, reuse_unchanged_tests=False)
+        self.assertEqual(ran, ["a", "b", "always", "errors"])
+        self.assertIn("dependency_hashes", results["extra_data"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import signal
+import sys
+import time
+import unittest
+
+from GradescopeBase import Autograder, AutograderSubTest, AutograderTest
+
+from .helpers import AutograderTestCase
+
+def crash(ag, test):
+    os.kill(os.getpid(), signal.SIGSEGV)
+
+def hang(ag, test):
+    # The alarm of the timeout can not interrupt this, so the worker has to be killed.
+    signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGALRM])
+    time.sleep(30)
+
+class TestIsolationPool(AutograderTestCase):
+    def assertNoChildren(self):
+        with self.assertRaises(ChildProcessError):
+            os.waitpid(-1, os.WNOHANG)
+
+    def test_crash_only_fails_the_test(self):
+        AutograderTest(crash, name="crash", max_score=1, isolate=True)
+        AutograderTest(lambda ag, t: True, name="after", max_score=1, isolate=True)
+        AutograderTest(lambda ag, t: True, name="plain", max_score=1)
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertEqual(results["crash"]["score"], 0)
+        self.assertIn("killed by SIGSEGV", results["crash"]["output"])
+        self.assertEqual(results["after"]["score"], 1)
+        self.assertEqual(results["plain"]["score"], 1)
+        self.assertNoChildren()
+
+    def test_results_come_back(self):
+        def fn(ag, test):
+            test.print("hello")
+            ag.extra_data["from_worker"] = os.getpid() != parent
+            ag.leaderboard.add_item("speed", 5)
+            return 0.5
+        parent = os.getpid()
+        AutograderTest(fn, name="fn", max_score=1, isolate=True)
+        results = self.run_autograder(Autograder(print_welcome_message=False))
+        self.assertEqual(results["by_name"]["fn"]["score"], 0.5)
+        self.assertEqual(results["by_name"]["fn"]["output"].strip(), "hello")
+        self.assertIs(results["extra_data"]["from_worker"], True)
+        self.assertEqual(results["leaderboard"], [{"name": "speed", "value": 5}])
+
+    def test_timeout_kills_the_worker(self):
+        AutograderTest(hang, name="hang", max_score=1, isolate=True, timeout=0.5)
+        AutograderTest(lambda ag, t: True, name="after", max_score=1, isolate=True)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(results["hang"]["score"], 0)
+        self.assertIn("timed out", results["hang"]["output"])
+        self.assertEqual(results["after"]["score"], 1)
+        self.assertNoChildren()
+
+    def test_system_exit_stops_like_without_isolation(self):
+        for isolate in (False, True):
+            AutograderTest(lambda ag, t: True, name="a", max_score=1, isolate=isolate)
+            AutograderTest(lambda ag, t: sys.exit(), name="b", max_score=1, isolate=isolate)
+            AutograderTest(lambda ag, t: True, name="c", max_score=1, isolate=isolate)
+            results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+            self.assertEqual(results["a"]["score"], 1)
+            self.assertNotIn("score", results["b"])
+            self.assertNotIn("score", results["c"])
+            self.assertNoChildren()
+            self.tearDown()
+            self.setUp()
+
+    def test_subtests(self):
+        parent = AutograderTest(name="parent", max_score=3)
+        AutograderSubTest(parent, lambda ag, t: True, name="s1", max_score=1, isolate=True)
+        AutograderSubTest(parent, crash, name="s2", max_score=1, isolate=True)
+        AutograderSubTest(parent, lambda ag, t: True, name="s3", max_score=1)
+        parent.test_fn.is_pass_fail = False
+        results = self.run_autograder(Autograder(print_welcome_message=False, parallel=2))["by_name"]
+        self.assertEqual(results["parent"]["score"], 2)
+        self.assertIn("killed by SIGSEGV", results["parent"]["output"])
+        self.assertNoChildren()
+
+if __name__ == "__main__":
+    unittest.main()
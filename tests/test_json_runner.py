@@ -0,0 +1,49 @@
+import io
+import json
+import unittest
+
+from GradescopeBase.autograder_utils.json_test_runner import JSONTestRunner
+
+def make_case(module: str, name: str, fail: bool=False):
+    def test(self):
+        print(f"output of {module}.{name}")
+        self.assertFalse(fail)
+    test.__doc__ = name
+    test.__weight__ = 1
+    cls = type(name, (unittest.TestCase,), {"test": test})
+    # The runner shards by the module of the class.
+    cls.__module__ = module
+    return cls("test")
+
+def interleaved_suite() -> unittest.TestSuite:
+    return unittest.TestSuite([
+        make_case("shard_a", "A1"),
+        make_case("shard_b", "B1", fail=True),
+        make_case("shard_a", "A2"),
+        make_case("shard_c", "C1"),
+        make_case("shard_b", "B2"),
+    ])
+
+def run_json(**kwargs) -> dict:
+    stream = io.StringIO()
+    JSONTestRunner(stream=stream, **kwargs).run(interleaved_suite())
+    data = json.loads(stream.getvalue())
+    del data["execution_time"]
+    return data
+
+class TestShards(unittest.TestCase):
+    def test_shards_keep_the_order_of_the_suite(self):
+        runner = JSONTestRunner(workers=2)
+        shards = runner.getShards(interleaved_suite())
+        self.assertEqual([[type(t).__name__ for t in shard] for shard in shards], [["A1", "A2"], ["B1", "B2"], ["C1"]])
+        self.assertTrue(runner.canShard(shards))
+
+    def test_sharded_results_match_one_process(self):
+        expected = run_json()
+        self.assertEqual([t["name"] for t in expected["tests"]], ["A1", "B1", "A2", "C1", "B2"])
+        self.assertEqual(expected["score"], 4)
+        for shard_by in ("module", "class"):
+            self.assertEqual(run_json(workers=3, shard_by=shard_by), expected)
+
+if __name__ == "__main__":
+    unittest.main()
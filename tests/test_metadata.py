@@ -0,0 +1,64 @@
+import copy
+import json
+import os
+import tempfile
+import unittest
+
+from GradescopeBase.AutograderMetadata import SubmissionMetadata
+
+METADATA = {
+    "id": 1234,
+    "created_at": "2020-01-30T16:13:26.123456-08:00",
+    "previous_submissions": [
+        {"submission_time": "2020-01-29T10:00:00.000000-08:00", "score": 1.0, "results": {"tests": [{"output": "a \" b"}], "extra_data": {"id": 1}}},
+        {"submission_time": "2020-01-29T11:00:00.000000-08:00", "score": 0.0, "results": {}},
+    ],
+    "users": [{"name": "Student", "email": "student@example.com"}],
+    "assignment": {},
+}
+
+class TestSubmissionMetadata(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(METADATA, f, indent=2)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def load(self):
+        return SubmissionMetadata.load(self.path)
+
+    def test_lookups(self):
+        metadata = self.load()
+        self.assertIsInstance(metadata, dict)
+        self.assertEqual(metadata["id"], 1234)
+        self.assertEqual(metadata["previous_submissions"][0]["results"]["extra_data"], {"id": 1})
+        self.assertEqual(metadata.get("missing"), None)
+        self.assertEqual(list(metadata), list(METADATA))
+        self.assertEqual(len(metadata), len(METADATA))
+
+    def test_same_as_json_load(self):
+        self.assertEqual(self.load(), METADATA)
+        self.assertEqual(METADATA, self.load())
+        self.assertEqual(dict(self.load()), METADATA)
+        self.assertEqual({**self.load()}, METADATA)
+        self.assertEqual(self.load().to_dict(), METADATA)
+        self.assertEqual(copy.deepcopy(self.load()), METADATA)
+
+    def test_json_dumps(self):
+        for kwargs in ({}, {"indent": 2}, {"sort_keys": True}):
+            self.assertEqual(json.dumps(self.load(), **kwargs), json.dumps(METADATA, **kwargs))
+
+    def test_assignment(self):
+        metadata = self.load()
+        metadata["id"] = 5
+        metadata["new"] = True
+        del metadata["assignment"]
+        expected = dict(METADATA, id=5, new=True)
+        del expected["assignment"]
+        self.assertEqual(metadata, expected)
+        self.assertEqual(json.loads(json.dumps(metadata)), expected)
+
+if __name__ == "__main__":
+    unittest.main()
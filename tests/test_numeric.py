@@ -0,0 +1,93 @@
+import math
+import unittest
+
+from GradescopeBase import AutograderTest, compare_arrays, parse_numbers
+
+from .helpers import AutograderTestCase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestParseNumbers(unittest.TestCase):
+    def test_whitespace(self):
+        arr = parse_numbers("1 2.5\n-3\t4e2\n")
+        self.assertEqual(arr.tolist(), [1, 2.5, -3, 400])
+
+    def test_bytes_sep_and_shape(self):
+        arr = parse_numbers(b"1,2,3,4,5,6", sep=",", shape=(2, 3), dtype="int64")
+        self.assertEqual(arr.tolist(), [[1, 2, 3], [4, 5, 6]])
+
+    def test_empty(self):
+        self.assertEqual(parse_numbers("").size, 0)
+
+    def test_nan_and_inf(self):
+        arr = parse_numbers("nan inf -inf")
+        self.assertTrue(math.isnan(arr[0]))
+        self.assertEqual(arr[1:].tolist(), [float("inf"), float("-inf")])
+
+    def test_bad_word(self):
+        with self.assertRaises(ValueError) as cm:
+            parse_numbers("1 2 three 4")
+        self.assertIn("number 2", str(cm.exception))
+        self.assertIn("'three'", str(cm.exception))
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            parse_numbers("1 2 3", shape=(2, 2))
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestCompareArrays(unittest.TestCase):
+    def test_match_within_tolerance(self):
+        res = compare_arrays([1.0, 2.0, 3.0], [1.0, 2.0 + 1e-12, 3.0])
+        self.assertTrue(res)
+        self.assertEqual(res.fraction, 1)
+
+    def test_mismatches(self):
+        res = compare_arrays([1, 2, 3, 4], [1, 5, 3, 0], max_report=1)
+        self.assertFalse(res)
+        self.assertEqual((res.matched, res.mismatches), (2, 2))
+        self.assertEqual(res.first_mismatches, [((1,), 2.0, 5.0)])
+        self.assertEqual(res.score(10), 5)
+        self.assertEqual(res.score(10, threshold=0.75), 0)
+        self.assertIn("and 1 more", str(res))
+
+    def test_shapes_differ(self):
+        res = compare_arrays([1, 2, 3], [1, 2])
+        self.assertFalse(res)
+        self.assertFalse(res.shape_matches)
+        self.assertEqual((res.total, res.matched), (3, 2))
+
+    def test_nan(self):
+        self.assertTrue(compare_arrays([float("nan")], [float("nan")]))
+        self.assertFalse(compare_arrays([float("nan")], [float("nan")], equal_nan=False))
+        res = compare_arrays([1.0], [float("inf")])
+        self.assertEqual(res.max_abs_error, float("inf"))
+        self.assertEqual(res.export()["max_abs_error"], "inf")
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestCheckNumeric(AutograderTestCase):
+    def test_partial_credit(self):
+        test = AutograderTest(name="numeric", max_score=4)
+        res = test.check_numeric("1 2 3 4", "1 2 3 5", name="out")
+        self.assertEqual(test.score, 3)
+        self.assertEqual(res.mismatches, 1)
+        self.assertEqual(test.extra_data["numeric"]["out"]["mismatches"], 1)
+        self.assertIn("1 of 4 values do not match", str(test.output))
+
+    def test_all_or_nothing(self):
+        test = AutograderTest(name="numeric", max_score=4)
+        test.check_numeric(np.arange(4), "0 1 2 4", partial_credit=False)
+        self.assertEqual(test.score, 0)
+
+    def test_shape(self):
+        test = AutograderTest(name="numeric", max_score=1)
+        res = test.check_numeric("1 2 3 4", b"1 2 3 4", shape=(2, 2))
+        self.assertTrue(res)
+        self.assertEqual(res.shape_actual, (2, 2))
+        self.assertEqual(test.score, 1)
+
+if __name__ == "__main__":
+    unittest.main()
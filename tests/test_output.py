@@ -0,0 +1,54 @@
+import unittest
+
+from GradescopeBase.AutograderOutput import OutputBudget, OutputBuffer
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_under_cap_is_unchanged(self):
+        for text in ["", "abc", "abcdefgh", "abcdefghij", "héllo wörld"]:
+            buf = OutputBuffer(max_bytes=20)
+            buf.write(text)
+            self.assertEqual(str(buf), text)
+        buf = OutputBuffer(max_bytes=10)
+        for c in "abcdefgh":
+            buf.write(c)
+        self.assertEqual(str(buf), "abcdefgh")
+
+    def test_truncated_count(self):
+        buf = OutputBuffer(max_bytes=10)
+        buf.write("abcdefghijklmnopqrstuvwxyz")
+        self.assertEqual(buf.truncated, 16)
+        self.assertEqual(str(buf), "abcde\n[... 16 bytes truncated ...]\nvwxyz")
+
+    def test_truncated_across_writes(self):
+        buf = OutputBuffer(max_bytes=10)
+        buf.write("abc")
+        buf.write("defghijklm")
+        self.assertEqual(str(buf), "abcde\n[... 3 bytes truncated ...]\nijklm")
+
+    def test_no_limit(self):
+        buf = OutputBuffer()
+        buf.write("x" * 1000)
+        buf += "y"
+        self.assertEqual(str(buf), "x" * 1000 + "y")
+
+    def test_len_counts_characters(self):
+        buf = OutputBuffer()
+        buf.write("héllo")
+        self.assertEqual(len(buf), 5)
+        self.assertEqual(buf.nbytes(), 6)
+        self.assertFalse(OutputBuffer())
+
+    def test_budget(self):
+        budget = OutputBudget(10)
+        a = OutputBuffer(budget=budget)
+        b = OutputBuffer(budget=budget)
+        a.write("abcdefgh")
+        b.write("abcdefgh")
+        self.assertEqual(str(a), "abcdefgh")
+        self.assertLessEqual(budget.used, 10)
+        self.assertIn("truncated", str(b))
+        a.replace("")
+        self.assertEqual(budget.used, b.nbytes())
+
+if __name__ == "__main__":
+    unittest.main()
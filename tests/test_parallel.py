@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+from GradescopeBase import Autograder, AutograderTest
+
+from .helpers import AutograderTestCase
+
+class TestParallelTests(AutograderTestCase):
+    def test_tests_run_together(self):
+        def fn(ag, test):
+            time.sleep(0.3)
+            test.print(test.name)
+            return True
+        for i in range(4):
+            AutograderTest(fn, name=f"t{i}", max_score=1)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False, parallel=4))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([t["name"] for t in results["tests"]], ["t0", "t1", "t2", "t3"])
+        self.assertEqual([t["output"].strip() for t in results["tests"]], ["t0", "t1", "t2", "t3"])
+        self.assertEqual(sum(t["score"] for t in results["tests"]), 4)
+
+    def test_serial_tests_see_the_tests_before_them(self):
+        finished = []
+        def fn(ag, test):
+            time.sleep(0.05)
+            finished.append(test.name)
+            return True
+        def serial(ag, test):
+            test.print(sorted(finished))
+            return threading.current_thread() is threading.main_thread()
+        AutograderTest(fn, name="a", max_score=1)
+        AutograderTest(fn, name="b", max_score=1)
+        AutograderTest(serial, name="serial", max_score=1, serial=True)
+        AutograderTest(fn, name="c", max_score=1)
+        results = self.run_autograder(Autograder(print_welcome_message=False, parallel=2))["by_name"]
+        self.assertEqual(results["serial"]["output"].strip(), "['a', 'b']")
+        self.assertEqual(results["serial"]["score"], 1)
+        self.assertEqual(sorted(finished), ["a", "b", "c"])
+
+    def test_tests_with_a_timeout_run_on_the_main_thread(self):
+        def fn(ag, test):
+            time.sleep(5)
+        AutograderTest(fn, name="slow", max_score=1, timeout=0.2)
+        AutograderTest(lambda ag, t: True, name="fast", max_score=1)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False, parallel=2))["by_name"]
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(results["slow"]["score"], 0)
+        self.assertIn("timed out", results["slow"]["output"])
+        self.assertEqual(results["fast"]["score"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import random
+import time
+import unittest
+
+from GradescopeBase.AutograderRateLimit import DailyQuotaRateLimit, LeakyBucketRateLimit, RateLimit, TokenBucketRateLimit
+
+# A day in January so no daylight saving change is in range.
+BASE = int(time.mktime((2020, 1, 10, 12, 0, 0, 0, 0, -1)))
+
+def timestamp(t: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)) + ".123456-08:00"
+
+def submission(t: float, sub_counts=1, id="1234", extra_data=True) -> dict:
+    if not extra_data:
+        ed = None
+    elif sub_counts is None:
+        ed = {"id": id}
+    else:
+        ed = {"id": id, "sub_counts": sub_counts}
+    return {"submission_time": timestamp(t), "results": {"extra_data": ed}}
+
+class FakeAutograder:
+    use_ratelimit_when_local = True
+
+    def __init__(self, now: float, previous: list):
+        self.metadata = {"created_at": timestamp(now), "previous_submissions": previous}
+        self.extra_data = {}
+        self.score = None
+
+    def print(self, *args, **kwargs):
+        pass
+
+    def set_score(self, score):
+        self.score = score
+
+    def generate_results(self, test_results=None, leaderboard=None):
+        pass
+
+def decide(rl: RateLimit, ag: FakeAutograder) -> int:
+    try:
+        rl.rate_limit_main(ag)
+    except SystemExit:
+        pass
+    return ag.extra_data["sub_counts"]
+
+def reference_tokens_used(rl: RateLimit, ag: FakeAutograder):
+    """
+    The loop rate_limit_main used before the submission times were sorted and searched.
+    """
+    def get_time(s):
+        return time.mktime(time.strptime(s[:-13], "%Y-%m-%dT%H:%M:%S"))
+    current_time = get_time(ag.metadata["created_at"])
+    restart_time = time.mktime(time.strptime(rl.reset_time, "%Y-%m-%dT%H:%M:%S")) if rl.reset_time is not None else None
+    tokens_used = 0
+    oldest = None
+    for v in ag.metadata["previous_submissions"]:
+        subm_time = get_time(v["submission_time"])
+        if restart_time is not None and subm_time - restart_time < 0:
+            continue
+        if current_time - subm_time < rl.total_seconds():
+            try:
+                ed = v["results"]["extra_data"]
+                if ed is not None:
+                    subID = ed.get("id")
+                    if (ed["sub_counts"] == 1) and (subID and (subID not in rl.submission_id_exclude)):
+                        if oldest is None:
+                            oldest = subm_time
+                        tokens_used += 1
+            except Exception:
+                tokens_used += 1
+    return tokens_used, oldest
+
+class TestRateLimit(unittest.TestCase):
+    def test_same_decisions_as_linear_scan(self):
+        rng = random.Random(5)
+        for _ in range(300):
+            times = sorted(BASE + rng.randrange(0, 4 * 3600) for _ in range(rng.randrange(0, 12)))
+            previous = []
+            for t in times:
+                kind = rng.random()
+                if kind < 0.6:
+                    previous.append(submission(t))
+                elif kind < 0.75:
+                    previous.append(submission(t, sub_counts=0))
+                elif kind < 0.85:
+                    previous.append(submission(t, id=rng.choice(["excluded", None])))
+                elif kind < 0.92:
+                    previous.append(submission(t, extra_data=False))
+                else:
+                    # Submissions which can not be checked use up a token.
+                    previous.append(submission(t, sub_counts=None))
+            now = BASE + rng.randrange(0, 5 * 3600)
+            rl = RateLimit(
+                tokens=rng.randrange(1, 6),
+                minutes=rng.choice([0, 30, 59]),
+                hours=rng.choice([0, 1, 2]),
+                seconds=rng.choice([0, 1, 45]),
+                reset_time=rng.choice([None, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(BASE + rng.randrange(0, 3 * 3600)))]),
+                submission_id_exclude=["excluded"],
+            )
+            ag = FakeAutograder(now, previous)
+            expected_used, expected_oldest = reference_tokens_used(rl, ag)
+            self.assertEqual(decide(rl, ag), 1 if expected_used < rl.tokens else 0)
+            restart_time = time.mktime(time.strptime(rl.reset_time, "%Y-%m-%dT%H:%M:%S")) if rl.reset_time is not None else None
+            used, oldest = rl.get_tokens_used(ag, float(now), restart_time)
+            self.assertEqual((used, oldest), (expected_used, expected_oldest))
+
+    def test_window_edges(self):
+        rl = RateLimit(tokens=1, hours=1)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 3599, [submission(BASE)])), 0)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 3600, [submission(BASE)])), 1)
+
+class TestTokenBucketRateLimit(unittest.TestCase):
+    def test_tokens_come_back_one_per_period(self):
+        previous = [submission(BASE), submission(BASE + 1)]
+        rl = TokenBucketRateLimit(tokens=2, hours=1)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 2, previous)), 0)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 1801, previous)), 0)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 3602, previous)), 1)
+
+    def test_bucket_does_not_overfill(self):
+        # After a long break the bucket only holds `tokens` tokens.
+        previous = [submission(BASE), submission(BASE + 10 * 3600), submission(BASE + 10 * 3600 + 1)]
+        rl = TokenBucketRateLimit(tokens=2, hours=1)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 10 * 3600 + 2, previous)), 0)
+
+class TestLeakyBucketRateLimit(unittest.TestCase):
+    def test_bucket_leaks_steadily(self):
+        previous = [submission(BASE), submission(BASE + 1)]
+        rl = LeakyBucketRateLimit(tokens=2, hours=1)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 2, previous)), 0)
+        # Half of the period leaks one submission, unlike a sliding window.
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 1801, previous)), 1)
+        self.assertEqual(decide(RateLimit(tokens=2, hours=1), FakeAutograder(BASE + 1801, previous)), 0)
+
+    def test_uncounted_submissions_stay_out(self):
+        previous = [submission(BASE, sub_counts=0), submission(BASE + 1, sub_counts=0)]
+        rl = LeakyBucketRateLimit(tokens=1, hours=1)
+        self.assertEqual(decide(rl, FakeAutograder(BASE + 2, previous)), 1)
+
+class TestDailyQuotaRateLimit(unittest.TestCase):
+    def test_quota_resets_at_midnight(self):
+        late = time.mktime((2020, 1, 10, 23, 0, 0, 0, 0, -1))
+        rl = DailyQuotaRateLimit(tokens=1)
+        self.assertEqual(decide(rl, FakeAutograder(late + 1800, [submission(late)])), 0)
+        self.assertEqual(decide(rl, FakeAutograder(late + 5400, [submission(late)])), 1)
+
+    def test_next_token_is_midnight(self):
+        late = time.mktime((2020, 1, 10, 23, 0, 0, 0, 0, -1))
+        rl = DailyQuotaRateLimit(tokens=2)
+        ag = FakeAutograder(late + 60, [submission(late)])
+        self.assertEqual(decide(rl, ag), 1)
+        regen = rl.get_next_token_regen(ag)
+        self.assertEqual((regen.day, regen.hour, regen.minute), (11, 0, 0))
+
+if __name__ == "__main__":
+    unittest.main()
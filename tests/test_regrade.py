@@ -0,0 +1,76 @@
+import json
+import os
+import unittest
+
+from GradescopeBase.AutograderRegrade import Regrade
+
+from .helpers import AutograderTestCase
+
+GRADER = '''
+import os
+from GradescopeBase import Autograder, AutograderTest
+
+def make_autograder():
+    def answer(ag, test):
+        with open("submission/answer.txt") as f:
+            answer = f.read().strip()
+        if answer == "crash":
+            # The submission is left without results.
+            os._exit(3)
+        return answer == "42"
+    AutograderTest(answer, name="answer", max_score=1)
+    return Autograder(print_welcome_message=False)
+'''
+
+class TestRegrade(AutograderTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs("source")
+        with open("source/regrade_grader.py", "w") as f:
+            f.write(GRADER)
+
+    def add_submission(self, name: str, answer: str):
+        os.makedirs(f"submissions/{name}/submission")
+        with open(f"submissions/{name}/submission/answer.txt", "w") as f:
+            f.write(answer)
+
+    def regrade(self, **kwargs) -> dict:
+        return Regrade("source", "submissions", "out", factory="regrade_grader:make_autograder", workers=2, verbose=False, **kwargs).run()
+
+    def graded(self) -> list:
+        with open("out/state.jsonl") as f:
+            return [json.loads(line)["name"] for line in f]
+
+    def test_results_and_summary(self):
+        self.add_submission("s1", "42")
+        self.add_submission("s2", "41")
+        self.add_submission("s3", "crash")
+        summary = self.regrade()
+        self.assertEqual(summary["counts"], {"ok": 2, "no_results": 1})
+        self.assertEqual(summary["mean_score"], 0.5)
+        with open("out/results/s1.json") as f:
+            self.assertEqual(json.load(f)["tests"][0]["score"], 1)
+        self.assertFalse(os.path.exists("out/results/s3.json"))
+        with open("out/summary.json") as f:
+            self.assertEqual(json.load(f)["finished"], 3)
+
+    def test_resume(self):
+        self.add_submission("s1", "42")
+        self.add_submission("s2", "crash")
+        self.regrade()
+        self.assertEqual(sorted(self.graded()), ["s1", "s2"])
+        # A regrade which was killed while writing a record leaves half a line behind.
+        with open("out/state.jsonl", "a") as f:
+            f.write('{"name": "s1", "sta')
+        self.add_submission("s3", "42")
+        summary = self.regrade()
+        # s1 is done, s2 has no results so it is graded again and s3 is new.
+        with open("out/state.jsonl") as f:
+            lines = f.read().splitlines()
+        names = [json.loads(line)["name"] for line in lines[2:]]
+        self.assertEqual(sorted(names), ["s2", "s3"])
+        self.assertEqual(summary["finished"], 3)
+        self.assertEqual(summary["counts"], {"ok": 2, "no_results": 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# The viewer is a script folder, not a package.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "local_display"))
+
+from results_index import ResultsIndex
+
+class CountingIndex(ResultsIndex):
+    def summarize_file(self, name, stat):
+        self.parsed.append(name)
+        return super().summarize_file(name, stat)
+
+    def load(self):
+        self.parsed = []
+        return super().load()
+
+class TestResultsIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write_results(self, name: str, scores: dict, execution_time: float=1.0):
+        tests = [{"name": test, "score": score, "max_score": 1} for test, score in scores.items()]
+        with open(os.path.join(self.dir, f"{name}.json"), "w") as f:
+            json.dump({"execution_time": execution_time, "tests": tests}, f)
+
+    def new_index(self) -> CountingIndex:
+        return CountingIndex(self.dir, scan_interval=0)
+
+    def test_query(self):
+        self.write_results("alice", {"t1": 1, "t2": 0}, execution_time=3)
+        self.write_results("bob", {"t1": 1, "t2": 1}, execution_time=1)
+        self.write_results("carol", {"t1": 0, "t2": 0}, execution_time=2)
+        with open(os.path.join(self.dir, "broken.json"), "w") as f:
+            f.write("{")
+        index = self.new_index()
+        names = lambda entries: [e["name"] for e in entries]
+        self.assertEqual(names(index.query(sort="score", descending=True)), ["bob", "alice", "carol", "broken"])
+        self.assertEqual(names(index.query(sort="execution_time")), ["bob", "carol", "alice", "broken"])
+        self.assertEqual(names(index.query(min_score=1)), ["alice", "bob"])
+        self.assertEqual(names(index.query(failing="t1")), ["carol"])
+        self.assertEqual(index.failing_tests(), [("t2", 2), ("t1", 1)])
+        self.assertIn("error", index.entries["broken"])
+
+    def test_only_changed_files_are_parsed(self):
+        self.write_results("alice", {"t1": 0})
+        self.write_results("bob", {"t1": 1})
+        index = self.new_index()
+        index.scan()
+        self.assertEqual(sorted(index.parsed), ["alice", "bob"])
+        self.write_results("alice", {"t1": 1, "t2": 1})
+        os.remove(os.path.join(self.dir, "bob.json"))
+        index.parsed = []
+        entries = index.scan()
+        self.assertEqual(index.parsed, ["alice"])
+        self.assertEqual(list(entries), ["alice"])
+        # A new index starts from the saved one.
+        index = self.new_index()
+        self.assertEqual(index.entries["alice"]["score"], 2)
+        index.scan()
+        self.assertEqual(index.parsed, [])
+
+    def test_cut_off_index_line(self):
+        self.write_results("alice", {"t1": 1})
+        self.new_index().scan()
+        with open(os.path.join(self.dir, ".results_index.jsonl"), "a") as f:
+            f.write('{"name": "bob", "mt')
+        self.write_results("bob", {"t1": 0})
+        index = self.new_index()
+        index.scan()
+        self.assertEqual(index.parsed, ["bob"])
+        index = self.new_index()
+        self.assertEqual(sorted(index.entries), ["alice", "bob"])
+        index.scan()
+        self.assertEqual(index.parsed, [])
+
+    def test_index_is_compacted(self):
+        self.write_results("alice", {"t1": 0})
+        index = self.new_index()
+        for i in range(5):
+            self.write_results("alice", {"t1": 0}, execution_time=i + 2)
+            index.scan()
+        with open(index.index_file) as f:
+            self.assertLessEqual(len(f.readlines()), 2)
+        self.assertEqual(self.new_index().entries["alice"]["execution_time"], 6)
+
+if __name__ == "__main__":
+    unittest.main()
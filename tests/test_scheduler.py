@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+import unittest
+
+from GradescopeBase import Autograder, AutograderTeardown, AutograderTest
+
+from .helpers import AutograderTestCase
+
+class TestOrderByHistory(AutograderTestCase):
+    def make_tests(self, ran: list, **kwargs):
+        def make_fn(name):
+            def fn(ag, test):
+                ran.append(name)
+                return True
+            return fn
+        for name in ("passed", "serial", "new", "failed"):
+            AutograderTest(make_fn(name), name=name, max_score=1, serial=name == "serial", **kwargs)
+        self.write_metadata({"score": 1, "tests": [
+            {"name": "passed", "score": 1, "max_score": 1},
+            {"name": "serial", "score": 1, "max_score": 1},
+            {"name": "failed", "score": 0, "max_score": 1},
+        ]})
+
+    def test_failed_tests_run_first(self):
+        ran = []
+        self.make_tests(ran)
+        results = self.run_autograder(Autograder(print_welcome_message=False, test_order="history"))
+        # Serial tests stay where they were declared.
+        self.assertEqual(ran, ["passed", "serial", "failed", "new"])
+        # The results keep the declared order.
+        self.assertEqual([t["name"] for t in results["tests"]], ["passed", "serial", "new", "failed"])
+
+    def test_tests_with_a_timeout_are_reordered(self):
+        ran = []
+        self.make_tests(ran, timeout=10)
+        self.run_autograder(Autograder(print_welcome_message=False, test_order="history"))
+        self.assertEqual(ran, ["passed", "serial", "failed", "new"])
+
+    def test_without_history(self):
+        ran = []
+        self.make_tests(ran, timeout=10)
+        os.remove("submission_metadata.json")
+        self.run_autograder(Autograder(print_welcome_message=False, test_order="history"))
+        self.assertEqual(ran, ["passed", "serial", "new", "failed"])
+
+class TestTimeBudget(AutograderTestCase):
+    def test_budgeted_tests_stay_on_the_main_thread(self):
+        threads = {}
+        def make_fn(name, seconds=0):
+            def fn(ag, test=None):
+                threads[name] = threading.current_thread() is threading.main_thread()
+                time.sleep(seconds)
+                return True
+            return fn
+        AutograderTest(make_fn("slow", 30), name="slow", max_score=1)
+        AutograderTest(make_fn("fast"), name="fast", max_score=1)
+        AutograderTeardown(make_fn("teardown"), name="teardown")
+        start = time.monotonic()
+        ag = Autograder(print_welcome_message=False, parallel=4, time_budget=4, time_reserve=1)
+        results = self.run_autograder(ag)["by_name"]
+        self.assertLess(time.monotonic() - start, 6)
+        self.assertEqual(threads, {"slow": True, "fast": True, "teardown": True})
+        self.assertEqual(results["slow"]["score"], 0)
+        self.assertIn("timed out", results["slow"]["output"])
+        self.assertEqual(results["fast"]["score"], 1)
+
+    def test_isolated_tests_still_run_in_parallel(self):
+        ag = Autograder(print_welcome_message=False, parallel=2, time_budget=60, time_reserve=1)
+        for name in ("a", "b"):
+            ag.add_test(AutograderTest(lambda ag, t: True, name=name, max_score=1, isolate=True))
+        ag.add_test(AutograderTest(lambda ag, t: True, name="c", max_score=1))
+        self.assertEqual([[t.name for t in batch] for batch in ag.get_test_batches()], [["a", "b"], ["c"]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import unittest
+
+from GradescopeBase import Autograder, SubmissionManifest
+from GradescopeBase.autograder_utils.files import SUBMISSION_BASE, check_submitted_files
+
+from .helpers import AutograderTestCase
+
+class TestSubmissionManifest(AutograderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_submission("main.py", "print(1)\n")
+        self.write_submission("src/a.c", "int a;\n")
+        self.write_submission("src/lib/b.c", "int b;\n")
+
+    def test_files(self):
+        manifest = SubmissionManifest()
+        self.assertEqual([f.path for f in manifest], ["main.py", "src/a.c", "src/lib/b.c"])
+        self.assertEqual(manifest.get("./src/a.c").size, 7)
+        self.assertEqual(manifest.total_size, 9 + 7 + 7)
+        self.assertEqual([f.path for f in manifest.glob("**/*.c")], ["src/a.c", "src/lib/b.c"])
+        self.assertEqual([f.path for f in manifest.glob("src/*.c")], ["src/a.c"])
+        self.assertEqual(manifest.missing(["main.py", "src", "other.py"]), ["src", "other.py"])
+
+    def test_limits(self):
+        manifest = SubmissionManifest(max_files=2, max_file_size=8)
+        problems = manifest.check_limits()
+        self.assertEqual(len(problems), 2)
+        self.assertIn("main.py", problems[1])
+
+    def test_symlinked_directories_are_followed(self):
+        os.makedirs("shared/include")
+        with open("shared/include/h.h", "w") as f:
+            f.write("#pragma once\n")
+        os.symlink(os.path.abspath("shared"), "submission/shared")
+        # A link back to a directory it is in is not followed again.
+        os.symlink(os.path.abspath("submission/src"), "submission/src/lib/up")
+        manifest = SubmissionManifest()
+        self.assertIn("shared/include/h.h", manifest)
+        self.assertIn("src/lib/up", manifest.missing(["src/lib/up"]))
+        self.assertEqual(len(manifest), 4)
+
+    def test_check_submitted_files(self):
+        os.symlink(os.path.abspath("submission/src"), "submission/linked")
+        self.assertEqual(check_submitted_files(["main.py", "linked/lib/b.c", "nope.py"]), ["nope.py"])
+        self.assertEqual(check_submitted_files(["a.c", "b.c"], base="submission/src"), ["b.c"])
+        ag = Autograder(print_welcome_message=False)
+        self.assertEqual(len(ag.submission), 5)
+        os.remove("submission/main.py")
+        # The manifest of the autograder was built before the file was removed.
+        self.assertEqual(check_submitted_files(["main.py"], manifest=ag.submission), [])
+        self.assertEqual(check_submitted_files(["main.py"]), ["main.py"])
+        self.assertEqual(SUBMISSION_BASE, "/autograder/submission")
+
+if __name__ == "__main__":
+    unittest.main()
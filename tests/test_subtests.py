@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from GradescopeBase import Autograder, AutograderSubTest, AutograderTest, SubTestRunner
+
+from .helpers import AutograderTestCase
+
+class Runner(SubTestRunner):
+    """
+    Prints to the test from run_test, which runs on the worker threads.
+    """
+    def run_test(self, ag, test, t, data):
+        test.print(f"run_test {t.name}")
+        return super().run_test(ag, test, t, data)
+
+def sleeper(seconds: float, result=True, ran: list=None):
+    def fn(ag, test):
+        time.sleep(seconds)
+        if ran is not None:
+            ran.append(test.name)
+        test.print(f"slept {seconds}")
+        return result
+    return fn
+
+class TestParallelSubTests(AutograderTestCase):
+    def test_subtests_run_together_in_order(self):
+        parent = AutograderTest(Runner(is_pass_fail=False, parallel=4), name="parent", max_score=4)
+        # The first subtest finishes last.
+        for i, seconds in enumerate((0.4, 0.1, 0.2, 0.1)):
+            AutograderSubTest(parent, sleeper(seconds), name=f"s{i}", max_score=1)
+        start = time.monotonic()
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(results["parent"]["score"], 4)
+        output = results["parent"]["output"]
+        positions = []
+        for i in range(4):
+            positions += [output.index(f"[SubTest]: s{i}"), output.index(f"run_test s{i}")]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_pre_subtest_output_is_capped(self):
+        class Chatty(SubTestRunner):
+            def pre_subtest_run(self, ag, test, t, data):
+                test.print("x" * 1000)
+        runner = Chatty(parallel=2)
+        parent = AutograderTest(runner, name="parent", max_score=1, max_output_bytes=200)
+        t = AutograderSubTest(parent, lambda ag, t: True, name="s0", max_score=1)
+        section, _ = runner.run_pre_subtest(Autograder(print_welcome_message=False), parent, t, {})
+        self.assertLessEqual(section.nbytes(), 200)
+
+    def test_short_circuit_does_not_start_the_rest(self):
+        ran = []
+        parent = AutograderTest(SubTestRunner(parallel=2, short_circuit=True), name="parent", max_score=1)
+        AutograderSubTest(parent, sleeper(0.05, result=False, ran=ran), name="fails", max_score=1)
+        AutograderSubTest(parent, sleeper(0.3, ran=ran), name="running", max_score=1)
+        for i in range(3):
+            AutograderSubTest(parent, sleeper(0.3, ran=ran), name=f"later{i}", max_score=1)
+        results = self.run_autograder(Autograder(print_welcome_message=False))["by_name"]
+        self.assertEqual(results["parent"]["score"], 0)
+        self.assertEqual(results["parent"]["output"].count("NOT RUN"), 4)
+        # The subtest which already started finished on its own, but nothing else started.
+        self.assertEqual(sorted(ran), ["fails", "running"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+
+from GradescopeBase.Timeout import Timeout
+
+def in_thread(fn):
+    result = {}
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return result
+
+class TestTimeout(unittest.TestCase):
+    def test_main_thread_is_interrupted(self):
+        start = time.monotonic()
+        with self.assertRaises(Timeout.Timeout):
+            with Timeout(0.2):
+                time.sleep(5)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_thread_finishes_then_times_out(self):
+        timeout = Timeout(0.1)
+        def fn():
+            with timeout:
+                time.sleep(0.3)
+            return "finished"
+        result = in_thread(fn)
+        self.assertIsInstance(result.get("error"), Timeout.Timeout)
+        self.assertTrue(timeout.expired)
+        self.assertGreaterEqual(timeout.elapsed, 0.3)
+
+    def test_thread_within_the_timeout(self):
+        def fn():
+            with Timeout(5):
+                time.sleep(0.05)
+            return "finished"
+        self.assertEqual(in_thread(fn), {"value": "finished"})
+
+    def test_check_stops_a_thread(self):
+        def fn():
+            with Timeout(0.1):
+                while True:
+                    Timeout.check()
+                    time.sleep(0.01)
+        start = time.monotonic()
+        result = in_thread(fn)
+        self.assertIsInstance(result.get("error"), Timeout.Timeout)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_processes_are_killed_off_the_main_thread(self):
+        def fn():
+            with Timeout(0.2):
+                proc = Timeout.popen(["sleep", "30"])
+                return proc.wait()
+        start = time.monotonic()
+        result = in_thread(fn)
+        self.assertIsInstance(result.get("error"), Timeout.Timeout)
+        self.assertLess(time.monotonic() - start, 5)
+
+if __name__ == "__main__":
+    unittest.main()
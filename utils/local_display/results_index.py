@@ -0,0 +1,185 @@
+"""
+This keeps a small index of a directory of results files (eg. the results/ folder of a regrade).
+"""
+import json
+import os
+import threading
+import time
+
+class ResultsIndex:
+    """
+    Summarizes every results file in results_dir (score, max score, execution time and which
+    tests failed) so they can be sorted and filtered without parsing all of them again.
+
+    The summaries are saved as JSON lines in index_file. Only files whose mtime or size changed
+    since they were summarized are parsed again and their new summaries are appended to the
+    index, which is rewritten once it holds more old lines than current ones.
+    """
+    def __init__(self, results_dir: str, index_file: str=None, scan_interval: float=2):
+        self.results_dir = os.path.abspath(results_dir)
+        self.index_file = index_file if index_file is not None else os.path.join(self.results_dir, ".results_index.jsonl")
+        self.scan_interval = scan_interval
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.lines = 0
+        self.last_scan = None
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.index_file):
+            return self
+        with open(self.index_file, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                # The last line was cut off since the viewer was stopped while writing it. It is
+                # dropped so the next change does not get appended to it.
+                data = data[:data.rfind(b"\n") + 1]
+                f.truncate(len(data))
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            self.lines += 1
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("deleted"):
+                self.entries.pop(entry["name"], None)
+            else:
+                self.entries[entry["name"]] = entry
+        return self
+
+    def list_files(self) -> dict:
+        files = {}
+        index_file = os.path.abspath(self.index_file)
+        for dirpath, dirnames, filenames in os.walk(self.results_dir):
+            dirnames.sort()
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not filename.endswith(".json") or path == index_file:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                name = os.path.relpath(path, self.results_dir)[:-len(".json")]
+                files[name] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    @staticmethod
+    def summarize(results: dict) -> dict:
+        tests = results.get("tests") or []
+        failed = []
+        set_score = False
+        score = 0
+        max_score = 0
+        for test in tests:
+            if test.get("max_score") is not None:
+                max_score += float(test["max_score"])
+            if test.get("score") is None:
+                continue
+            set_score = True
+            score += float(test["score"])
+            if test.get("max_score") is not None and float(test["score"]) < float(test["max_score"]):
+                failed.append(test.get("name"))
+        if not set_score:
+            score = float(results["score"]) if results.get("score") is not None else None
+        return {
+            "score": score,
+            "max_score": max_score,
+            "execution_time": results.get("execution_time"),
+            "tests": len(tests),
+            "failed": failed,
+        }
+
+    def summarize_file(self, name: str, stat: tuple) -> dict:
+        entry = {"name": name, "mtime_ns": stat[0], "size": stat[1]}
+        try:
+            with open(self.path(name), "r") as f:
+                entry.update(self.summarize(json.load(f)))
+        except (OSError, ValueError) as e:
+            entry.update({"score": None, "max_score": None, "execution_time": None, "tests": 0, "failed": [], "error": str(e)})
+        return entry
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.results_dir, f"{name}.json")
+
+    def scan(self, force: bool=False) -> dict:
+        """
+        Updates the index with the files which changed since the last scan and returns the entries.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.last_scan is not None and now - self.last_scan < self.scan_interval:
+                return self.entries
+            self.last_scan = now
+            files = self.list_files()
+            changes = []
+            for name, stat in files.items():
+                entry = self.entries.get(name)
+                if entry is None or (entry["mtime_ns"], entry["size"]) != stat:
+                    changes.append(self.summarize_file(name, stat))
+            for name in self.entries.keys() - files.keys():
+                changes.append({"name": name, "deleted": True})
+            for entry in changes:
+                if entry.get("deleted"):
+                    self.entries.pop(entry["name"], None)
+                else:
+                    self.entries[entry["name"]] = entry
+            if changes:
+                self.save(changes)
+            return self.entries
+
+    def save(self, changes: list):
+        if self.lines + len(changes) > 2 * max(len(self.entries), 1):
+            tmp = f"{self.index_file}.tmp"
+            with open(tmp, "w") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp, self.index_file)
+            self.lines = len(self.entries)
+            return self
+        with open(self.index_file, "a") as f:
+            for entry in changes:
+                f.write(json.dumps(entry) + "\n")
+        self.lines += len(changes)
+        return self
+
+    def query(self, sort: str="name", descending: bool=False, min_score: float=None, max_score: float=None,
+              failing: str=None, min_time: float=None, max_time: float=None) -> list:
+        """
+        Returns the entries which match every filter which is set, sorted by sort (name, score,
+        execution_time or failed). Entries without a value for sort always come last.
+        """
+        entries = []
+        for entry in self.scan().values():
+            score = entry.get("score")
+            execution_time = entry.get("execution_time")
+            if min_score is not None and (score is None or score < min_score):
+                continue
+            if max_score is not None and (score is None or score > max_score):
+                continue
+            if min_time is not None and (execution_time is None or execution_time < min_time):
+                continue
+            if max_time is not None and (execution_time is None or execution_time > max_time):
+                continue
+            if failing is not None and failing not in entry.get("failed", []):
+                continue
+            entries.append(entry)
+        if sort == "failed":
+            key = lambda e: len(e.get("failed", []))
+        elif sort in ("score", "execution_time"):
+            key = lambda e: e.get(sort)
+        else:
+            key = lambda e: e["name"]
+        present = [e for e in entries if key(e) is not None]
+        missing = [e for e in entries if key(e) is None]
+        return sorted(present, key=key, reverse=descending) + sorted(missing, key=lambda e: e["name"])
+
+    def failing_tests(self) -> list:
+        """
+        Returns (test name, how many submissions fail it) with the most failed tests first.
+        """
+        counts = {}
+        for entry in self.scan().values():
+            for name in entry.get("failed", []):
+                counts[name] = counts.get(name, 0) + 1
+        return sorted(counts.items(), key=lambda c: (-c[1], str(c[0])))
@@ -1,67 +1,320 @@
 """
 /*
- * @Author: ThaumicMekanism [Stephan K.] 
- * @Date: 2020-01-23 20:56:59 
+ * @Author: ThaumicMekanism [Stephan K.]
+ * @Date: 2020-01-23 20:56:59
  * @Last Modified by: ThaumicMekanism [Stephan K.]
  * @Last Modified time: 2020-01-23 21:00:23
  */
 """
-from flask import Flask, request, send_from_directory, render_template
+from flask import Flask, Response, request, send_from_directory, render_template, stream_with_context, abort
 import argparse
 import json
+import math
+from collections import OrderedDict
+import os
+import sys
+import threading
+import time
+
+# results_index sits next to this script, which may be run from any directory.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results_index import ResultsIndex
 
-results_file = None
 # set the project root directory as the static folder, you can set others.
 app = Flask(__name__, static_url_path='', template_folder='template')
 
+class ResultsView:
+    """
+    Parses and renders the results file only when it changes (by its mtime and size). Each test
+    is rendered once and reused as long as it stays the same, so a run which is still exporting
+    its tests only renders the new ones.
+
+    base is the URL the routes of this view are under and name is the name shown for the student.
+    """
+    def __init__(self, results_file: str, per_page: int=100, max_output: int=20000, base: str="", name: str="TEST"):
+        self.results_file = results_file
+        self.base = base
+        self.name = name
+        self.per_page = per_page
+        self.max_output = max_output
+        self.lock = threading.Lock()
+        self.key = None
+        self.fragments = {}
+        self.state = self.empty_state()
+
+    @staticmethod
+    def empty_state() -> dict:
+        return {"version": 0, "output": None, "score": 0, "tests": [], "outputs": [], "pages": {}, "sidebars": {}}
+
+    def stat_key(self):
+        try:
+            st = os.stat(self.results_file)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self) -> dict:
+        key = self.stat_key()
+        with self.lock:
+            if key == self.key:
+                return self.state
+            if key is None:
+                ag_json = None
+            else:
+                try:
+                    with open(self.results_file, "r") as f:
+                        ag_json = json.load(f)
+                except ValueError:
+                    # The file is being written right now so keep the last version until it is done.
+                    return self.state
+            self.key = key
+            self.state = self.build(ag_json, self.state["version"] + 1)
+            return self.state
+
+    def render_test(self, index: int, test: dict, title: str, status: str) -> tuple:
+        output = test.get("output") or ""
+        fragment_key = (index, test.get("name"), title, status, output)
+        html = self.fragments.get(fragment_key)
+        if html is None:
+            truncated = self.max_output is not None and len(output) > self.max_output
+            html = render_template(
+                "testCase.html",
+                test_index=index,
+                base=self.base,
+                test_title=test.get("name"),
+                test_title_score=title,
+                test_body=output[:self.max_output] if truncated else output,
+                test_case_status=status,
+                output_truncated=truncated,
+                output_length=len(output),
+            )
+        return fragment_key, html
+
+    def build(self, ag_json: dict, version: int) -> dict:
+        state = self.empty_state()
+        state["version"] = version
+        if ag_json is None:
+            self.fragments = {}
+            return state
+        tests = ag_json.get("tests") or []
+        fragments = {}
+        set_score = False
+        s = 0
+        for index, test in enumerate(tests):
+            score = test.get("score")
+            max_score = test.get("max_score")
+            title = test.get("name")
+            passed = None
+            if score is not None:
+                set_score = True
+                s += float(score)
+                if max_score is None:
+                    status = "testCase-passed"
+                    title += f" ({score})"
+                    passed = True
+                elif float(score) >= float(max_score):
+                    status = "testCase-passed"
+                    title += f" ({score}/{max_score})"
+                    passed = True
+                else:
+                    status = "testCase-failed"
+                    title += f" ({score}/{max_score})"
+                    passed = False
+            else:
+                status = ""
+            fragment_key, html = self.render_test(index, test, title, status)
+            fragments[fragment_key] = html
+            state["tests"].append({"index": index, "name": test.get("name"), "title": title, "passed": passed, "html": html})
+            state["outputs"].append(test.get("output") or "")
+        self.fragments = fragments
+        if not set_score and ag_json.get("score") is not None:
+            s = float(ag_json.get("score"))
+        state["score"] = s
+        state["output"] = ag_json.get("output")
+        return state
+
+    def pages(self, state: dict) -> int:
+        return max(1, math.ceil(len(state["tests"]) / self.per_page))
+
+    def page_tests(self, state: dict, page: int) -> list:
+        start = (page - 1) * self.per_page
+        return state["tests"][start:start + self.per_page]
+
+    def sidebar(self, state: dict, page: int) -> str:
+        if page in state["sidebars"]:
+            return state["sidebars"][page]
+        passed_tests = []
+        failed_tests = []
+        for test in state["tests"]:
+            if test["passed"] is None:
+                continue
+            test_page = test["index"] // self.per_page + 1
+            link = f"#{test['name']}" if test_page == page else f"?page={test_page}#{test['name']}"
+            (passed_tests if test["passed"] else failed_tests).append((link, test["title"]))
+        sidebar = ""
+        if failed_tests:
+            sidebar += render_template("testSidebar.html", title="Failed Tests", tests=failed_tests, passfail="failed")
+        if passed_tests:
+            sidebar += render_template("testSidebar.html", title="Passed Tests", tests=passed_tests, passfail="passed")
+        state["sidebars"][page] = sidebar
+        return sidebar
+
+view = None
+dashboard = None
+views = OrderedDict()
+# Requests are served on many threads, which all share the views.
+views_lock = threading.Lock()
+# How many submissions of the dashboard to keep rendered.
+max_views = 32
+view_options = {}
+poll_interval = 0.5
+keepalive_interval = 15
+# How long (in seconds) the results file has to stay the same before it is taken as final.
+idle_timeout = 600
+
+def get_page(view: ResultsView, state: dict) -> int:
+    page = request.args.get("page", default=1, type=int)
+    return min(max(1, page), view.pages(state))
+
+def get_view(name: str) -> ResultsView:
+    if name not in dashboard.scan():
+        abort(404)
+    with views_lock:
+        if name in views:
+            views.move_to_end(name)
+            return views[name]
+        view = ResultsView(dashboard.path(name), base=f"/submissions/{name}", name=name, **view_options)
+        views[name] = view
+        while len(views) > max_views:
+            views.popitem(last=False)
+        return view
+
+def render_submission(view: ResultsView):
+    state = view.load()
+    page = get_page(view, state)
+    if page in state["pages"]:
+        return state["pages"][page]
+    test_cases_body = "".join(test["html"] for test in view.page_tests(state, page))
+    state["pages"][page] = render_template(
+        "submission.html",
+        name=view.name,
+        score=state["score"],
+        out_of="?",
+        test_cases_body=test_cases_body,
+        autograder_output=state["output"],
+        test_cases_sidebar=view.sidebar(state, page),
+        page=page,
+        pages=view.pages(state),
+        version=state["version"],
+        base=view.base,
+    )
+    return state["pages"][page]
+
+def send_output(view: ResultsView, index: int):
+    state = view.load()
+    if index >= len(state["outputs"]):
+        abort(404)
+    return Response(state["outputs"][index], mimetype="text/plain")
+
+def send_events(view: ResultsView):
+    """
+    Pushes the tests of the page which changed (and the new score and sidebar) whenever the
+    results file changes, eg. while a run with export_tests_after_test is still going.
+
+    The stream ends with a done event once the results file has not changed for idle_timeout
+    seconds. A client which went away is noticed when the next message (at least the
+    keepalive) can not be sent, which closes the stream.
+    """
+    page = request.args.get("page", default=1, type=int)
+    version = request.args.get("version", default=0, type=int)
+
+    def stream():
+        state = view.load()
+        # The client has the page as of its version, so send everything if it is already outdated.
+        sent = {} if state["version"] != version else {t["index"]: t["html"] for t in view.page_tests(state, page)}
+        last_version = version
+        last_message = last_change = time.monotonic()
+        while True:
+            state = view.load()
+            if state["version"] != last_version:
+                last_version = state["version"]
+                last_change = time.monotonic()
+                changed = [t for t in view.page_tests(state, page) if sent.get(t["index"]) != t["html"]]
+                for t in changed:
+                    sent[t["index"]] = t["html"]
+                data = {
+                    "version": state["version"],
+                    "score": state["score"],
+                    "sidebar": view.sidebar(state, page),
+                    "tests": [{"index": t["index"], "html": t["html"]} for t in changed],
+                }
+                yield f"event: results\ndata: {json.dumps(data)}\n\n"
+                last_message = time.monotonic()
+            elif time.monotonic() - last_change >= idle_timeout:
+                yield "event: done\ndata: {}\n\n"
+                return
+            elif time.monotonic() - last_message >= keepalive_interval:
+                yield ": keepalive\n\n"
+                last_message = time.monotonic()
+            time.sleep(poll_interval)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def float_arg(name: str):
+    return request.args.get(name, default=None, type=float)
+
+def render_dashboard():
+    sort = request.args.get("sort", default="name")
+    descending = request.args.get("desc", default=0, type=int) == 1
+    failing = request.args.get("failing") or None
+    filters = dict(
+        min_score=float_arg("min_score"),
+        max_score=float_arg("max_score"),
+        failing=failing,
+        min_time=float_arg("min_time"),
+        max_time=float_arg("max_time"),
+    )
+    entries = dashboard.query(sort=sort, descending=descending, **filters)
+    return render_template(
+        "dashboard.html",
+        results_dir=dashboard.results_dir,
+        entries=entries,
+        total=len(dashboard.entries),
+        failing_tests=dashboard.failing_tests(),
+        sort=sort,
+        descending=descending,
+        filters=filters,
+    )
+
 @app.route("/")
 def ag():
-    with open(results_file, "r") as f:
-        ag_json = json.load(f)
-        
-    autograder_output = ag_json.get("output")
-    tests = ag_json["tests"]
-    test_cases_body = ""
-    passed_tests = []
-    failed_tests = []
-    set_score = False
-    s = 0
-    for test in tests:
-        score = test.get("score")
-        max_score = test.get("max_score")
-        title = test.get("name")
-        passed = False
-        if score is not None:
-            set_score = True
-            s += float(score)
-            if max_score is None:
-                status = "testCase-passed"
-                t = title
-                title += f" ({score})"
-                passed_tests.append((t, title))
-                passed = True
-            elif float(score) >= float(max_score):
-                status = "testCase-passed"
-                t = title
-                title += f" ({score}/{max_score})"
-                passed_tests.append((t, title))
-                passed = True
-            else:
-                status = "testCase-failed"
-                t = title
-                title += f" ({score}/{max_score})"
-                failed_tests.append((t, title))
-        else:
-            status = ""
-        test_cases_body += render_template("testCase.html", test_title=test.get("name"), test_title_score=title, test_body=test.get("output"), test_case_status=status)
-    sidebar = ""
-    if failed_tests:
-        sidebar += render_template("testSidebar.html", title="Failed Tests", tests=failed_tests, passfail="failed")
-    if passed_tests:
-        sidebar += render_template("testSidebar.html", title="Passed Tests", tests=passed_tests, passfail="passed")
-    if not set_score:
-        s = float(ag_json.get("score"))
-    return render_template("submission.html", name="TEST", score=s, out_of="?", test_cases_body=test_cases_body, autograder_output=autograder_output, test_cases_sidebar=sidebar)
+    if dashboard is not None:
+        return render_dashboard()
+    return render_submission(view)
+
+@app.route("/tests/<int:index>/output")
+def test_output(index):
+    if view is None:
+        abort(404)
+    return send_output(view, index)
+
+@app.route("/events")
+def events():
+    if view is None:
+        abort(404)
+    return send_events(view)
+
+@app.route("/submissions/<path:name>")
+def submission(name):
+    return render_submission(get_view(name))
+
+@app.route("/submissions/<path:name>/tests/<int:index>/output")
+def submission_test_output(name, index):
+    return send_output(get_view(name), index)
+
+@app.route("/submissions/<path:name>/events")
+def submission_events(name):
+    return send_events(get_view(name))
 
 @app.route('/assets/<path:path>')
 def send_assets(path):
@@ -69,7 +322,19 @@ def send_assets(path):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("results_file")
+    parser.add_argument("results_file", help="A results file or, for the dashboard, a directory of them (eg. the results of a regrade).")
+    parser.add_argument("--per-page", type=int, default=100, help="How many tests to show on each page.")
+    parser.add_argument("--max-output", type=int, default=20000, help="How many characters of an output to show before it has to be loaded on demand.")
+    parser.add_argument("--poll", type=float, default=0.5, help="How often (in seconds) to check if the results file changed for live updates.")
+    parser.add_argument("--idle-timeout", type=float, default=600, help="How long (in seconds) the results file has to stay the same before live updates stop.")
+    parser.add_argument("--index", default=None, help="Where to keep the index of the dashboard (default: .results_index.jsonl in the directory).")
     args = parser.parse_args()
-    results_file = args.results_file
-    app.run()
\ No newline at end of file
+    view_options = dict(per_page=args.per_page, max_output=args.max_output)
+    if os.path.isdir(args.results_file):
+        dashboard = ResultsIndex(args.results_file, index_file=args.index)
+        dashboard.scan(force=True)
+    else:
+        view = ResultsView(args.results_file, **view_options)
+    poll_interval = args.poll
+    idle_timeout = args.idle_timeout
+    app.run(threaded=True)